@@ -6,4 +6,9 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        import api.db_routers  # registers check_pin_cache
         import api.signals
+        from api import slow_queries
+        from api.metrics import instrument_serializers
+        instrument_serializers()
+        slow_queries.install()
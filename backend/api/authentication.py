@@ -0,0 +1,97 @@
+"""
+JWT authentication without a per-request user query.
+
+Access tokens carry the user's id and username plus ``ver``, a short HMAC of
+the password hash and active flag. Changing the password or deactivating the
+account changes that value, which revokes every token issued before.
+
+The current value for each user is kept in the cache (refreshed by a
+post_save signal, loaded from the database on a miss), so a request with a
+warm cache authenticates without touching the database. ``request.user`` is
+a ClaimsUser: id, username and is_active are set, and the remaining fields
+are loaded together the first time a view reads one of them.
+
+Revocation is only immediate across processes when CACHES is shared
+(Redis, Memcached); with the default per-process cache, other workers notice
+within AUTH_USER_CACHE_SECONDS.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router
+from django.utils.crypto import salted_hmac
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import ClaimsUser
+
+VERSION_CLAIM = "ver"
+USERNAME_CLAIM = "username"
+
+
+def token_version(password, is_active):
+    """Changes whenever the password hash or the active flag changes."""
+    value = f"{password}:{int(bool(is_active))}"
+    return salted_hmac("api.authentication.token_version", value).hexdigest()[:16]
+
+
+def _identity_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def remember_identity(user):
+    """Cache what authentication needs to know about a user."""
+    identity = {
+        "username": user.username,
+        "is_active": user.is_active,
+        "version": token_version(user.password, user.is_active),
+    }
+    cache.set(_identity_key(user.pk), identity, settings.AUTH_USER_CACHE_SECONDS)
+    return identity
+
+
+def forget_identity(user_id):
+    cache.delete(_identity_key(user_id))
+
+
+def cached_identity(user_id):
+    """The cached identity for user_id, loading it on a miss (None if no such user)."""
+    identity = cache.get(_identity_key(user_id))
+    if identity is None:
+        user = User.objects.filter(pk=user_id).only("username", "password", "is_active").first()
+        if user is None:
+            return None
+        identity = remember_identity(user)
+    return identity
+
+
+def add_identity_claims(token, user):
+    token[USERNAME_CLAIM] = user.username
+    token[VERSION_CLAIM] = token_version(user.password, user.is_active)
+    return token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that checks token claims against the cache instead of loading the user."""
+
+    def get_user(self, validated_token):
+        version = validated_token.get(VERSION_CLAIM)
+        if version is None:
+            # Issued before tokens carried a version: check against the row
+            return super().get_user(validated_token)
+
+        user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        identity = cached_identity(user_id)
+        if identity is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not identity["is_active"]:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if identity["version"] != version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        return ClaimsUser.from_db(
+            router.db_for_read(User),
+            ["id", "username", "is_active"],
+            [user_id, identity["username"], identity["is_active"]],
+        )
@@ -0,0 +1,29 @@
+"""Small timing helpers shared by the benchmark management commands."""
+import statistics
+import time
+
+
+def measure(func, repeat=5):
+    """Call func() repeat times and return timing stats in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def format_stats(label, stats):
+    """One report line for a measure() result."""
+    return (
+        f"{label:<40} min {stats['min_ms']:>9.3f} ms  "
+        f"median {stats['median_ms']:>9.3f} ms  max {stats['max_ms']:>9.3f} ms"
+    )
+
+
+class Rollback(Exception):
+    """Raised inside transaction.atomic() to throw away benchmark data."""
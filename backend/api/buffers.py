@@ -0,0 +1,144 @@
+"""
+In-process write buffers.
+
+A ``BatchBuffer`` collects small write intents during requests and hands
+them to a flush function in batches. A buffer is due once it holds
+``max_size`` items or its oldest item is ``max_age`` seconds old.
+``flush_due_buffers`` writes the due buffers; it runs:
+
+- on Django's ``request_finished`` signal, after the response has been sent,
+  so buffered writes never add to a request's latency;
+- every ``BUFFER_FLUSH_INTERVAL`` seconds on a daemon thread, started by the
+  WSGI/ASGI entry points (``start_flusher``), so an idle server still writes
+  what its last requests queued. An item is therefore written at most about
+  ``max_age + BUFFER_FLUSH_INTERVAL`` seconds after it was added;
+- for every buffer, when the process exits.
+
+Processes without the thread (management commands, the shell, tests) only
+flush after requests and at exit.
+
+Items still buffered when a process is killed are lost, so only use this for
+writes that are fine to drop occasionally.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_buffers = []
+
+# (thread, stop event, interval) of the running flusher
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+class BatchBuffer:
+    def __init__(self, name, flush_func, max_size=100, max_age=10.0):
+        self.name = name
+        self.flush_func = flush_func
+        self.max_size = max_size
+        self.max_age = max_age
+        self._items = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        _buffers.append(self)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        with self._lock:
+            if not self._items:
+                self._oldest = time.monotonic()
+            self._items.append(item)
+
+    def is_due(self):
+        with self._lock:
+            if not self._items:
+                return False
+            return (
+                len(self._items) >= self.max_size
+                or time.monotonic() - self._oldest >= self.max_age
+            )
+
+    def clear(self):
+        """Drop buffered items without writing them."""
+        with self._lock:
+            self._items, self._oldest = [], None
+
+    def flush(self):
+        """Write all buffered items now. Returns the number of items flushed."""
+        with self._lock:
+            items, self._items, self._oldest = self._items, [], None
+        if not items:
+            return 0
+        try:
+            self.flush_func(items)
+        except Exception:
+            logger.exception("Dropped %d buffered %s items", len(items), self.name)
+            return 0
+        return len(items)
+
+
+def flush_due_buffers(**kwargs):
+    for buffer in _buffers:
+        if buffer.is_due():
+            buffer.flush()
+
+
+def _run_flusher(interval, stop):
+    while not stop.wait(interval):
+        try:
+            flush_due_buffers()
+        finally:
+            close_old_connections()
+
+
+def start_flusher(interval=None):
+    """Flush due buffers every interval seconds (BUFFER_FLUSH_INTERVAL; 0 disables) on a daemon thread."""
+    global _flusher
+    if interval is None:
+        interval = settings.BUFFER_FLUSH_INTERVAL
+    if not interval:
+        return
+    with _flusher_lock:
+        if _flusher and _flusher[0].is_alive():
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_run_flusher, args=(interval, stop), name="buffer-flusher", daemon=True)
+        _flusher = (thread, stop, interval)
+        thread.start()
+
+
+def stop_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher:
+            _flusher[1].set()
+            _flusher[0].join()
+        _flusher = None
+
+
+def _restart_flusher_after_fork():
+    # Threads do not survive fork(): a worker forked from a preloaded app
+    # (gunicorn --preload) would otherwise never flush on its own
+    global _flusher, _flusher_lock
+    _flusher_lock = threading.Lock()
+    if _flusher:
+        interval, _flusher = _flusher[2], None
+        start_flusher(interval)
+
+
+os.register_at_fork(after_in_child=_restart_flusher_after_fork)
+
+
+@atexit.register
+def flush_all_buffers():
+    for buffer in _buffers:
+        buffer.flush()
@@ -0,0 +1,91 @@
+"""
+Server-side clustering of upcoming events for the map.
+
+Events are grouped by a prefix of their location's geohash, sized so that a
+map tile holds at most a few dozen clusters. Results are cached per tile;
+every event or location change bumps a version number that is part of the
+cache key, so the process that made an edit stops serving stale tiles at once.
+
+With the default per-process cache (no CACHES setting), other processes keep
+their own version number and may serve tiles from before the edit for up to
+EVENT_CLUSTER_CACHE_SECONDS. Configure a shared cache backend (e.g. Redis or
+Memcached) to invalidate every process immediately.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from . import geo
+from .models import Event
+
+VERSION_KEY = "event-clusters:version"
+
+
+def cache_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """Make every cached tile stale."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def compute_clusters(zoom, x, y, public_only):
+    """Clusters of upcoming events inside one tile."""
+    precision = geo.cluster_precision(zoom)
+    events = Event.objects.filter(end_time__gte=timezone.now())
+    if public_only:
+        events = events.filter(is_public=True)
+    events = geo.within_bbox(events, *geo.tile_bounds(zoom, x, y), prefix="location__")
+
+    rows = (
+        events.values("category", cell=Substr("location__geohash", 1, precision))
+        .annotate(
+            count=Count("id"),
+            latitude_sum=Sum("location__latitude"),
+            longitude_sum=Sum("location__longitude"),
+        )
+        .order_by()
+    )
+
+    clusters = {}
+    for row in rows:
+        cluster = clusters.setdefault(row["cell"], {
+            "geohash": row["cell"],
+            "count": 0,
+            "categories": {},
+            "latitude_sum": 0.0,
+            "longitude_sum": 0.0,
+        })
+        cluster["count"] += row["count"]
+        cluster["categories"][row["category"]] = row["count"]
+        cluster["latitude_sum"] += row["latitude_sum"]
+        cluster["longitude_sum"] += row["longitude_sum"]
+
+    result = []
+    for cluster in clusters.values():
+        # Marker at the centroid of the cluster's events rather than the cell centre
+        cluster["latitude"] = round(cluster.pop("latitude_sum") / cluster["count"], 6)
+        cluster["longitude"] = round(cluster.pop("longitude_sum") / cluster["count"], 6)
+        result.append(cluster)
+    result.sort(key=lambda c: -c["count"])
+    return result
+
+
+def tile_clusters(zoom, x, y, public_only):
+    """Cached compute_clusters()."""
+    key = f"event-clusters:{cache_version()}:{zoom}:{x}:{y}:{int(public_only)}"
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = compute_clusters(zoom, x, y, public_only)
+        cache.set(key, clusters, settings.EVENT_CLUSTER_CACHE_SECONDS)
+    return clusters
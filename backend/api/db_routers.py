@@ -0,0 +1,79 @@
+"""
+Read-replica routing.
+
+When ``REPLICA_DATABASE`` names a database alias, reads made while serving
+GET/HEAD requests go to that replica and everything else goes to
+``default``. A user who just wrote something is pinned to ``default`` for
+``REPLICA_PIN_SECONDS`` so they read their own writes despite replication
+lag. ReplicaRoutingMiddleware decides per request; outside a request
+(management commands, shell) all queries use ``default``.
+
+The pin is kept in the default cache. With the default per-process cache it
+only holds within the worker that served the write, so a deployment with
+several workers needs a shared cache (CACHE_REDIS_URL); ``check_pin_cache``
+warns when a replica is configured without one.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads inside the block to the replica (if one is configured)."""
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """Send this user's reads to the primary for a while after a write."""
+    cache.set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return bool(cache.get(_pin_key(user_id)))
+
+
+# Cache backends whose entries other processes cannot see
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_pin_cache(app_configs, **kwargs):
+    if not settings.REPLICA_DATABASE or settings.CACHES["default"]["BACKEND"] not in PER_PROCESS_CACHES:
+        return []
+    return [checks.Warning(
+        "REPLICA_DATABASE is set but the default cache is per process, so a user's "
+        "reads are only pinned to the primary by the worker that served their write.",
+        hint="Set CACHE_REDIS_URL so all workers share the read-your-writes pin.",
+        id="api.W001",
+    )]
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.REPLICA_DATABASE and _use_replica.get():
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data
+        return True
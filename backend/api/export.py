@@ -0,0 +1,99 @@
+"""
+Streaming exports of events, participants, join requests and comments for
+analytics, as JSON lines or CSV, optionally gzipped.
+
+Rows are read with values_list().iterator(chunk_size), so no model instances
+are built and memory stays constant however large the tables are (PostgreSQL
+uses a server-side cursor; SQLite steps its cursor). Output is produced in
+blocks of roughly OUTPUT_BLOCK_BYTES for both the export_data command and the
+admin endpoint.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+from .models import Comment, Event, JoinRequest
+
+OUTPUT_BLOCK_BYTES = 64 * 1024
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = ("jsonl", "csv")
+
+DATASETS = {
+    "events": (
+        lambda: Event.objects.order_by("id"),
+        ["id", "name", "details", "category", "is_public", "start_time", "end_time", "max_capacity",
+         "posted_date", "updated_at", "host_id", "host__username", "location_id",
+         "location__name", "location__latitude", "location__longitude", "series_id"],
+    ),
+    "participants": (
+        lambda: Event.participant_list.through.objects.order_by("id"),
+        ["event_id", "user_id", "user__username"],
+    ),
+    "join_requests": (
+        lambda: JoinRequest.objects.order_by("id"),
+        ["id", "event_id", "user_id", "status", "created_at", "updated_at"],
+    ),
+    "comments": (
+        lambda: Comment.objects.order_by("id"),
+        ["id", "event_id", "user_id", "parent_id", "text", "created_at", "updated_at"],
+    ),
+}
+
+
+def columns(dataset):
+    """Output column names (related lookups such as host__username become host_username)."""
+    return [field.replace("__", "_") for field in DATASETS[dataset][1]]
+
+
+def rows(dataset, using=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield plain tuples for a dataset, streamed from the database."""
+    queryset, fields = DATASETS[dataset]
+    queryset = queryset()
+    if using:
+        queryset = queryset.using(using)
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _jsonl(dataset, records):
+    names = columns(dataset)
+    for record in records:
+        yield json.dumps(dict(zip(names, map(_plain, record))), ensure_ascii=False) + "\n"
+
+
+def _csv(dataset, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns(dataset))
+    for record in records:
+        writer.writerow(map(_plain, record))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream(dataset, fmt="jsonl", compress=False, using=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export as bytes blocks of about OUTPUT_BLOCK_BYTES."""
+    encode = _jsonl if fmt == "jsonl" else _csv
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+    parts, size = [], 0
+    for text in encode(dataset, rows(dataset, using, chunk_size)):
+        parts.append(text)
+        size += len(text)
+        if size >= OUTPUT_BLOCK_BYTES:
+            block = "".join(parts).encode()
+            parts, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+    block = "".join(parts).encode()
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
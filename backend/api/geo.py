@@ -0,0 +1,252 @@
+"""
+Geohash helpers for spatial queries on Location.
+
+Each location stores the geohash of its coordinates in an indexed column.
+A bounding box is covered by a handful of geohash cells, and every cell is
+a contiguous range of that index (all hashes sharing the cell's prefix), so
+area queries become a few index range scans followed by an exact
+latitude/longitude check.
+
+Distances use the equirectangular approximation, which is accurate to well
+under a metre at campus scale and only needs arithmetic in SQL.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Power, Sqrt
+from rest_framework.exceptions import ValidationError
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5 m cells
+EARTH_RADIUS_M = 6_371_000
+MAX_COVER_CELLS = 16
+MAX_RADIUS_M = 50_000
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def decode_bounds(geohash):
+    """(south, west, north, east) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def successor(prefix):
+    """Smallest geohash string that sorts after every hash starting with prefix."""
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return "".join(chars)
+        chars.pop()
+    return None  # prefix was all 'z': no upper bound
+
+
+def cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """
+    The finest set of geohash cells (at most max_cells) covering a box, or
+    an empty list when even single-character cells would need more, in
+    which case a scan beats that many range clauses.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        cols = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * cols <= max_cells:
+            break
+    else:
+        return []
+    cells = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            cells.add(encode(lat, lng, precision))
+            if lng >= east:
+                break
+            lng = min(lng + width, east)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return sorted(cells)
+
+
+def cells_q(cells, field="geohash"):
+    """Q matching rows whose geohash lies in any of the cells (index range scans); no cells match all."""
+    q = Q()
+    for cell in cells:
+        upper = successor(cell)
+        bounds = {f"{field}__gte": cell}
+        if upper:
+            bounds[f"{field}__lt"] = upper
+        q |= Q(**bounds)
+    return q
+
+
+def within_bbox(queryset, south, west, north, east, prefix=""):
+    """Filter to rows inside the box; prefix is e.g. "location__" for events."""
+    return queryset.filter(
+        cells_q(cover(south, west, north, east), field=f"{prefix}geohash"),
+        **{
+            f"{prefix}latitude__gte": south,
+            f"{prefix}latitude__lte": north,
+            f"{prefix}longitude__gte": west,
+            f"{prefix}longitude__lte": east,
+        },
+    )
+
+
+def radius_bbox(latitude, longitude, radius_m):
+    """(south, west, north, east) of the box enclosing a circle."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+    return (
+        max(latitude - dlat, -90.0), max(longitude - dlng, -180.0),
+        min(latitude + dlat, 90.0), min(longitude + dlng, 180.0),
+    )
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Python version of the distance near() computes in SQL."""
+    metres_per_degree = math.radians(1) * EARTH_RADIUS_M
+    dx = (lng2 - lng1) * math.cos(math.radians(lat1)) * metres_per_degree
+    dy = (lat2 - lat1) * metres_per_degree
+    return math.hypot(dx, dy)
+
+
+def near(queryset, latitude, longitude, radius_m, prefix=""):
+    """
+    Filter to rows within radius_m metres, annotated with ``distance``
+    (metres). Callers order by distance.
+    """
+    queryset = within_bbox(queryset, *radius_bbox(latitude, longitude, radius_m), prefix=prefix)
+    metres_per_degree = math.radians(1) * EARTH_RADIUS_M
+    dx = (F(f"{prefix}longitude") - longitude) * (math.cos(math.radians(latitude)) * metres_per_degree)
+    dy = (F(f"{prefix}latitude") - latitude) * metres_per_degree
+    distance = Sqrt(Power(dx, 2) + Power(dy, 2), output_field=FloatField())
+    return queryset.annotate(distance=distance).filter(distance__lte=radius_m)
+
+
+# -------------------------------
+# Map tiles (Web Mercator z/x/y, as used by Leaflet)
+# -------------------------------
+
+MAX_ZOOM = 20
+
+
+def tile_bounds(zoom, x, y):
+    """(south, west, north, east) of a map tile."""
+    n = 2 ** zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for(latitude, longitude, zoom):
+    """(x, y) of the tile containing a point."""
+    n = 2 ** zoom
+    x = int((longitude + 180.0) / 360.0 * n)
+    lat = math.radians(latitude)
+    y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def cluster_precision(zoom):
+    """Geohash length whose cells are at most a quarter of a tile wide."""
+    tile_width = 360.0 / 2 ** zoom
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] <= tile_width / 4:
+            return precision
+    return GEOHASH_PRECISION
+
+
+# -------------------------------
+# Query parameter parsing
+# -------------------------------
+
+def _floats(value, count, name):
+    try:
+        numbers = [float(part) for part in value.split(",")]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(n) for n in numbers):
+        raise ValidationError({name: f"Expected {count} comma-separated numbers."})
+    return numbers
+
+
+def parse_bbox(value):
+    """Parse Leaflet's toBBoxString(): "west,south,east,north"."""
+    west, south, east, north = _floats(value, 4, "bbox")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValidationError({"bbox": "Expected west,south,east,north within world bounds."})
+    return south, west, north, east
+
+
+def parse_near(value, radius):
+    """Parse near="lat,lng" and radius (metres)."""
+    latitude, longitude = _floats(value, 2, "near")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError({"near": "Coordinates out of range."})
+    try:
+        radius_m = float(radius) if radius is not None else 1000.0
+    except ValueError:
+        raise ValidationError({"radius": "Expected a number of metres."})
+    if not 0 < radius_m <= MAX_RADIUS_M:
+        raise ValidationError({"radius": f"Must be between 0 and {MAX_RADIUS_M} metres."})
+    return latitude, longitude, radius_m
+
+
+def filter_by_area(queryset, params, prefix=""):
+    """
+    Apply the ``bbox`` and ``near``/``radius`` query parameters.
+    Returns (queryset, ordered_by_distance).
+    """
+    bbox = params.get("bbox")
+    if bbox:
+        queryset = within_bbox(queryset, *parse_bbox(bbox), prefix=prefix)
+    point = params.get("near")
+    if point:
+        latitude, longitude, radius_m = parse_near(point, params.get("radius"))
+        return near(queryset, latitude, longitude, radius_m, prefix=prefix), True
+    return queryset, False
@@ -0,0 +1,41 @@
+"""
+Password hashers whose cost comes from settings.
+
+They keep Django's algorithm names, so existing hashes still verify. Django
+re-hashes a password on the next successful login when its algorithm is not
+the preferred one (the first entry in PASSWORD_HASHERS) or when its cost
+differs from the configured one, so changing PASSWORD_HASHER or a cost
+setting upgrades users as they log in.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        # Unset follows Django's default, so upgrading Django raises the cost
+        # and existing hashes are never re-hashed with fewer iterations
+        return settings.PASSWORD_PBKDF2_ITERATIONS or super().iterations
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    # Upper bound, not an allocation: OpenSSL's default 32 MiB is too small to
+    # hash or verify with work factors above 2**14
+    maxmem = 512 * 1024 * 1024
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs the argon2-cffi package."""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_KIB
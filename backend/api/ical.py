@@ -0,0 +1,101 @@
+"""
+Per-user iCalendar (.ics) feeds of hosted and joined events.
+
+Calendar apps poll feeds often, so every response carries an ETag and a
+Last-Modified date computed with one aggregate query, and polls whose copy
+is current get a 304 without the feed being rendered. Event edits move
+Event.updated_at, and so do changes to the name or coordinates of an event's
+location; joining, leaving and deleting events move the feed's changed_at
+(api/signals.py calls touch_feeds).
+The body is streamed from a server-side cursor.
+"""
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import CalendarFeed, Event
+
+PRODID = "-//UniMeet//Events//EN"
+
+
+def feed_events(user_id):
+    """Events the user hosts or has joined that have not long ended."""
+    joined = Event.participant_list.through.objects.filter(user_id=user_id).values("event_id")
+    since = timezone.now() - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    return Event.objects.filter(Q(host_id=user_id) | Q(pk__in=joined), end_time__gte=since)
+
+
+def feed_state(feed):
+    """(last_modified, etag) of a feed."""
+    state = feed_events(feed.user_id).aggregate(latest=Max("updated_at"), count=Count("id"))
+    last_modified = max(filter(None, [state["latest"], feed.changed_at]))
+    # The date is included so events ageing out of the window refresh clients once a day
+    key = f"{feed.token}:{last_modified.isoformat()}:{state['count']}:{timezone.now().date()}"
+    return last_modified, hashlib.md5(key.encode()).hexdigest()
+
+
+def touch_feeds(user_ids):
+    """Mark these users' feeds changed (an event was added or removed)."""
+    CalendarFeed.objects.filter(user_id__in=list(user_ids)).update(changed_at=timezone.now())
+
+
+def escape(text):
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Split a content line into 75-octet pieces as RFC 5545 requires."""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1  # don't split a UTF-8 sequence
+        parts.append(data[start:end].decode())
+        start, limit = end, 74  # continuation lines start with a space
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def stamp(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def event_lines(event):
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event.pk}@unimeet",
+        f"DTSTAMP:{stamp(event.updated_at)}",
+        f"LAST-MODIFIED:{stamp(event.updated_at)}",
+        f"DTSTART:{stamp(event.start_time)}",
+        f"DTEND:{stamp(event.end_time)}",
+        f"SUMMARY:{escape(event.name)}",
+        f"DESCRIPTION:{escape(event.details)}",
+        f"CATEGORIES:{escape(event.get_category_display())}",
+        f"LOCATION:{escape(event.location.name)}",
+    ]
+    if event.location.latitude is not None and event.location.longitude is not None:
+        lines.append(f"GEO:{event.location.latitude};{event.location.longitude}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def render(user_id, using=None):
+    """Yield the feed in chunks of lines, read from the ``using`` database if given."""
+    yield "".join(fold(line) for line in [
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN", "X-WR-CALNAME:UniMeet",
+    ])
+    events = feed_events(user_id).select_related("location").order_by("start_time")
+    if using:
+        events = events.using(using)
+    for event in events.iterator(chunk_size=500):
+        yield "".join(fold(line) for line in event_lines(event))
+    yield fold("END:VCALENDAR")
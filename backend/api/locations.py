@@ -0,0 +1,58 @@
+"""
+Location normalization and deduplication.
+
+Coordinates are rounded to ``LOCATION_COORDINATE_DECIMALS`` places and names
+have their whitespace collapsed, and a location posted with the same name
+(ignoring case) within ``LOCATION_DEDUPE_RADIUS_M`` metres of an existing one
+resolves to the existing row.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import geo
+from .models import Location
+
+
+def normalize_name(name):
+    return " ".join(str(name).split())
+
+
+def normalize_coordinate(value):
+    return round(float(value), settings.LOCATION_COORDINATE_DECIMALS)
+
+
+def find_duplicate(name, latitude, longitude, radius_m=None, exclude_id=None):
+    """The nearest location with this name within the dedupe radius, if any."""
+    radius_m = radius_m or settings.LOCATION_DEDUPE_RADIUS_M
+    candidates = Location.objects.filter(name__iexact=normalize_name(name))
+    if exclude_id is not None:
+        candidates = candidates.exclude(id=exclude_id)
+    return geo.near(candidates, latitude, longitude, radius_m).order_by("distance", "id").first()
+
+
+def get_or_create_location(name, latitude, longitude):
+    """
+    Return (location, created), reusing a nearby location of the same name.
+
+    Two concurrent requests can both miss the lookup. An exact collision is
+    caught by the unique constraint; for near-duplicates each request checks
+    again after inserting, and only the row with the lower id survives.
+    """
+    latitude, longitude = normalize_coordinate(latitude), normalize_coordinate(longitude)
+    existing = find_duplicate(name, latitude, longitude)
+    if existing:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            location = Location.objects.create(name=name, latitude=latitude, longitude=longitude)
+    except IntegrityError:
+        return Location.objects.get(
+            name=normalize_name(name), latitude=latitude, longitude=longitude
+        ), False
+
+    rival = find_duplicate(name, latitude, longitude, exclude_id=location.id)
+    if rival and rival.id < location.id:
+        location.delete()
+        return rival, False
+    return location, True
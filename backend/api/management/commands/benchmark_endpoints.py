@@ -0,0 +1,159 @@
+import json
+import subprocess
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import geo, seeding
+from api.bench import Rollback, format_stats, measure
+from api.metrics import RequestMetrics
+from api.models import Event, Friendship
+from api.serializers import ClaimsTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Calls every hot API endpoint through the test client as a seeded user, "
+        "authenticated with a JWT access token like a real client, and "
+        "records latency, query count, peak memory and response size per endpoint "
+        "in a JSON file. Uses data from seed_benchmark, or seeds (and afterwards "
+        "rolls back) its own with --scale. --compare prints the change from an "
+        "earlier results file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="benchmark-results.json")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--scale", type=float, help="Seed a temporary dataset at this scale.")
+        parser.add_argument("--compare", help="Earlier results file to compare with.")
+
+    def handle(self, *args, **options):
+        results = None
+        try:
+            with transaction.atomic():
+                if options["scale"]:
+                    seeding.seed_dataset(options["scale"])
+                results = self.run(options)
+                raise Rollback  # searches and other writes made by the requests
+        except Rollback:
+            pass
+
+        with open(options["output"], "w") as handle:
+            json.dump(results, handle, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def endpoints(self, user, event, friend_id):
+        location = event.location
+        x, y = geo.tile_for(location.latitude, location.longitude, 15)
+        return {
+            "events": reverse("event-list"),
+            "events_search": reverse("event-list") + "?search=study+group",
+            "events_near": reverse("event-list") + f"?near={location.latitude},{location.longitude}&radius=1000",
+            "event_detail": reverse("event-detail", args=[event.pk]),
+            "event_comments": reverse("event-comments", args=[event.pk]),
+            "event_clusters": reverse("event-clusters", args=[15, x, y]),
+            "hosted_events": reverse("hosted-events"),
+            "joined_events": reverse("joined-events"),
+            "join_requests": reverse("list-join-requests"),
+            "locations": reverse("location-list"),
+            "friends": reverse("friends-list"),
+            "friend_requests_received": reverse("received-friend-requests"),
+            "conversations": reverse("conversation-list"),
+            "message_thread": reverse("message-thread", args=[friend_id]),
+            "notifications": reverse("notification-list"),
+            "notifications_unread": reverse("unread-notification-count"),
+            "user_search": reverse("user-search") + "?q=bench_1",
+            "recent_searches": reverse("recent-searches"),
+            "popular_searches": reverse("popular-searches"),
+            "profile": reverse("profile"),
+        }
+
+    def run(self, options):
+        users = User.objects.filter(username__startswith=seeding.USERNAME_PREFIX)
+        user = users.annotate(n=Count("joined_events")).order_by("-n").first()
+        if user is None:
+            raise CommandError("No benchmark data: run seed_benchmark first or pass --scale.")
+        event = (
+            Event.objects.filter(host=user).annotate(n=Count("comments")).order_by("-n").first()
+            or Event.objects.annotate(n=Count("comments")).order_by("-n").first()
+        )
+        friendship = Friendship.objects.filter(user1=user).first() or Friendship.objects.filter(user2=user).first()
+        friend_id = (friendship.user2_id if friendship.user1_id == user.pk else friendship.user1_id) if friendship else user.pk
+
+        # A real access token, so every request pays for StatelessJWTAuthentication
+        client = APIClient()
+        access = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        results = {
+            "meta": {
+                "commit": self.commit(),
+                "created_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "repeat": options["repeat"],
+                "rows": {"users": users.count(), "events": Event.objects.count()},
+            },
+            "endpoints": {},
+        }
+        with override_settings(DEBUG=False, METRICS_HEADERS=False, METRICS_SAMPLE_RATE=0):
+            for name, url in self.endpoints(user, event, friend_id).items():
+                results["endpoints"][name] = self.measure_endpoint(client, url, options["repeat"])
+                self.stdout.write(
+                    f"{format_stats(name, results['endpoints'][name])}  "
+                    f"{results['endpoints'][name]['queries']:>4} queries"
+                )
+        return results
+
+    def measure_endpoint(self, client, url, repeat):
+        def call():
+            response = client.get(url)
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+            return response, body
+
+        call()  # warm caches and connections
+        counter = RequestMetrics()  # counts queries without relying on DEBUG's query log
+        with connection.execute_wrapper(counter):
+            response, body = call()
+        tracemalloc.start()
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            "url": url,
+            "status": response.status_code,
+            "bytes": len(body),
+            "queries": counter.queries,
+            "peak_kib": round(peak / 1024, 1),
+            **measure(call, repeat),
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, results):
+        with open(path) as handle:
+            previous = json.load(handle)
+        self.stdout.write(f"Compared with {path} (commit {previous['meta'].get('commit')}):")
+        for name, current in results["endpoints"].items():
+            before = previous["endpoints"].get(name)
+            if not before:
+                self.stdout.write(f"{name:<40} new")
+                continue
+            change = (current["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0
+            self.stdout.write(
+                f"{name:<40} median {before['median_ms']:>9.3f} -> {current['median_ms']:>9.3f} ms "
+                f"({change:+.0f}%)  queries {before['queries']} -> {current['queries']}"
+            )
@@ -0,0 +1,88 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api import search
+from api.bench import Rollback, format_stats, measure
+from api.models import Event, Location
+
+WORDS = ["study", "group", "calculus", "chemistry", "basketball", "soccer", "career",
+         "resume", "workshop", "volunteer", "food", "drive", "movie", "night", "club",
+         "meeting", "poetry", "coding", "hackathon", "yoga", "chess", "tutoring", "lab"]
+VENUES = ["Student Union", "Atkins Library", "Belk Gym", "Cone Center", "Woodward Hall",
+          "Fretwell", "Kennedy", "Prospector", "Science Building", "Rec Center"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks indexed event search against the old icontains filters on "
+        "synthetic events. All generated rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--queries", nargs="+", default=["chess", "career work", "gym", "zzz"])
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(42)
+        count = options["events"]
+        batch_size = options["batch_size"]
+
+        host = User.objects.create(username="benchmark_host", password=make_password(None))
+        locations = [
+            Location.objects.create(name=f"{venue} {n}", latitude=35.3 + n / 1000, longitude=-80.7)
+            for n, venue in enumerate(VENUES)
+        ]
+        now = timezone.now()
+        categories = [key for key, _ in Event.CATEGORY_CHOICES]
+
+        start = time.perf_counter()
+        for first in range(0, count, batch_size):
+            events = []
+            for n in range(first, min(first + batch_size, count)):
+                start_time = now + timedelta(hours=rng.randint(1, 24 * 120))
+                events.append(Event(
+                    name=" ".join(rng.sample(WORDS, 2)).title()[:50],
+                    details=" ".join(
+                        rng.choices(WORDS, k=3) + [f"w{rng.randint(0, 50_000)}" for _ in range(20)]
+                    ),
+                    category=rng.choice(categories),
+                    host=host,
+                    location=rng.choice(locations),
+                    start_time=start_time,
+                    end_time=start_time + timedelta(hours=2),
+                ))
+            search.index_events(Event.objects.bulk_create(events), batch_size)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Created and indexed {count} events in {elapsed:.1f}s")
+
+        for query in options["queries"]:
+            def scan():
+                return list(Event.objects.filter(
+                    Q(name__icontains=query) | Q(details__icontains=query)
+                    | Q(category__icontains=query) | Q(location__name__icontains=query)
+                ).order_by("start_time")[:50])
+
+            def indexed():
+                queryset = search.search_events(Event.objects.all(), query)
+                return list(queryset.order_by("search_rank", "start_time")[:50])
+
+            self.stdout.write(format_stats(f"icontains  q={query!r}", measure(scan, options["repeat"])))
+            self.stdout.write(format_stats(f"index     q={query!r}", measure(indexed, options["repeat"])))
@@ -0,0 +1,110 @@
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import export
+from api.bench import Rollback, format_stats, measure
+from api.models import Comment, Event, JoinRequest, Location
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the streaming export of every dataset and format on synthetic "
+        "data, reporting rows/s, MB/s and peak Python memory (which should not grow "
+        "with table size). All generated rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=20_000)
+        parser.add_argument("--users", type=int, default=2_000)
+        parser.add_argument("--participants-per-event", type=int, default=5)
+        parser.add_argument("--comments-per-event", type=int, default=3)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(11)
+        batch_size = options["batch_size"]
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            (User(username=f"export_bench_{n}", password=password) for n in range(options["users"])),
+            batch_size=batch_size,
+        )
+        user_ids = [u.pk for u in users]
+        location = Location.objects.create(name="Export benchmark hall", latitude=35.3, longitude=-80.7)
+        now = timezone.now()
+        events = Event.objects.bulk_create(
+            (
+                Event(
+                    name=f"Benchmark event {n}", details="Lorem ipsum dolor sit amet, " * 4,
+                    host_id=rng.choice(user_ids), location=location,
+                    start_time=now + timedelta(hours=n), end_time=now + timedelta(hours=n + 1),
+                )
+                for n in range(options["events"])
+            ),
+            batch_size=batch_size,
+        )
+        Through = Event.participant_list.through
+        Through.objects.bulk_create(
+            (
+                Through(event_id=e.pk, user_id=u)
+                for e in events
+                for u in rng.sample(user_ids, options["participants_per_event"])
+            ),
+            batch_size=batch_size,
+        )
+        JoinRequest.objects.bulk_create(
+            (JoinRequest(event_id=e.pk, user_id=rng.choice(user_ids)) for e in events[::4]),
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        Comment.objects.bulk_create(
+            (
+                Comment(event_id=e.pk, user_id=rng.choice(user_ids), text=f"Comment {n}, see you there!")
+                for e in events
+                for n in range(options["comments_per_event"])
+            ),
+            batch_size=batch_size,
+        )
+
+    def run(self, options):
+        start = time.perf_counter()
+        self.seed(options)
+        self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+        for dataset in export.DATASETS:
+            count = sum(1 for _ in export.rows(dataset))
+            for fmt in export.FORMATS:
+                for compress in (False, True):
+                    size = 0
+
+                    def run_export():
+                        nonlocal size
+                        size = sum(len(block) for block in export.stream(dataset, fmt, compress))
+
+                    stats = measure(run_export, options["repeat"])
+                    tracemalloc.start()
+                    run_export()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+                    seconds = stats["median_ms"] / 1000
+                    label = f"{dataset} {fmt}{'.gz' if compress else ''} ({count} rows)"
+                    self.stdout.write(
+                        f"{format_stats(label, stats)}  {count / seconds:>9.0f} rows/s  "
+                        f"{size / seconds / 1e6:>6.1f} MB/s  peak {peak / 1e6:.1f} MB"
+                    )
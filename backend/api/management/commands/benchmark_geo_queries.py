@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import geo
+from api.bench import Rollback, format_stats, measure
+from api.models import Location
+
+# Synthetic locations are scattered around this point (UNC Charlotte)
+CENTER = (35.3071, -80.7352)
+SPREAD_DEGREES = 0.5
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks bbox and radius location queries through the geohash index "
+        "against loading every location. All generated rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--locations", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--radius", type=float, default=500.0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(7)
+        count = options["locations"]
+        start = time.perf_counter()
+        for first in range(0, count, options["batch_size"]):
+            batch = []
+            for n in range(first, min(first + options["batch_size"], count)):
+                location = Location(
+                    name=f"Benchmark location {n}",
+                    latitude=CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                    longitude=CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                )
+                location.normalize()
+                batch.append(location)
+            Location.objects.bulk_create(batch)
+        self.stdout.write(f"Created {count} locations in {time.perf_counter() - start:.1f}s")
+
+        lat, lng = CENTER
+        south, west, north, east = lat - 0.01, lng - 0.012, lat + 0.01, lng + 0.012
+        radius = options["radius"]
+        repeat = options["repeat"]
+
+        def load_everything():
+            return [
+                l for l in Location.objects.all()
+                if l.latitude is not None and south <= l.latitude <= north and west <= l.longitude <= east
+            ]
+
+        def coordinate_scan():
+            return list(Location.objects.filter(
+                latitude__range=(south, north), longitude__range=(west, east)
+            ))
+
+        def indexed_bbox():
+            return list(geo.within_bbox(Location.objects.all(), south, west, north, east))
+
+        def indexed_near():
+            return list(geo.near(Location.objects.all(), lat, lng, radius).order_by("distance"))
+
+        self.stdout.write(f"bbox matches {len(indexed_bbox())} locations, "
+                          f"{radius:.0f} m radius matches {len(indexed_near())}")
+        self.stdout.write(format_stats("load all + filter in Python", measure(load_everything, repeat)))
+        self.stdout.write(format_stats("bbox, unindexed lat/lng scan", measure(coordinate_scan, repeat)))
+        self.stdout.write(format_stats("bbox via geohash index", measure(indexed_bbox, repeat)))
+        self.stdout.write(format_stats("near via geohash index", measure(indexed_near, repeat)))
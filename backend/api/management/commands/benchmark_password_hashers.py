@@ -0,0 +1,71 @@
+import importlib.util
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from api.bench import Rollback, format_stats, measure
+from api.serializers import ClaimsTokenObtainPairSerializer
+
+PASSWORD = "correct-horse-battery"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures a full login (credential check and token issue, as done by "
+        "/api/token/) for each password hasher setting and reports logins per "
+        "second per core. The benchmark user is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pbkdf2-iterations", type=int, nargs="+",
+            default=[n for n in (1_000_000, settings.PASSWORD_PBKDF2_ITERATIONS, 600_000, 300_000) if n],
+        )
+        parser.add_argument("--scrypt-work-factors", type=int, nargs="+", default=[2 ** 14, 2 ** 15])
+        parser.add_argument("--argon2-time-costs", type=int, nargs="+", default=[2, 3])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        configs = [
+            (f"pbkdf2 iterations={n:,}", "pbkdf2", {"PASSWORD_PBKDF2_ITERATIONS": n})
+            for n in dict.fromkeys(options["pbkdf2_iterations"])
+        ] + [
+            (f"scrypt work_factor={n}", "scrypt", {"PASSWORD_SCRYPT_WORK_FACTOR": n})
+            for n in options["scrypt_work_factors"]
+        ]
+        if importlib.util.find_spec("argon2"):
+            configs += [
+                (f"argon2 time_cost={n}", "argon2", {"PASSWORD_ARGON2_TIME_COST": n})
+                for n in options["argon2_time_costs"]
+            ]
+        else:
+            self.stdout.write("argon2-cffi is not installed; skipping argon2.")
+
+        self.stdout.write(f"Current setting: {settings.PASSWORD_HASHER}")
+        for label, name, costs in configs:
+            hashers = [settings.PASSWORD_HASHER_CLASSES[name]]
+            with override_settings(PASSWORD_HASHERS=hashers, **costs):
+                stats = self.measure_login(options["repeat"])
+            rate = 1000 / stats["median_ms"]
+            self.stdout.write(f"{format_stats(label, stats)}  {rate:>7.1f} logins/s/core")
+
+    def measure_login(self, repeat):
+        result = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username="benchmark-login", password=PASSWORD)
+
+                def login():
+                    serializer = ClaimsTokenObtainPairSerializer(
+                        data={"username": user.username, "password": PASSWORD}
+                    )
+                    serializer.is_valid(raise_exception=True)
+
+                result = measure(login, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+        return result
@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import search
+from api.bench import Rollback, format_stats, measure
+
+SYLLABLES = ["al", "be", "cor", "da", "el", "fin", "ga", "hu", "is", "jo",
+             "ka", "lu", "mar", "ne", "ol", "pe", "qui", "ro", "sa", "ty"]
+
+
+def synthetic_username(n):
+    """Deterministic, readable usernames such as 'marolsa_48213'."""
+    parts = []
+    value = n
+    for _ in range(3):
+        value, digit = divmod(value, len(SYLLABLES))
+        parts.append(SYLLABLES[digit])
+    return f"{''.join(parts)}_{n}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks indexed user search against the old username__icontains scan "
+        "on synthetic users. All generated rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--queries", nargs="+", default=["ma", "mar", "olsa", "_4821", "zzz"],
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        count = options["users"]
+        batch_size = options["batch_size"]
+        password = make_password(None)  # unusable; hashing is not what we measure
+
+        start = time.perf_counter()
+        offset = User.objects.count()
+        for first in range(0, count, batch_size):
+            users = User.objects.bulk_create(
+                User(username=synthetic_username(offset + n), password=password)
+                for n in range(first, min(first + batch_size, count))
+            )
+            search.index_users(users, batch_size)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Created and indexed {count} users in {elapsed:.1f}s")
+
+        searcher = User.objects.order_by("id").first()
+        for query in options["queries"]:
+            old = measure(
+                lambda: list(User.objects.filter(username__icontains=query).exclude(id=searcher.id)),
+                options["repeat"],
+            )
+            new = measure(lambda: search.search_users(query, user=searcher), options["repeat"])
+            self.stdout.write(format_stats(f"icontains  q={query!r}", old))
+            self.stdout.write(format_stats(f"index     q={query!r}", new))
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams a dataset (events, participants, join_requests or comments) as "
+        "JSON lines or CSV, optionally gzipped, to a file or stdout in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(export.DATASETS))
+        parser.add_argument("--format", choices=export.FORMATS, default="jsonl")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", default="-", help="File to write; '-' for stdout.")
+        parser.add_argument("--chunk-size", type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        blocks = export.stream(
+            options["dataset"], options["format"], options["gzip"],
+            chunk_size=options["chunk_size"],
+        )
+        if options["output"] == "-":
+            out = sys.stdout.buffer
+            for block in blocks:
+                out.write(block)
+            out.flush()
+            return
+        written = 0
+        with open(options["output"], "wb") as out:
+            for block in blocks:
+                out.write(block)
+                written += len(block)
+        self.stderr.write(f"Wrote {written} bytes to {options['output']}.")
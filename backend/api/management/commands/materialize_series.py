@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from api import recurrence
+from api.models import EventSeries
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores the occurrences of every recurring series that start within the "
+        "next EVENT_SERIES_MATERIALIZE_DAYS days as events. Run it daily so the "
+        "event list, search, the map and calendar feeds always show them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Days ahead (default: settings.EVENT_SERIES_MATERIALIZE_DAYS).")
+        parser.add_argument("--batch-size", type=int, default=200, help="Series per transaction.")
+
+    def handle(self, *args, **options):
+        active = (
+            EventSeries.objects.filter(Q(until__isnull=True) | Q(until__gte=timezone.now()))
+            .select_related("location")
+            .order_by("pk")
+        )
+        created = 0
+        batch = []
+        for series in active.iterator(chunk_size=options["batch_size"]):
+            batch.append(series)
+            if len(batch) >= options["batch_size"]:
+                created += recurrence.materialize_upcoming(batch, options["days"])
+                batch = []
+        if batch:
+            created += recurrence.materialize_upcoming(batch, options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} events from recurring series."))
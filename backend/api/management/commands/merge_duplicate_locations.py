@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import clusters, geo
+from api.locations import normalize_name
+from api.models import Event, EventSeries, Location
+
+
+def _distance_m(a, b):
+    return geo.distance_m(a.latitude, a.longitude, b.latitude, b.longitude)
+
+
+class Command(BaseCommand):
+    help = (
+        "Merges locations that share a name (ignoring case) and lie within the "
+        "dedupe radius, repointing their events and recurring series to the "
+        "oldest location."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--radius", type=float, default=settings.LOCATION_DEDUPE_RADIUS_M)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        merges = {}  # duplicate id -> canonical id
+        locations = (
+            Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by("id")
+            .only("id", "name", "latitude", "longitude")
+            .iterator(chunk_size=2000)
+        )
+        # Bucketed in Python: SQL can lower-case names but not collapse their
+        # whitespace, so "Main  Hall" and "Main Hall" would not sort together
+        groups = {}
+        for location in locations:
+            groups.setdefault(normalize_name(location.name).lower(), []).append(location)
+        for group in groups.values():
+            self.collect_merges(group, options["radius"], merges)
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would merge {len(merges)} duplicate locations.")
+            return
+
+        pending = list(merges.items())
+        moved = series_moved = 0
+        now = timezone.now()
+        for start in range(0, len(pending), options["batch_size"]):
+            batch = pending[start:start + options["batch_size"]]
+            with transaction.atomic():
+                for duplicate_id, canonical_id in batch:
+                    # A new updated_at, so calendar feeds pick up the location's new name
+                    moved += Event.objects.filter(location_id=duplicate_id).update(
+                        location_id=canonical_id, updated_at=now,
+                    )
+                    series_moved += EventSeries.objects.filter(location_id=duplicate_id).update(location_id=canonical_id)
+                # Anything else still pointing at a duplicate is PROTECTed and fails the batch
+                Location.objects.filter(id__in=[duplicate_id for duplicate_id, _ in batch]).delete()
+        if merges:
+            clusters.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {len(merges)} duplicate locations and repointed {moved} events "
+            f"and {series_moved} recurring series."
+        ))
+
+    def collect_merges(self, group, radius, merges):
+        """Greedily attach each location to the oldest kept location within radius."""
+        kept = []
+        for location in group:
+            canonical = next((k for k in kept if _distance_m(k, location) <= radius), None)
+            if canonical:
+                merges[location.id] = canonical.id
+            else:
+                kept.append(location)
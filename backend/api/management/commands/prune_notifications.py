@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max, Q, Window
+from django.utils import timezone
+
+from api.models import Notification
+
+
+def expired(read_days, days):
+    """Read notifications older than read_days and any older than days."""
+    now = timezone.now()
+    return Notification.objects.filter(
+        Q(is_read=True, created_at__lt=now - timedelta(days=read_days))
+        | Q(created_at__lt=now - timedelta(days=days))
+    )
+
+
+def duplicates(notifications=None):
+    """Every notification with a newer one for the same user, type, event and message.
+
+    One window pass: each group is partitioned once and everything older than
+    its newest id is a duplicate, rather than probing for a newer row per row.
+    """
+    notifications = Notification.objects.all() if notifications is None else notifications
+    return notifications.annotate(
+        newest=Window(Max("id"), partition_by=[F("user_id"), F("notification_type"), F("event_id"), F("message")]),
+    ).filter(id__lt=F("newest"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes read notifications older than NOTIFICATION_READ_RETENTION_DAYS, "
+        "all notifications older than NOTIFICATION_RETENTION_DAYS, and all but the "
+        "newest of identical notifications, in batches so no single statement "
+        "holds the table for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--read-days", type=int, default=settings.NOTIFICATION_READ_RETENTION_DAYS)
+        parser.add_argument("--days", type=int, default=settings.NOTIFICATION_RETENTION_DAYS)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        stale = expired(options["read_days"], options["days"])
+        if options["dry_run"]:
+            kept = Notification.objects.exclude(pk__in=stale.values("pk"))
+            self.stdout.write(
+                f"Would delete {stale.count()} expired and {duplicates(kept).count()} duplicate notifications."
+            )
+            return
+
+        removed = self.delete_in_batches(stale, options["batch_size"])
+        compacted = self.delete_in_batches(duplicates(), options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {removed} expired and {compacted} duplicate notifications."
+        ))
+
+    def delete_in_batches(self, queryset, batch_size):
+        deleted = 0
+        while True:
+            ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += Notification.objects.filter(id__in=ids).delete()[0]
+
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the user and event search indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        search.rebuild_user_index(batch_size=options["batch_size"])
+        search.rebuild_event_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Rebuilt the user and event search indexes."))
@@ -0,0 +1,63 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import slow_queries
+
+SORT_KEYS = {
+    "total": lambda group: -group["total_ms"],
+    "count": lambda group: -group["count"],
+    "max": lambda group: -group["max_ms"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarizes the slow-query log (see api/slow_queries.py) by statement "
+        "fingerprint: how often each statement was slow, its total, mean and "
+        "worst time, where it was run from and its EXPLAIN plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Log file (default: settings.SLOW_QUERY_LOG).")
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="total")
+        parser.add_argument("--hours", type=float, help="Only records from the last N hours.")
+        parser.add_argument("--explain", action="store_true", help="Print each statement's plan.")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["hours"]) if options["hours"] else None
+        groups = {}
+        for record in slow_queries.read(options["path"]):
+            if since and parse_datetime(record["time"]) < since:
+                continue
+            group = groups.setdefault(record["fingerprint"], {
+                "fingerprint": record["fingerprint"], "sql": record["sql"], "count": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "sites": Counter(), "explain": None,
+            })
+            group["count"] += 1
+            group["total_ms"] += record["ms"]
+            group["max_ms"] = max(group["max_ms"], record["ms"])
+            site = " / ".join(filter(None, (record.get("view"), record.get("serializer"), record.get("line"))))
+            group["sites"][site or "<unknown>"] += 1
+            group["explain"] = record.get("explain") or group["explain"]
+
+        if not groups:
+            self.stdout.write("No slow queries logged.")
+            return
+
+        ranked = sorted(groups.values(), key=SORT_KEYS[options["sort"]])[:options["top"]]
+        for n, group in enumerate(ranked, 1):
+            self.stdout.write(
+                f"{n}. [{group['fingerprint']}] {group['count']}x  total {group['total_ms']:.1f} ms  "
+                f"mean {group['total_ms'] / group['count']:.1f} ms  max {group['max_ms']:.1f} ms"
+            )
+            self.stdout.write(f"   {group['sql'][:300]}")
+            for site, count in group["sites"].most_common(3):
+                self.stdout.write(f"   from {site} ({count}x)")
+            if options["explain"] and group["explain"]:
+                for row in group["explain"]:
+                    self.stdout.write(f"     {row}")
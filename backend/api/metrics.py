@@ -0,0 +1,149 @@
+"""
+Per-route request metrics.
+
+For a sampled request, MetricsMiddleware records the number of SQL queries,
+the time spent in SQL, the time spent producing serializer ``.data`` (which
+includes any queries that triggers) and the total latency. Samples are kept
+in memory by URL name, METRICS_MAX_SAMPLES per route, and MetricsView reports
+p50/p95/p99 for each route.
+
+Only METRICS_SAMPLE_RATE of requests are measured (none by default). With
+METRICS_HEADERS on, every request is measured and the numbers are also sent
+back as X-Query-Count and Server-Timing headers. Unmeasured requests only pay
+one random() call. The samples belong to the process, so each worker
+reports its own.
+"""
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+METRICS = ("total_ms", "sql_ms", "serializer_ms", "queries")
+
+_current = ContextVar("request_metrics", default=None)
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=settings.METRICS_MAX_SAMPLES))
+_counts = defaultdict(int)
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "sql", "serializer", "serializer_depth")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.serializer = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - start
+            self.queries += 1
+
+
+def instrument_serializers():
+    """Time BaseSerializer.data for measured requests (called from AppConfig.ready)."""
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    def timed_data(serializer):
+        metrics = _current.get()
+        if metrics is None or metrics.serializer_depth:
+            return data.fget(serializer)
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer += time.perf_counter() - start
+            metrics.serializer_depth -= 1
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+def record(route, sample):
+    with _lock:
+        _samples[route].append(sample)
+        _counts[route] += 1
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _counts.clear()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def report():
+    """Per-route p50/p95/p99 of each metric, busiest routes first."""
+    with _lock:
+        snapshot = {route: list(samples) for route, samples in _samples.items()}
+        counts = dict(_counts)
+    rows = []
+    for route, samples in snapshot.items():
+        row = {"route": route, "requests": counts[route], "samples": len(samples)}
+        for i, name in enumerate(METRICS):
+            values = sorted(sample[i] for sample in samples)
+            row[name] = {
+                f"p{p}": round(percentile(values, p / 100), 3) for p in (50, 95, 99)
+            }
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row["requests"])
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """Measure sampled requests; keep it near the top of MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        headers = settings.METRICS_HEADERS
+        if not headers and random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        sample = (total * 1000, metrics.sql * 1000, metrics.serializer * 1000, metrics.queries)
+        record(route_name(request), sample)
+        if headers:
+            response["X-Query-Count"] = str(metrics.queries)
+            response["Server-Timing"] = (
+                f"sql;dur={sample[1]:.2f}, serializer;dur={sample[2]:.2f}, total;dur={sample[0]:.2f}"
+            )
+        return response
@@ -0,0 +1,41 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .db_routers import is_pinned, pin_to_primary, replica_reads
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def token_user_id(request):
+    """User id from a valid Bearer access token, without touching the database."""
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    parts = header.split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(parts[1])[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve reads for safe requests from the read replica (see api/db_routers.py),
+    except for users who made a write in the last few seconds.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user_id = token_user_id(request)
+        safe = request.method in SAFE_METHODS
+        use_replica = safe and not (user_id is not None and is_pinned(user_id))
+
+        with replica_reads(use_replica):
+            response = self.get_response(request)
+
+        if not safe and user_id is not None and response.status_code < 400:
+            pin_to_primary(user_id)
+        return response
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_user_index(apps, schema_editor):
+    """Build the FTS5 user index on SQLite, or fill the trigram table elsewhere."""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE api_user_fts USING fts5(username, tokenize='trigram')"
+            )
+        except Exception:
+            # SQLite built without FTS5 (or older than 3.34): use the trigram table.
+            pass
+        else:
+            schema_editor.execute(
+                "INSERT INTO api_user_fts (rowid, username) SELECT id, '^^' || username FROM auth_user"
+            )
+            return
+
+    User = apps.get_model('auth', 'User')
+    UserSearchTrigram = apps.get_model('api', 'UserSearchTrigram')
+    rows = []
+    for user_id, username in User.objects.values_list('id', 'username').iterator():
+        text = '^^' + username.casefold()
+        for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+            rows.append(UserSearchTrigram(user_id=user_id, trigram=trigram))
+    UserSearchTrigram.objects.bulk_create(rows, batch_size=5000)
+
+
+def drop_user_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS api_user_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_trigrams', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('trigram', 'user')},
+            },
+        ),
+        migrations.RunPython(create_user_index, drop_user_index),
+    ]
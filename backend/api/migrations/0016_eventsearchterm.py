@@ -0,0 +1,78 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:34
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+WEIGHTS = {'name': 10, 'details': 1, 'category': 5, 'location': 3}
+
+
+def create_event_index(apps, schema_editor):
+    """Build the FTS5 event index on SQLite, or fill the term table elsewhere."""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE api_event_fts USING fts5("
+                "name, details, category, location, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except Exception:
+            # SQLite built without FTS5: use the term table.
+            pass
+        else:
+            schema_editor.execute(
+                "INSERT INTO api_event_fts (rowid, name, details, category, location) "
+                "SELECT e.id, e.name, e.details, e.category, l.name "
+                "FROM api_event e JOIN api_location l ON l.id = e.location_id"
+            )
+            return
+
+    Event = apps.get_model('api', 'Event')
+    EventSearchTerm = apps.get_model('api', 'EventSearchTerm')
+    rows = []
+    for event in Event.objects.select_related('location').iterator():
+        weights = {}
+        fields = {
+            'name': event.name,
+            'details': event.details,
+            'category': event.category,
+            'location': event.location.name,
+        }
+        for field, text in fields.items():
+            text = unicodedata.normalize('NFKD', text.casefold())
+            text = ''.join(c for c in text if not unicodedata.combining(c))
+            for term in {t[:50] for t in re.findall(r'\w+', text)}:
+                weights[term] = weights.get(term, 0) + WEIGHTS[field]
+        rows.extend(EventSearchTerm(event_id=event.id, term=t, weight=w) for t, w in weights.items())
+    EventSearchTerm.objects.bulk_create(rows, batch_size=5000)
+
+
+def drop_event_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS api_event_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_usersearchtrigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=50)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='api.event')),
+            ],
+            options={
+                'unique_together': {('event', 'term')},
+            },
+        ),
+        migrations.RunPython(create_event_index, drop_event_index),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:45
+
+from django.db import migrations, models
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+BATCH_SIZE = 1000
+
+
+def encode(latitude, longitude, precision=9):
+    """api.geo.encode as of this migration, frozen so later changes can't alter it."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('api', 'Location')
+    locations = (
+        Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .only('latitude', 'longitude')
+        .order_by('pk')
+    )
+    batch = []
+    for location in locations.iterator(chunk_size=BATCH_SIZE):
+        location.geohash = encode(location.latitude, location.longitude)
+        batch.append(location)
+        if len(batch) == BATCH_SIZE:
+            Location.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Location.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_popularsearch_usersearch_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
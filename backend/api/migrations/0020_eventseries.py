@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_claimsuser'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('details', models.TextField()),
+                ('category', models.CharField(choices=[('sporting', 'Sporting'), ('tutoring', 'Tutoring'), ('advising', 'Advising'), ('social', 'Social'), ('academic', 'Academic'), ('cultural', 'Cultural'), ('volunteering', 'Volunteering'), ('career', 'Career'), ('other', 'Other')], default='other', max_length=20)),
+                ('is_public', models.BooleanField(default=True)),
+                ('max_capacity', models.PositiveIntegerField(default=10)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('weekdays', models.CharField(blank=True, max_length=20)),
+                ('until', models.DateTimeField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_series', to=settings.AUTH_USER_MODEL)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_series', to='api.location')),
+            ],
+            options={
+                'ordering': ['start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='api.eventseries'),
+        ),
+        migrations.AddConstraint(
+            model_name='event',
+            constraint=models.UniqueConstraint(fields=('series', 'start_time'), name='unique_series_occurrence'),
+        ),
+    ]
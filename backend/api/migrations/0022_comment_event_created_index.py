@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_calendarfeed_event_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['event', 'created_at', 'id'], name='api_comment_event_i_2e3410_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_comment_replies_reactions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='api_notific_user_id_48bbdc_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_notification_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSearchIndex',
+            fields=[
+                ('event', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='api.event')),
+                ('document', models.TextField(db_column='api_event_fts')),
+            ],
+            options={
+                'db_table': 'api_event_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_eventsearchindex'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventseries',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='event_series', to='api.location'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
@@ -17,6 +17,8 @@ class Location(models.Model):
     name = models.CharField(max_length=100)  # e.g. "Student Union Ballroom"
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Derived from latitude/longitude for spatial queries (see api/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
 
     class Meta:
         unique_together = ("name", "latitude", "longitude")
@@ -24,6 +26,43 @@ class Location(models.Model):
     def __str__(self):
         return self.name
 
+    def normalize(self):
+        """Tidy the name, round coordinates to a fixed precision and set the geohash."""
+        from .locations import normalize_coordinate, normalize_name
+        from .geo import encode
+        self.name = normalize_name(self.name)
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ""
+        else:
+            self.latitude = normalize_coordinate(self.latitude)
+            self.longitude = normalize_coordinate(self.longitude)
+            self.geohash = encode(self.latitude, self.longitude)
+
+    # Stored values remembered so signal handlers can tell which of these a
+    # save changed: events are reindexed and re-dated only when they did
+    TRACKED_FIELDS = ("name", "latitude", "longitude")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        location = super().from_db(db, field_names, values)
+        location._saved = {name: location.__dict__[name] for name in cls.TRACKED_FIELDS if name in location.__dict__}
+        return location
+
+    def has_changed(self, *fields):
+        """Whether any of fields differs from the stored value; True if that is not known."""
+        saved = getattr(self, "_saved", {})
+        return any(name not in saved or saved[name] != getattr(self, name) for name in fields)
+
+    def save(self, *args, **kwargs):
+        """Normalize before saving so equal places compare equal."""
+        self.normalize()
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self._saved = {
+            **getattr(self, "_saved", {}),
+            **{name: getattr(self, name) for name in self.TRACKED_FIELDS if update_fields is None or name in update_fields},
+        }
+
 
 class Event(models.Model):
     CATEGORY_CHOICES = [
@@ -42,6 +81,7 @@ class Event(models.Model):
     details = models.TextField()
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
     posted_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name="events")
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="events")
     is_public = models.BooleanField(default=True)
@@ -49,6 +89,13 @@ class Event(models.Model):
     end_time = models.DateTimeField(default=default_end_time)
     max_capacity = models.PositiveIntegerField(default=10)
     participant_list = models.ManyToManyField(User, related_name="joined_events", blank=True)
+    # Set on events materialized from a recurring series (see api/recurrence.py)
+    series = models.ForeignKey("EventSeries", on_delete=models.SET_NULL, null=True, blank=True, related_name="events")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["series", "start_time"], name="unique_series_occurrence"),
+        ]
 
     def __str__(self):
         return f"{self.name} @ {self.location.name}"
@@ -73,6 +120,64 @@ class Event(models.Model):
         super().save(*args, **kwargs)
 
 
+class EventSeries(models.Model):
+    """
+    A recurring event. Occurrences are computed for a time window and only
+    stored as Events once needed (see api/recurrence.py).
+    """
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+    ]
+
+    name = models.CharField(max_length=50)
+    details = models.TextField()
+    category = models.CharField(max_length=20, choices=Event.CATEGORY_CHOICES, default='other')
+    host = models.ForeignKey(User, on_delete=models.CASCADE, related_name="event_series")
+    # PROTECT: deleting a location must not silently drop the series held there
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name="event_series")
+    is_public = models.BooleanField(default=True)
+    max_capacity = models.PositiveIntegerField(default=10)
+    # The first occurrence; later ones keep its time of day and duration
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='weekly')
+    interval = models.PositiveSmallIntegerField(default=1)  # every n days/weeks
+    weekdays = models.CharField(max_length=20, blank=True)  # weekly: e.g. "0,2" = Mon, Wed
+    until = models.DateTimeField(null=True, blank=True)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['start_time']
+
+    def __str__(self):
+        return f"{self.name} ({self.frequency})"
+
+    def weekday_list(self):
+        return sorted({int(day) for day in self.weekdays.split(",") if day.strip()})
+
+    def occurrences(self, start, end):
+        from .recurrence import occurrences
+        return occurrences(self, start, end)
+
+
+class ClaimsUser(User):
+    """
+    User built from access-token claims (see api/authentication.py).
+    Only id, username and is_active are set; the first access to any other
+    field loads all of them in one query.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     bio = models.TextField(blank=True)
@@ -85,6 +190,22 @@ class Profile(models.Model):
         return self.user.username
 
 
+def new_calendar_token():
+    import secrets
+    return secrets.token_urlsafe(24)
+
+
+class CalendarFeed(models.Model):
+    """Secret token for a user's iCalendar feed (see api/ical.py); rotating it revokes the old URL."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="calendar_feed")
+    token = models.CharField(max_length=64, unique=True, default=new_calendar_token)
+    # Last time an event joined or left the feed (edits are tracked by Event.updated_at)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Calendar feed for {self.user.username}"
+
+
 class JoinRequest(models.Model):
     """Tracks requests to join private events."""
     STATUS_CHOICES = [
@@ -108,18 +229,80 @@ class JoinRequest(models.Model):
 
 
 class Comment(models.Model):
-    """Comments on events."""
+    """
+    Comments on events, and replies to them.
+
+    Replies form a tree under a top-level comment. ``thread`` is that top-level
+    comment, and ``path`` is the zero-padded ids from just below it down to
+    the reply itself (``"0000000012/0000000034/"``), so ordering a thread by
+    path lists it depth first. Top-level comments have no thread and an
+    empty path. ``reaction_counts`` is kept up to date by the reaction views.
+    """
+    PATH_DIGITS = 10
+
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     text = models.TextField()
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies")
+    thread = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    path = models.CharField(max_length=255, blank=True, default="")
+    reaction_counts = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['created_at']  # Oldest first
+        indexes = [
+            # Pages of an event's comments in either direction (see EventCommentListCreate)
+            models.Index(fields=['event', 'created_at', 'id']),
+            # Every reply below a page of top-level comments, in tree order
+            models.Index(fields=['thread', 'path']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} on {self.event.name}: {self.text[:50]}"
+
+    @property
+    def depth(self):
+        """0 for top-level comments, 1 for direct replies, and so on."""
+        return self.path.count("/")
+
+    def save(self, *args, **kwargs):
+        if self.parent_id and not self.path:
+            # The path ends with the reply's own id, which the insert assigns
+            parent = self.parent
+            self.thread_id = parent.thread_id or parent.pk
+            # Together, so a reply is never left with an empty path (which sorts as top-level)
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+                self.path = f"{parent.path}{self.pk:0{self.PATH_DIGITS}d}/"
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+        else:
+            super().save(*args, **kwargs)
+
+
+class CommentReaction(models.Model):
+    """One user's reaction to a comment; the totals are in Comment.reaction_counts."""
+    REACTION_CHOICES = [
+        ('like', 'Like'),
+        ('love', 'Love'),
+        ('laugh', 'Laugh'),
+        ('wow', 'Wow'),
+        ('sad', 'Sad'),
+    ]
+
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="reactions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comment_reactions")
+    kind = models.CharField(max_length=10, choices=REACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["comment", "user", "kind"], name="unique_comment_reaction"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind} comment {self.comment_id}"
   
 
 class FriendRequest(models.Model):
@@ -160,15 +343,74 @@ class UserSearch(models.Model):
     """Model to track user search queries."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="searches")
     query = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the search happened; rows are written later in batches (api/search_log.py)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['user', '-timestamp'])]
 
     def __str__(self):
         return f"{self.user.username} searched for '{self.query}' at {self.timestamp}"
 
 
+class PopularSearch(models.Model):
+    """Running count of how often each (normalized) query was searched."""
+    query = models.CharField(max_length=255, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    last_searched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-count']
+
+    def __str__(self):
+        return f"'{self.query}' x{self.count}"
+
+
+class UserSearchTrigram(models.Model):
+    """Username trigrams used for user search on databases without FTS5."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="search_trigrams")
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('trigram', 'user')
+
+    def __str__(self):
+        return f"{self.trigram} -> {self.user_id}"
+
+
+class EventSearchTerm(models.Model):
+    """Weighted event terms used for event search on databases without FTS5."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="search_terms")
+    term = models.CharField(max_length=50, db_index=True)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('event', 'term')
+
+    def __str__(self):
+        return f"{self.term} -> {self.event_id} ({self.weight})"
+
+
+class EventSearchIndex(models.Model):
+    """
+    The FTS5 event index (api_event_fts, see api/search.py), mapped so queries
+    can join it to events. It only exists on SQLite builds with FTS5 and is
+    written with raw SQL, never through this model.
+    """
+    event = models.OneToOneField(
+        Event, primary_key=True, db_column="rowid", db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name="search_index",
+    )
+    # FTS5's hidden column named after the table: ``= query`` is a MATCH and
+    # it is the first argument of bm25()
+    document = models.TextField(db_column="api_event_fts")
+
+    class Meta:
+        managed = False
+        db_table = "api_event_fts"
+
+
 class Message(models.Model):
     """Direct messages between users."""
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
@@ -204,6 +446,8 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # A user's newest notifications (NotificationListView) and retention scans
+        indexes = [models.Index(fields=['user', '-created_at'])]
 
     def __str__(self):
         return f"{self.notification_type} for {self.user.username}"
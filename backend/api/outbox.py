@@ -0,0 +1,139 @@
+"""
+Notification outbox.
+
+Views call ``notify()`` to queue a notification intent; nothing is written
+on the request path. Intents are buffered (see api/buffers.py) and written
+in batches, after a response or by the server's flusher thread, so a
+notification appears up to NOTIFICATION_FLUSH_INTERVAL + BUFFER_FLUSH_INTERVAL
+seconds (about three by default) after the request that caused it; sooner when
+NOTIFICATION_BATCH_SIZE intents pile up. At flush time:
+
+- intents for the same recipient, kind and event are coalesced into one
+  notification ("alice, bob and 3 others requested to join 'Pickup soccer'"),
+  and repeats by the same actor count once;
+- ``notify_participants()`` queues a single intent for a whole event, which
+  is expanded to one notification per participant here rather than in the
+  request, so an edit to a crowded event costs the host no more than any
+  other; repeated edits coalesce into one list of changes;
+- recipients who were deleted, or turned notifications off in their
+  profile, and events that were deleted in the meantime, are skipped;
+- the rest are bulk-inserted in one statement per batch.
+
+Like the search history, queued notifications are lost if the process is
+killed before a flush.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+
+from .buffers import BatchBuffer
+from .models import Event, Notification
+
+# kind: (Notification.notification_type, message template)
+KINDS = {
+    "join_requested": ("join_request", "{actors} requested to join '{event}'"),
+    "join_approved": ("join_request", "Your request to join '{event}' was approved"),
+    "join_denied": ("join_request", "Your request to join '{event}' was denied"),
+    "friend_requested": ("friend_request", "{actors} sent you a friend request"),
+    "friend_accepted": ("friend_request", "{actors} accepted your friend request"),
+    "event_updated": ("event_update", "'{event}' was updated: {changes}"),
+}
+
+# Kinds that notify_participants() fans out to an event's participants
+PARTICIPANT_KINDS = {"event_updated"}
+
+# Actors named in a coalesced message before "and N others"
+NAMED_ACTORS = 2
+
+
+def describe_actors(actors):
+    if len(actors) <= NAMED_ACTORS:
+        return " and ".join(actors)
+    others = len(actors) - NAMED_ACTORS
+    return f"{', '.join(actors[:NAMED_ACTORS])} and {others} other{'s' if others > 1 else ''}"
+
+
+def coalesce(items):
+    """Group intents by (recipient, kind, event), keeping the distinct actors in order."""
+    groups = {}
+    for user_id, kind, event_id, actor in items:
+        actors = groups.setdefault((user_id, kind, event_id), [])
+        if actor and actor not in actors:
+            actors.append(actor)
+    return groups
+
+
+def expand_participants(groups):
+    """Replace event-wide groups (recipient None) with one group per participant, host excluded."""
+    fan_out = {key: actors for key, actors in groups.items() if key[0] is None}
+    if not fan_out:
+        return groups
+    groups = {key: actors for key, actors in groups.items() if key[0] is not None}
+    Participant = Event.participant_list.through
+    participants = (
+        Participant.objects.filter(event_id__in={event_id for _, _, event_id in fan_out})
+        .exclude(user_id=F("event__host_id"))
+        .values_list("event_id", "user_id")
+    )
+    kinds = {}
+    for _, kind, event_id in fan_out:
+        kinds.setdefault(event_id, []).append(kind)
+    for event_id, user_id in participants:
+        for kind in kinds[event_id]:
+            actors = groups.setdefault((user_id, kind, event_id), [])
+            actors.extend(a for a in fan_out[(None, kind, event_id)] if a not in actors)
+    return groups
+
+
+def write_notifications(items):
+    """Flush function for the notification buffer."""
+    groups = expand_participants(coalesce(items))
+    recipients = set(
+        User.objects.filter(id__in={user_id for user_id, _, _ in groups})
+        .exclude(profile__notifications_enabled=False)
+        .values_list("id", flat=True)
+    )
+    event_names = dict(
+        Event.objects.filter(id__in={event_id for _, _, event_id in groups if event_id})
+        .values_list("id", "name")
+    )
+
+    notifications = []
+    for (user_id, kind, event_id), actors in groups.items():
+        if user_id not in recipients or (event_id and event_id not in event_names):
+            continue
+        notification_type, template = KINDS[kind]
+        notifications.append(Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            event_id=event_id,
+            message=template.format(
+                actors=describe_actors(actors), changes=", ".join(actors), event=event_names.get(event_id, ""),
+            ),
+        ))
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications, batch_size=settings.NOTIFICATION_BATCH_SIZE)
+
+
+notification_buffer = BatchBuffer(
+    "notification",
+    write_notifications,
+    max_size=settings.NOTIFICATION_BATCH_SIZE,
+    max_age=settings.NOTIFICATION_FLUSH_INTERVAL,
+)
+
+
+def notify(user_id, kind, event_id=None, actor=None):
+    """Queue a notification for user_id; never touches the database."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown notification kind: {kind}")
+    notification_buffer.add((user_id, kind, event_id, actor))
+
+
+def notify_participants(event_id, kind, details=()):
+    """Queue a notification for every participant of an event; details are coalesced like actors."""
+    if kind not in PARTICIPANT_KINDS:
+        raise ValueError(f"Not a participant notification kind: {kind}")
+    for detail in details or (None,):
+        notification_buffer.add((None, kind, event_id, detail))
@@ -0,0 +1,149 @@
+"""
+Recurring event series.
+
+An EventSeries stores its first occurrence and a rule (daily or weekly, every
+``interval`` days/weeks, optionally on several weekdays, ending after
+``count`` occurrences or at ``until``). As in RFC 5545, the first occurrence
+counts even when it falls on a weekday outside the rule. Occurrences keep the
+local wall-clock time of the first one across daylight-saving changes.
+
+Occurrences are computed for a query window and become Event rows when
+materialized: those in the next EVENT_SERIES_MATERIALIZE_DAYS days when a
+series is created and by the daily ``materialize_series`` command, so they
+show up in the event list, search, the map and calendar feeds like any other
+event, and further ones on demand, e.g. so people can join one.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import clusters, search
+from .models import Event
+
+
+def _rule(series, tz):
+    """
+    (first local start, anchor date, period in days, day offsets, offsets
+    skipped in period 0, whether the first start is outside the offsets).
+    """
+    first = timezone.localtime(series.start_time, tz)
+    if series.frequency == "weekly":
+        anchor = first.date() - timedelta(days=first.weekday())
+        period = 7 * series.interval
+        offsets = series.weekday_list() or [first.weekday()]
+    else:
+        anchor = first.date()
+        period = series.interval
+        offsets = [0]
+    first_offset = (first.date() - anchor).days
+    skipped = sum(1 for offset in offsets if offset < first_offset)
+    return first, anchor, period, offsets, skipped, first_offset not in offsets
+
+
+def occurrences(series, window_start, window_end):
+    """Yield (start, end) of each occurrence starting in [window_start, window_end)."""
+    tz = timezone.get_current_timezone()
+    first, anchor, period, offsets, skipped, extra_first = _rule(series, tz)
+    duration = series.end_time - series.start_time
+
+    # An off-rule first start is occurrence 0 and the rule's numbering starts at 1
+    extra = 1 if extra_first else 0
+    if extra_first and series.count != 0 and window_start <= series.start_time < window_end:
+        yield series.start_time, series.end_time
+
+    # Jump straight to the period containing the window start
+    start_day = timezone.localtime(max(window_start, series.start_time), tz).date()
+    k = max(0, (start_day - anchor).days // period)
+    while True:
+        for i, offset in enumerate(offsets):
+            number = k * len(offsets) + i - skipped + extra
+            if number < extra:
+                continue
+            if series.count is not None and number >= series.count:
+                return
+            day = anchor + timedelta(days=k * period + offset)
+            start = timezone.make_aware(datetime.combine(day, first.time()), tz)
+            if start >= window_end or (series.until and start > series.until):
+                return
+            if start >= window_start:
+                yield start, start + duration
+        k += 1
+
+
+def is_occurrence(series, start_time):
+    return any(start == start_time for start, _ in occurrences(series, start_time, start_time + timedelta(seconds=1)))
+
+
+def materialize(series, start_time):
+    """
+    The Event for the occurrence starting at start_time, creating it on first
+    use. Returns (event, created); raises ValueError if there is no such occurrence.
+    """
+    if not is_occurrence(series, start_time):
+        raise ValueError("Not an occurrence of this series.")
+    event = Event.objects.filter(series=series, start_time=start_time).first()
+    if event:
+        return event, False
+    try:
+        with transaction.atomic():
+            event = occurrence_event(series, start_time)
+            event.save()
+    except IntegrityError:
+        # Materialized concurrently
+        return Event.objects.get(series=series, start_time=start_time), False
+    return event, True
+
+
+def occurrence_event(series, start_time):
+    """An unsaved Event for the occurrence starting at start_time."""
+    return Event(
+        series=series,
+        host_id=series.host_id,
+        location=series.location,  # the search index reads its name
+        name=series.name,
+        details=series.details,
+        category=series.category,
+        is_public=series.is_public,
+        max_capacity=series.max_capacity,
+        start_time=start_time,
+        end_time=start_time + (series.end_time - series.start_time),
+    )
+
+
+def materialize_upcoming(series_list, days=None):
+    """
+    Store every occurrence of the given series starting in the next ``days``
+    days (default EVENT_SERIES_MATERIALIZE_DAYS) that is not an Event yet.
+    Returns the number of events created.
+    """
+    days = settings.EVENT_SERIES_MATERIALIZE_DAYS if days is None else days
+    series_list = list(series_list)
+    start = timezone.now()
+    end = start + timedelta(days=days)
+    stored = set(
+        Event.objects.filter(series__in=series_list, start_time__gte=start, start_time__lt=end)
+        .values_list("series_id", "start_time")
+    )
+    missing = [
+        (series, occurrence_start)
+        for series in series_list
+        for occurrence_start, _ in series.occurrences(start, end)
+        if (series.pk, occurrence_start) not in stored
+    ]
+    if not missing:
+        return 0
+    try:
+        # bulk_create skips the post_save signals, so index and invalidate here
+        with transaction.atomic():
+            events = Event.objects.bulk_create(
+                (occurrence_event(series, occurrence_start) for series, occurrence_start in missing),
+                batch_size=1000,
+            )
+            search.index_events(events)
+    except IntegrityError:
+        # Some were materialized concurrently; go one by one
+        return sum(materialize(series, occurrence_start)[1] for series, occurrence_start in missing)
+    clusters.invalidate()
+    return len(events)
@@ -0,0 +1,364 @@
+"""
+Indexed user and event search.
+
+On SQLite builds with FTS5 the indexes are virtual tables whose rowid is the
+indexed object's id: ``api_user_fts`` (trigram tokenizer) and
+``api_event_fts`` (word tokenizer). Other databases use the
+``UserSearchTrigram`` and ``EventSearchTerm`` tables, which are filled in
+Python.
+
+Usernames are indexed with a ``^^`` prefix so that both backends share the
+same semantics: queries of one or two characters match the start of a
+username, longer queries match anywhere in it. Event queries match every
+word as a prefix of a word in the event's name, details, category or
+location name.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import (
+    Case, Count, Exists, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length
+
+from .models import Event, EventSearchTerm, Friendship, UserSearchTrigram
+
+USER_FTS_TABLE = "api_user_fts"
+EVENT_FTS_TABLE = "api_event_fts"
+PREFIX_MARK = "^^"
+
+# Relative importance of each event field, in api_event_fts column order.
+EVENT_FIELD_WEIGHTS = {"name": 10, "details": 1, "category": 5, "location": 3}
+MAX_QUERY_TERMS = 8
+
+_fts_tables = {}
+
+
+def has_fts_table(table, conn=None):
+    """Return True if the FTS5 ``table`` exists on the given connection."""
+    conn = conn or connection
+    if conn.vendor != "sqlite":
+        return False
+    key = (conn.alias, str(conn.settings_dict["NAME"]), table)
+    if key not in _fts_tables:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table]
+            )
+            _fts_tables[key] = cursor.fetchone() is not None
+    return _fts_tables[key]
+
+
+def trigrams(username):
+    """Return the set of indexed trigrams for a username."""
+    text = PREFIX_MARK + username.casefold()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _search_text(query):
+    """Text to look up in the index for a query (short queries are prefixes)."""
+    query = query.casefold()
+    return PREFIX_MARK + query if len(query) < 3 else query
+
+
+def _query_trigrams(query):
+    text = _search_text(query)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fts_phrase(text):
+    """Quote text as a single FTS5 phrase."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+# -------------------------------
+# Index maintenance
+# -------------------------------
+
+def index_user(user):
+    """Add or refresh one user in the search index. Skips unchanged usernames."""
+    if has_fts_table(USER_FTS_TABLE):
+        indexed = PREFIX_MARK + user.username
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT username FROM {USER_FTS_TABLE} WHERE rowid = %s", [user.pk])
+            row = cursor.fetchone()
+            if row and row[0] == indexed:
+                return
+            if row:
+                cursor.execute(f"DELETE FROM {USER_FTS_TABLE} WHERE rowid = %s", [user.pk])
+            cursor.execute(
+                f"INSERT INTO {USER_FTS_TABLE} (rowid, username) VALUES (%s, %s)",
+                [user.pk, indexed],
+            )
+        return
+
+    wanted = trigrams(user.username)
+    existing = set(UserSearchTrigram.objects.filter(user=user).values_list("trigram", flat=True))
+    if existing == wanted:
+        return
+    UserSearchTrigram.objects.filter(user=user, trigram__in=existing - wanted).delete()
+    UserSearchTrigram.objects.bulk_create(
+        [UserSearchTrigram(user=user, trigram=t) for t in wanted - existing]
+    )
+
+
+def index_users(users, batch_size=5000):
+    """Bulk-index freshly created users (no existing index rows expected)."""
+    if has_fts_table(USER_FTS_TABLE):
+        rows = [(u.pk, PREFIX_MARK + u.username) for u in users]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {USER_FTS_TABLE} (rowid, username) VALUES (%s, %s)", rows
+            )
+        return
+    UserSearchTrigram.objects.bulk_create(
+        (UserSearchTrigram(user_id=u.pk, trigram=t) for u in users for t in trigrams(u.username)),
+        batch_size=batch_size,
+    )
+
+
+def unindex_user(user_id):
+    """Remove a user from the index (trigram rows also cascade on delete)."""
+    if has_fts_table(USER_FTS_TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {USER_FTS_TABLE} WHERE rowid = %s", [user_id])
+
+
+def rebuild_user_index(batch_size=5000):
+    """Rebuild the whole user index from auth_user."""
+    if has_fts_table(USER_FTS_TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {USER_FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {USER_FTS_TABLE} (rowid, username) "
+                f"SELECT id, %s || username FROM auth_user",
+                [PREFIX_MARK],
+            )
+        return
+    UserSearchTrigram.objects.all().delete()
+    users = User.objects.only("id", "username").iterator(chunk_size=batch_size)
+    batch = []
+    for user in users:
+        batch.append(user)
+        if len(batch) >= batch_size:
+            index_users(batch, batch_size)
+            batch = []
+    if batch:
+        index_users(batch, batch_size)
+
+
+# -------------------------------
+# Querying
+# -------------------------------
+
+def matching_user_ids(query):
+    """Expression selecting the ids of users whose username matches query."""
+    if has_fts_table(USER_FTS_TABLE):
+        return RawSQL(
+            f"SELECT rowid FROM {USER_FTS_TABLE} WHERE {USER_FTS_TABLE} MATCH %s",
+            [fts_phrase(_search_text(query))],
+        )
+    grams = _query_trigrams(query)
+    # Every trigram must be present; the icontains check in search_users
+    # then drops users whose trigrams match out of order.
+    return (
+        UserSearchTrigram.objects.filter(trigram__in=grams)
+        .values("user_id")
+        .annotate(hits=Count("trigram", distinct=True))
+        .filter(hits=len(grams))
+        .values("user_id")
+    )
+
+
+def friend_ids_for(user):
+    """Ids of all friends of user."""
+    ids = set(Friendship.objects.filter(user1=user).values_list("user2_id", flat=True))
+    ids.update(Friendship.objects.filter(user2=user).values_list("user1_id", flat=True))
+    return ids
+
+
+def _ranked(queryset, query):
+    """Exact matches first, then prefix matches, then shorter usernames."""
+    return queryset.annotate(
+        match_rank=Case(
+            When(username__iexact=query, then=Value(0)),
+            When(username__istartswith=query, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+        name_length=Length("username"),
+    ).order_by("match_rank", "name_length", "username")
+
+
+def search_users(query, user=None, limit=None, offset=0):
+    """
+    Search usernames through the index.
+
+    Friends of ``user`` are ranked before everyone else and ``user`` itself is
+    excluded. Returns at most ``limit`` users starting at ``offset``.
+    """
+    limit = limit or settings.USER_SEARCH_PAGE_SIZE
+    query = query.strip()
+    if not query:
+        return []
+
+    if len(query) < 3:
+        text_match = Q(username__istartswith=query)
+    else:
+        text_match = Q(username__icontains=query)
+    matches = User.objects.filter(text_match, id__in=matching_user_ids(query)).only("id", "username", "email")
+
+    friend_ids = set()
+    if user is not None:
+        matches = matches.exclude(id=user.id)
+        friend_ids = friend_ids_for(user)
+
+    friends = list(_ranked(matches.filter(id__in=friend_ids), query)) if friend_ids else []
+    results = friends[offset:offset + limit]
+
+    remaining = limit - len(results)
+    if remaining > 0:
+        others_offset = max(offset - len(friends), 0)
+        others = _ranked(matches.exclude(id__in=friend_ids), query)
+        results.extend(others[others_offset:others_offset + remaining])
+    return results
+
+
+# -------------------------------
+# Event search
+# -------------------------------
+
+def terms(text):
+    """Lower-case words of text with accents removed."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t[:50] for t in re.findall(r"\w+", text)]
+
+
+def _event_fields(event):
+    return {
+        "name": event.name,
+        "details": event.details,
+        "category": event.category,
+        "location": event.location.name,
+    }
+
+
+def _weighted_terms(event):
+    weights = {}
+    for field, text in _event_fields(event).items():
+        for term in set(terms(text)):
+            weights[term] = weights.get(term, 0) + EVENT_FIELD_WEIGHTS[field]
+    return weights
+
+
+def _insert_event_fts(cursor, events):
+    cursor.executemany(
+        f"INSERT INTO {EVENT_FTS_TABLE} (rowid, name, details, category, location) "
+        f"VALUES (%s, %s, %s, %s, %s)",
+        [(e.pk, *_event_fields(e).values()) for e in events],
+    )
+
+
+def index_event(event):
+    """Add or refresh one event in the search index."""
+    if has_fts_table(EVENT_FTS_TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {EVENT_FTS_TABLE} WHERE rowid = %s", [event.pk])
+            _insert_event_fts(cursor, [event])
+        return
+    EventSearchTerm.objects.filter(event=event).delete()
+    EventSearchTerm.objects.bulk_create(
+        [EventSearchTerm(event=event, term=t, weight=w) for t, w in _weighted_terms(event).items()]
+    )
+
+
+def index_events(events, batch_size=5000):
+    """Bulk-index freshly created events (no existing index rows expected)."""
+    if has_fts_table(EVENT_FTS_TABLE):
+        with connection.cursor() as cursor:
+            _insert_event_fts(cursor, events)
+        return
+    EventSearchTerm.objects.bulk_create(
+        (
+            EventSearchTerm(event_id=e.pk, term=t, weight=w)
+            for e in events
+            for t, w in _weighted_terms(e).items()
+        ),
+        batch_size=batch_size,
+    )
+
+
+def unindex_event(event_id):
+    """Remove an event from the index (term rows also cascade on delete)."""
+    if has_fts_table(EVENT_FTS_TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {EVENT_FTS_TABLE} WHERE rowid = %s", [event_id])
+
+
+def reindex_location_events(location):
+    """Refresh the events of a location after it was renamed."""
+    for event in location.events.select_related("location"):
+        index_event(event)
+
+
+def rebuild_event_index(batch_size=5000):
+    """Rebuild the whole event index."""
+    if has_fts_table(EVENT_FTS_TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {EVENT_FTS_TABLE}")
+    else:
+        EventSearchTerm.objects.all().delete()
+    events = Event.objects.select_related("location").iterator(chunk_size=batch_size)
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) >= batch_size:
+            index_events(batch, batch_size)
+            batch = []
+    if batch:
+        index_events(batch, batch_size)
+
+
+def _fts_event_query(query_terms):
+    return " ".join(fts_phrase(t) + "*" for t in query_terms)
+
+
+def search_events(queryset, query):
+    """
+    Narrow an Event queryset to events matching every word of query.
+
+    Adds a ``search_rank`` annotation where a lower value is a better match;
+    the caller decides how to combine it with its own ordering.
+    """
+    query_terms = terms(query)[:MAX_QUERY_TERMS]
+    if not query_terms:
+        return queryset.none()
+
+    if has_fts_table(EVENT_FTS_TABLE):
+        weights = [Value(float(w)) for w in EVENT_FIELD_WEIGHTS.values()]
+        # A join rather than a correlated subquery: bm25() in a subquery
+        # re-runs the MATCH for every event and becomes quadratic.
+        return queryset.filter(search_index__document=_fts_event_query(query_terms)).annotate(
+            search_rank=Func("search_index__document", *weights, function="bm25", output_field=FloatField()),
+        )
+
+    for term in query_terms:
+        queryset = queryset.filter(
+            Exists(EventSearchTerm.objects.filter(event=OuterRef("pk"), term__startswith=term))
+        )
+    prefix_match = Q()
+    for term in query_terms:
+        prefix_match |= Q(term__startswith=term)
+    score = (
+        EventSearchTerm.objects.filter(prefix_match, event=OuterRef("pk"))
+        .values("event")
+        .annotate(total=Sum("weight"))
+        .values("total")
+    )
+    # Negated so that, as with bm25, lower is better.
+    return queryset.annotate(search_rank=-Subquery(score, output_field=FloatField()))
@@ -0,0 +1,108 @@
+"""
+Search history.
+
+Searches are buffered in memory and written in batches after responses have
+been sent (see api/buffers.py), so logging a search costs a list append on
+the request path. Each flush bulk-inserts ``UserSearch`` rows and adds to the
+``PopularSearch`` counters.
+
+Popular searches are shown to every user, so ``popular_searches`` only
+returns queries searched at least POPULAR_SEARCH_MIN_COUNT times and never
+one that is a username: most searches are for people.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .buffers import BatchBuffer
+from .models import PopularSearch, UserSearch
+
+# Queries typed this close together by the same user count as one search.
+KEYSTROKE_WINDOW_SECONDS = 30
+
+
+def normalize_query(query):
+    return " ".join(query.split()).casefold()[:255]
+
+
+def collapse_keystrokes(items):
+    """
+    Keep only the final query of each typing burst.
+
+    Search-as-you-type sends "fr", "fre", "fred"; when a user's next query
+    extends or shortens the previous one within the keystroke window, the
+    previous one is dropped.
+    """
+    last_by_user = {}
+    kept = []
+    for item in items:
+        user_id, query, searched_at = item
+        previous = last_by_user.get(user_id)
+        if previous is not None:
+            prev_query, prev_at = kept[previous][1], kept[previous][2]
+            same_burst = (searched_at - prev_at).total_seconds() <= KEYSTROKE_WINDOW_SECONDS
+            if same_burst and (query.startswith(prev_query) or prev_query.startswith(query)):
+                kept[previous] = None
+        last_by_user[user_id] = len(kept)
+        kept.append(item)
+    return [item for item in kept if item is not None]
+
+
+def write_searches(items):
+    """Flush function for the search buffer."""
+    items = collapse_keystrokes(items)
+    # Users may have been deleted since they searched
+    live_ids = set(
+        User.objects.filter(id__in={user_id for user_id, _, _ in items}).values_list("id", flat=True)
+    )
+    items = [item for item in items if item[0] in live_ids]
+    if not items:
+        return
+
+    counts = Counter(query for _, query, _ in items)
+    last_seen = {query: searched_at for _, query, searched_at in items}
+
+    with transaction.atomic():
+        UserSearch.objects.bulk_create(
+            UserSearch(user_id=user_id, query=query, timestamp=searched_at)
+            for user_id, query, searched_at in items
+        )
+        # New queries start at zero and are counted below with the rest; another
+        # process may insert the same query first, so its row is re-read too
+        PopularSearch.objects.bulk_create(
+            [PopularSearch(query=query, count=0, last_searched_at=last_seen[query]) for query in counts],
+            ignore_conflicts=True,
+        )
+        counters = PopularSearch.objects.select_for_update().in_bulk(list(counts), field_name="query")
+        for query, popular in counters.items():
+            popular.count = F("count") + counts[query]
+            popular.last_searched_at = max(popular.last_searched_at, last_seen[query])
+        PopularSearch.objects.bulk_update(counters.values(), ["count", "last_searched_at"])
+
+
+search_buffer = BatchBuffer(
+    "search history",
+    write_searches,
+    max_size=settings.SEARCH_LOG_BATCH_SIZE,
+    max_age=settings.SEARCH_LOG_FLUSH_INTERVAL,
+)
+
+
+def popular_searches(limit=10):
+    """The most searched queries that are safe to show to everyone."""
+    is_username = User.objects.filter(username__iexact=OuterRef("query"))
+    return (
+        PopularSearch.objects.filter(count__gte=settings.POPULAR_SEARCH_MIN_COUNT)
+        .exclude(Exists(is_username))[:limit]
+    )
+
+
+def record_search(user, query):
+    """Queue a search for the history tables; never touches the database."""
+    query = normalize_query(query)
+    if query:
+        search_buffer.add((user.id, query, timezone.now()))
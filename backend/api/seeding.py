@@ -0,0 +1,169 @@
+"""
+Synthetic campus-scale data for benchmarks (seed_benchmark, benchmark_endpoints).
+
+Everything is written with bulk_create in batches; since that skips the
+post_save signals, profiles and search index rows are created here too.
+Generated users are named ``bench_<n>`` so they are easy to find and clear.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import clusters, search
+from .models import (
+    Comment, Event, Friendship, JoinRequest, Location, Message, Notification, Profile,
+)
+
+USERNAME_PREFIX = "bench_"
+PASSWORD = "benchmark"
+
+# Sizes at scale 1; per-user and per-event figures are averages
+BASE_SIZES = {
+    "users": 5_000,
+    "locations": 200,
+    "events": 2_000,
+    "friends_per_user": 10,
+    "participants_per_event": 8,
+    "join_requests_per_private_event": 3,
+    "comments_per_event": 5,
+    "messages_per_user": 10,
+    "notifications_per_user": 10,
+}
+
+# Around UNC Charlotte, like the geo benchmark
+CENTER = (35.3071, -80.7352)
+SPREAD_DEGREES = 0.02
+WORDS = ["study", "group", "calculus", "soccer", "pickup", "career", "fair", "resume",
+         "club", "meeting", "tutoring", "chemistry", "open", "mic", "night", "volunteer"]
+
+
+def sizes_for(scale):
+    return {
+        name: max(1, round(value * scale)) if name in ("users", "locations", "events") else value
+        for name, value in BASE_SIZES.items()
+    }
+
+
+def clear():
+    """Delete previously seeded data (events, messages etc. cascade from users)."""
+    User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+    Location.objects.filter(name__startswith="Bench ").delete()
+    clusters.invalidate()
+
+
+def seed_dataset(scale=1.0, seed=42, batch_size=5_000, log=lambda message: None):
+    """Create the dataset and return the number of rows per model."""
+    rng = random.Random(seed)
+    sizes = sizes_for(scale)
+    now = timezone.now()
+    counts = {}
+
+    password = make_password(PASSWORD)
+    offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    users = User.objects.bulk_create(
+        (User(username=f"{USERNAME_PREFIX}{offset + n}", password=password) for n in range(sizes["users"])),
+        batch_size=batch_size,
+    )
+    Profile.objects.bulk_create((Profile(user=u) for u in users), batch_size=batch_size)
+    search.index_users(users, batch_size)
+    user_ids = [u.pk for u in users]
+    counts["users"] = len(users)
+    log(f"{len(users)} users")
+
+    locations = []
+    for n in range(sizes["locations"]):
+        location = Location(
+            name=f"Bench {rng.choice(WORDS).title()} Hall {n}",
+            latitude=CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+            longitude=CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        )
+        location.normalize()
+        locations.append(location)
+    locations = Location.objects.bulk_create(locations, batch_size=batch_size)
+    counts["locations"] = len(locations)
+
+    # Friendships: random pairs, stored once with user1 < user2
+    pairs = set()
+    target = sizes["users"] * sizes["friends_per_user"] // 2
+    if len(user_ids) > 1:
+        target = min(target, len(user_ids) * (len(user_ids) - 1) // 2)
+        while len(pairs) < target:
+            a, b = rng.sample(user_ids, 2)
+            pairs.add((min(a, b), max(a, b)))
+    Friendship.objects.bulk_create(
+        (Friendship(user1_id=a, user2_id=b) for a, b in pairs), batch_size=batch_size,
+    )
+    counts["friendships"] = len(pairs)
+
+    categories = [key for key, _ in Event.CATEGORY_CHOICES]
+    events = []
+    for n in range(sizes["events"]):
+        start = now + timedelta(hours=rng.randint(-24 * 30, 24 * 60))
+        events.append(Event(
+            name=" ".join(rng.sample(WORDS, 3)).title()[:50],
+            details=" ".join(rng.choices(WORDS, k=25)),
+            category=rng.choice(categories),
+            host_id=rng.choice(user_ids),
+            location=rng.choice(locations),
+            is_public=rng.random() < 0.8,
+            start_time=start,
+            end_time=start + timedelta(hours=rng.choice([1, 2, 3])),
+            max_capacity=rng.choice([10, 20, 50, 100]),
+        ))
+    events = Event.objects.bulk_create(events, batch_size=batch_size)
+    search.index_events(events, batch_size)
+    counts["events"] = len(events)
+    log(f"{len(events)} events")
+
+    Through = Event.participant_list.through
+    participants = [
+        Through(event_id=e.pk, user_id=u)
+        for e in events
+        for u in rng.sample(user_ids, min(len(user_ids), rng.randint(0, 2 * sizes["participants_per_event"])))
+    ]
+    Through.objects.bulk_create(participants, batch_size=batch_size)
+    counts["participants"] = len(participants)
+
+    join_requests = [
+        JoinRequest(event_id=e.pk, user_id=u, status=rng.choice(["pending", "pending", "approved", "denied"]))
+        for e in events if not e.is_public
+        for u in rng.sample(user_ids, min(len(user_ids), sizes["join_requests_per_private_event"]))
+    ]
+    JoinRequest.objects.bulk_create(join_requests, batch_size=batch_size, ignore_conflicts=True)
+    counts["join_requests"] = len(join_requests)
+
+    comments = [
+        Comment(event_id=e.pk, user_id=rng.choice(user_ids), text=" ".join(rng.choices(WORDS, k=8)))
+        for e in events
+        for _ in range(rng.randint(0, 2 * sizes["comments_per_event"]))
+    ]
+    Comment.objects.bulk_create(comments, batch_size=batch_size)
+    counts["comments"] = len(comments)
+
+    # Messages mostly between friends, in both directions
+    pair_list = sorted(pairs)
+    messages = []
+    for _ in range(sizes["users"] * sizes["messages_per_user"] if pair_list else 0):
+        a, b = rng.choice(pair_list)
+        sender, recipient = (a, b) if rng.random() < 0.5 else (b, a)
+        messages.append(Message(sender_id=sender, recipient_id=recipient,
+                                content=" ".join(rng.choices(WORDS, k=6)), read=rng.random() < 0.7))
+    Message.objects.bulk_create(messages, batch_size=batch_size)
+    counts["messages"] = len(messages)
+
+    notification_types = [key for key, _ in Notification.NOTIFICATION_TYPES]
+    notifications = [
+        Notification(user_id=u, notification_type=rng.choice(notification_types),
+                     message="Something happened", event_id=rng.choice(events).pk,
+                     is_read=rng.random() < 0.5)
+        for u in user_ids
+        for _ in range(rng.randint(0, 2 * sizes["notifications_per_user"]))
+    ]
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    counts["notifications"] = len(notifications)
+
+    clusters.invalidate()
+    return counts
@@ -1,12 +1,28 @@
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from .models import Event, Location, Profile, JoinRequest, Comment, FriendRequest, Message, Notification
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .models import Event, EventSeries, Location, Profile, JoinRequest, Comment, FriendRequest, Message, Notification, UserSearch, PopularSearch
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.utils import timezone
 
 
 # --- USER SERIALIZERS ---
 
+def apply_user_changes(user, username=None, password=None):
+    """Set a new username/password on user; returns the fields that changed."""
+    changed = []
+    if username and username != user.username:
+        user.username = username
+        changed.append("username")
+    if password:
+        user.set_password(password)
+        changed.append("password")
+    return changed
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Used for user registration and updates."""
     class Meta:
@@ -15,17 +31,19 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def update(self, instance, validated_data):
-        """Handling for password change."""
+        """Handling for password change (one write for all changes)."""
         password = validated_data.pop("password", None)
-        user = super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
         if password:
-            user.set_password(password)
-            user.save()
-        return user
+            instance.set_password(password)
+        instance.save()
+        return instance
 
     def create(self, validated_data):
-        """Automatically hashes the password."""
-        user = User.objects.create_user(**validated_data)
+        """Automatically hashes the password; the profile is created in the same transaction."""
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
         return user
     
 class NestedUserSerializer(serializers.ModelSerializer):
@@ -41,16 +59,11 @@ class NestedUserSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         """Only update fields that are actually passed in."""
-        username = validated_data.get("username", None)
-        password = validated_data.get("password", None)
-
-        if username is not None:
-            instance.username = username
-
-        if password:
-            instance.set_password(password)
-
-        instance.save()
+        changed = apply_user_changes(
+            instance, validated_data.get("username"), validated_data.get("password")
+        )
+        if changed:
+            instance.save(update_fields=changed)
         return instance
 
 
@@ -61,16 +74,55 @@ class SafeUserSerializer(serializers.ModelSerializer):
         fields = ["id", "username"]
 
 
+# --- TOKEN SERIALIZERS ---
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims StatelessJWTAuthentication checks (see api/authentication.py)."""
+
+    @classmethod
+    def get_token(cls, user):
+        from .authentication import add_identity_claims
+        return add_identity_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to refresh tokens revoked by a password change or deactivation."""
+
+    def validate(self, attrs):
+        from .authentication import VERSION_CLAIM, cached_identity
+        refresh = self.token_class(attrs["refresh"])
+        version = refresh.payload.get(VERSION_CLAIM)
+        if version is not None:
+            identity = cached_identity(refresh.payload.get(api_settings.USER_ID_CLAIM))
+            if identity is None or identity["version"] != version:
+                raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return super().validate(attrs)
+
+
 # --- LOCATION SERIALIZER ---
 
 class LocationSerializer(serializers.ModelSerializer):
+    # Metres from the ?near= point, only set on nearby queries
+    distance = serializers.SerializerMethodField()
+
     class Meta:
         model = Location
         fields = "__all__"
 
+    def get_distance(self, obj):
+        distance = getattr(obj, "distance", None)
+        return round(distance, 1) if distance is not None else None
+
 
 # --- EVENT SERIALIZER ---
 
+class CommentPreviewSerializer(serializers.Serializer):
+    """The start of an event's latest comment, shown in the feed."""
+    text = serializers.CharField()
+    username = serializers.CharField()
+    created_at = serializers.DateTimeField()
+
+
 class EventSerializer(serializers.ModelSerializer):
     """Handles safe event serialization and creation."""
     
@@ -79,6 +131,8 @@ class EventSerializer(serializers.ModelSerializer):
     host_details = SafeUserSerializer(source="host", read_only=True)
     participant_list = SafeUserSerializer(many=True, read_only=True)
     is_expired = serializers.SerializerMethodField()
+    comment_count = serializers.SerializerMethodField()
+    latest_comment = serializers.SerializerMethodField()
 
     # Write-only IDs for linking (host_id removed for security - host auto-set from request.user)
     location_id = serializers.PrimaryKeyRelatedField(
@@ -104,6 +158,8 @@ class EventSerializer(serializers.ModelSerializer):
             "host_details",
             "location_id",
             "is_expired",
+            "comment_count",
+            "latest_comment",
         ]
         read_only_fields = ["posted_date"]
 
@@ -111,6 +167,32 @@ class EventSerializer(serializers.ModelSerializer):
         """Return whether the event has expired."""
         return obj.is_expired()
 
+    def get_comment_count(self, obj):
+        """Annotated by views.with_event_details for lists; counted for single events."""
+        if hasattr(obj, "comment_count"):
+            return obj.comment_count
+        return obj.comments.count()
+
+    def get_latest_comment(self, obj):
+        if hasattr(obj, "latest_comment_at"):
+            if obj.latest_comment_at is None:
+                return None
+            preview = {
+                "text": obj.latest_comment_text,
+                "username": obj.latest_comment_username,
+                "created_at": obj.latest_comment_at,
+            }
+        else:
+            comment = obj.comments.select_related("user").order_by("-created_at", "-id").first()
+            if comment is None:
+                return None
+            preview = {
+                "text": comment.text[:settings.COMMENT_PREVIEW_LENGTH],
+                "username": comment.user.username,
+                "created_at": comment.created_at,
+            }
+        return CommentPreviewSerializer(preview).data
+
     def validate(self, data):
         """Validation logic for event times."""
         start = data.get("start_time", getattr(self.instance, "start_time", None))
@@ -132,6 +214,70 @@ class EventSerializer(serializers.ModelSerializer):
         return Event.objects.create(**validated_data)
 
 
+class EventSeriesSerializer(serializers.ModelSerializer):
+    """A recurring event; start_time/end_time describe the first occurrence."""
+    location_details = LocationSerializer(source="location", read_only=True)
+    host_details = SafeUserSerializer(source="host", read_only=True)
+    location_id = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(),
+        source="location",
+        write_only=True
+    )
+
+    class Meta:
+        model = EventSeries
+        fields = [
+            "id",
+            "name",
+            "details",
+            "category",
+            "is_public",
+            "max_capacity",
+            "start_time",
+            "end_time",
+            "frequency",
+            "interval",
+            "weekdays",
+            "until",
+            "count",
+            "location_details",
+            "host_details",
+            "location_id",
+            "created_at",
+        ]
+        read_only_fields = ["created_at"]
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Interval must be at least 1.")
+        return value
+
+    def validate_weekdays(self, value):
+        days = [day.strip() for day in value.split(",") if day.strip()]
+        if not all(day.isdigit() and int(day) <= 6 for day in days):
+            raise serializers.ValidationError("Use comma-separated weekday numbers, 0 (Monday) to 6 (Sunday).")
+        return ",".join(str(day) for day in sorted({int(day) for day in days}))
+
+    def validate(self, data):
+        if data["end_time"] <= data["start_time"]:
+            raise serializers.ValidationError("End time must be after start time.")
+        if data["start_time"] < timezone.now():
+            raise serializers.ValidationError("Start time cannot be in the past.")
+        if data.get("until") and data["until"] < data["start_time"]:
+            raise serializers.ValidationError("Until must not be before the first occurrence.")
+        if data.get("weekdays") and data.get("frequency", "weekly") != "weekly":
+            raise serializers.ValidationError("Weekdays only apply to weekly series.")
+        return data
+
+
+class OccurrenceSerializer(serializers.Serializer):
+    """One computed occurrence of a series; event_id is set once it has been materialized."""
+    series = serializers.IntegerField()
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    event_id = serializers.IntegerField(allow_null=True)
+
+
 # --- PROFILE SERIALIZER ---
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -159,22 +305,23 @@ class ProfileSerializer(serializers.ModelSerializer):
         """Extract nested user info if included."""
         user_data = validated_data.pop("user", None)
 
-        if user_data:
-            user = instance.user
-            username = user_data.get("username")
-            password = user_data.get("password")
-
-            # Update user fields if provided, otherwise leave unchanged
-            if username:
-                user.username = username
-            if password:
-                user.set_password(password)
-            user.save()
-
-        # Update profile-specific fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with transaction.atomic():
+            if user_data:
+                user = instance.user
+                # Update user fields if provided, otherwise leave unchanged
+                changed = apply_user_changes(user, user_data.get("username"), user_data.get("password"))
+                if changed:
+                    user.save(update_fields=changed)
+
+            # Update profile-specific fields, writing only the ones that changed
+            changed = [
+                attr for attr, value in validated_data.items()
+                if getattr(instance, attr) != value
+            ]
+            for attr in changed:
+                setattr(instance, attr, validated_data[attr])
+            if changed:
+                instance.save(update_fields=changed)
 
         return instance
 
@@ -212,9 +359,21 @@ class JoinRequestSerializer(serializers.ModelSerializer):
 # --- COMMENT SERIALIZER ---
 
 class CommentSerializer(serializers.ModelSerializer):
-    """Serializer for event comments."""
+    """
+    Serializer for event comments.
+
+    ``replies`` is the whole thread below a top-level comment, depth first
+    (use ``parent`` and ``depth`` to indent it); it is empty for replies, whose
+    own replies are listed in their top-level comment's thread.
+    """
     
     user_details = SafeUserSerializer(source="user", read_only=True)
+    parent = serializers.PrimaryKeyRelatedField(
+        queryset=Comment.objects.all(), required=False, allow_null=True
+    )
+    depth = serializers.IntegerField(read_only=True)
+    my_reactions = serializers.SerializerMethodField()
+    replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
@@ -222,12 +381,37 @@ class CommentSerializer(serializers.ModelSerializer):
             "id",
             "event",
             "user",
+            "parent",
+            "thread",
+            "depth",
             "text",
             "created_at",
             "updated_at",
             "user_details",
+            "reaction_counts",
+            "my_reactions",
+            "replies",
         ]
-        read_only_fields = ["created_at", "updated_at", "user", "event"]
+        read_only_fields = ["created_at", "updated_at", "user", "event", "thread", "reaction_counts"]
+
+    def validate_parent(self, parent):
+        if parent is not None and parent.depth + 1 >= settings.COMMENT_MAX_DEPTH:
+            raise serializers.ValidationError("Replies cannot be nested any deeper.")
+        return parent
+
+    def get_my_reactions(self, obj):
+        """The requesting user's reactions, prefetched by the list view as own_reactions."""
+        reactions = getattr(obj, "own_reactions", None)
+        if reactions is None:
+            request = self.context.get("request")
+            if obj.pk is None or not (request and request.user.is_authenticated):
+                return []
+            reactions = obj.reactions.filter(user=request.user)
+        return sorted(reaction.kind for reaction in reactions)
+
+    def get_replies(self, obj):
+        replies = getattr(obj, "thread_replies", [])
+        return CommentSerializer(replies, many=True, context=self.context).data
     
     def create(self, validated_data):
         """Ensure the comment user is the authenticated user."""
@@ -263,6 +447,20 @@ class UserSearchSerializer(serializers.ModelSerializer):
         fields = ["id", "username"]
 
 
+class SearchHistorySerializer(serializers.ModelSerializer):
+    """Serializer for a user's own recent searches."""
+    class Meta:
+        model = UserSearch
+        fields = ["query", "timestamp"]
+
+
+class PopularSearchSerializer(serializers.ModelSerializer):
+    """Serializer for the most searched queries."""
+    class Meta:
+        model = PopularSearch
+        fields = ["query", "count", "last_searched_at"]
+
+
 # --- MESSAGE SERIALIZER ---
 
 class MessageSerializer(serializers.ModelSerializer):
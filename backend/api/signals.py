@@ -1,18 +1,92 @@
 # Create a user profile automatically when a new user is created
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import ClaimsUser, Event, Location, Profile
+from . import clusters, ical, search
+from .authentication import forget_identity, remember_identity
+from .buffers import flush_due_buffers
 
+# Write buffered search history once responses have gone out
+request_finished.connect(flush_due_buffers, dispatch_uid="api.flush_due_buffers")
+
+# Profiles are only written here on creation; saving a user leaves its profile alone
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-    else:
-        # Existing users: Save the profile instead
-        if hasattr(instance, 'profile'):
-            instance.profile.save()
 
+# Keep the user search index in sync with usernames
+@receiver(post_save, sender=User)
+def index_user_for_search(sender, instance, update_fields=None, **kwargs):
+    # Saves such as the last_login update at token issue never touch the username
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    search.index_user(instance)
+
+@receiver(post_delete, sender=User)
+def unindex_deleted_user(sender, instance, **kwargs):
+    search.unindex_user(instance.pk)
+
+# Keep the identity token authentication checks against current (api/authentication.py)
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+@receiver(post_save, sender=ClaimsUser)
+def refresh_cached_identity(sender, instance, **kwargs):
+    if instance.get_deferred_fields() & {'username', 'password', 'is_active'}:
+        forget_identity(instance.pk)
+    else:
+        remember_identity(instance)
+
+@receiver(post_delete, sender=User)
+def forget_deleted_identity(sender, instance, **kwargs):
+    forget_identity(instance.pk)
+
+# Keep the event search index in sync with events and their locations
+@receiver(post_save, sender=Event)
+def index_event_for_search(sender, instance, **kwargs):
+    search.index_event(instance)
+
+@receiver(post_delete, sender=Event)
+def unindex_deleted_event(sender, instance, **kwargs):
+    search.unindex_event(instance.pk)
+
+@receiver(post_save, sender=Location)
+def reindex_renamed_location(sender, instance, created, update_fields=None, **kwargs):
+    # Only the name is indexed; coordinate and geohash updates leave it alone
+    if created or (update_fields is not None and 'name' not in update_fields) or not instance.has_changed('name'):
+        return
+    search.reindex_location_events(instance)
+
+# Calendar feeds show the location's name and coordinates (api/ical.py), so
+# their events count as modified when those change
+@receiver(post_save, sender=Location)
+def touch_events_at_changed_location(sender, instance, created, update_fields=None, **kwargs):
+    fields = [name for name in Location.TRACKED_FIELDS if update_fields is None or name in update_fields]
+    if not created and fields and instance.has_changed(*fields):
+        instance.events.update(updated_at=timezone.now())
+
+# Cached map clusters are stale once an event or location changes
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_event_clusters(sender, **kwargs):
+    clusters.invalidate()
+
+# Calendar feeds change when events join or leave them (api/ical.py)
+@receiver(m2m_changed, sender=Event.participant_list.through)
+def touch_calendar_feeds(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        ical.touch_feeds([instance.pk])
+    elif action == 'pre_clear':
+        ical.touch_feeds(instance.participant_list.values_list('id', flat=True))
+    else:
+        ical.touch_feeds(pk_set)
+
+@receiver(pre_delete, sender=Event)
+def touch_calendar_feeds_on_delete(sender, instance, **kwargs):
+    ical.touch_feeds([instance.host_id, *instance.participant_list.values_list('id', flat=True)])
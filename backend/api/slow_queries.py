@@ -0,0 +1,177 @@
+"""
+Slow-query log.
+
+Every database connection gets an execute_wrapper hook (installed from
+ApiConfig.ready). A statement that takes longer than SLOW_QUERY_MS is written
+as one JSON line to SLOW_QUERY_LOG, which rotates at SLOW_QUERY_LOG_MAX_BYTES
+keeping SLOW_QUERY_LOG_BACKUPS old files. Each record has:
+
+- the normalized SQL (parameters and literals replaced by ``?``, IN lists
+  collapsed) and a short fingerprint of it, so repeats of one statement group
+  together whatever their parameters; the parameters themselves are not logged;
+- the call site: the DRF view and serializer that were running, and the
+  innermost line of project code;
+- the EXPLAIN plan, captured once per fingerprint and process.
+
+``python manage.py slow_queries`` summarizes the log by fingerprint.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+MAX_CACHED_PLANS = 500
+
+_explaining = ContextVar("slow_query_explaining", default=False)
+_plans = {}
+_lock = threading.Lock()
+_handler = None
+logger = logging.getLogger("api.slow_queries")
+logger.propagate = False
+
+
+def normalize(sql):
+    """SQL with parameters and literals as ``?``, IN lists as ``(...)`` and single spaces."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"%s|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(...)", sql)
+    return " ".join(sql.split())
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def call_site():
+    """The DRF view and serializer on the stack, and the innermost project line."""
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.views import APIView
+
+    site = {"view": None, "serializer": None, "line": None}
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if site["line"] is None and code.co_filename.startswith(base_dir) and code.co_filename != __file__:
+            path = Path(code.co_filename).relative_to(base_dir)
+            site["line"] = f"{path}:{frame.f_lineno} in {code.co_name}"
+        owner = frame.f_locals.get("self")
+        if site["serializer"] is None and isinstance(owner, BaseSerializer):
+            # The list serializer's child names the model being serialized
+            owner = getattr(owner, "child", owner)
+            site["serializer"] = type(owner).__name__
+        elif isinstance(owner, APIView):
+            site["view"] = type(owner).__name__
+            break
+        frame = frame.f_back
+    return site
+
+
+def explain(connection, sql, params, normalized):
+    """EXPLAIN plan rows for a statement, cached by fingerprint; None if not explainable."""
+    key = (connection.alias, normalized)
+    if key in _plans:
+        return _plans[key]
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    token = _explaining.set(True)
+    try:
+        # In a savepoint, so a failed EXPLAIN cannot break the caller's transaction
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            plan = [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as exc:
+        plan = [f"EXPLAIN failed: {exc}"]
+    finally:
+        _explaining.reset(token)
+    with _lock:
+        if len(_plans) >= MAX_CACHED_PLANS:
+            _plans.clear()
+        _plans[key] = plan
+    return plan
+
+
+def _write(record):
+    global _handler
+    path = settings.SLOW_QUERY_LOG
+    with _lock:
+        if _handler is None or _handler.baseFilename != os.path.abspath(path):
+            if _handler is not None:
+                logger.removeHandler(_handler)
+                _handler.close()
+            _handler = RotatingFileHandler(
+                path, maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                backupCount=settings.SLOW_QUERY_LOG_BACKUPS, encoding="utf-8", delay=True,
+            )
+            logger.addHandler(_handler)
+            logger.setLevel(logging.INFO)
+    logger.info(json.dumps(record, default=str))
+
+
+class SlowQueryLogger:
+    """connection.execute_wrapper hook for one connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if elapsed >= settings.SLOW_QUERY_MS and settings.SLOW_QUERY_LOG:
+            normalized = normalize(sql)
+            _write({
+                "time": timezone.now().isoformat(),
+                "ms": round(elapsed, 3),
+                "database": self.connection.alias,
+                "fingerprint": fingerprint(normalized),
+                "sql": normalized,
+                "many": many,
+                **call_site(),
+                "explain": None if many else explain(self.connection, sql, params, normalized),
+            })
+        return result
+
+
+def install_hook(sender=None, connection=None, **kwargs):
+    if not any(isinstance(hook, SlowQueryLogger) for hook in connection.execute_wrappers):
+        # First in the list (outermost), so connection.execute_wrapper() blocks
+        # that are open while the connection is created still pop their own hook
+        connection.execute_wrappers.insert(0, SlowQueryLogger(connection))
+
+
+def install():
+    """Hook every connection, including ones opened later (called from AppConfig.ready)."""
+    connection_created.connect(install_hook, dispatch_uid="api.slow_queries")
+    for connection in connections.all(initialized_only=True):
+        install_hook(connection=connection)
+
+
+def read(path=None):
+    """Records from the log and its rotated backups, oldest file first."""
+    path = Path(path or settings.SLOW_QUERY_LOG)
+    files = [path.with_name(f"{path.name}.{n}") for n in range(settings.SLOW_QUERY_LOG_BACKUPS, 0, -1)]
+    for file in files + [path]:
+        if not file.exists():
+            continue
+        with open(file, encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -1,12 +1,22 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
-from .models import Event, Location, JoinRequest
+from .models import Event, Location, JoinRequest, Profile
 from django.utils import timezone
 from datetime import timedelta
 
+
+def tearDownModule():
+    # Views queue notifications and searches in memory; drop what is left
+    # rather than flushing it at exit, after the test database is gone
+    from .outbox import notification_buffer
+    from .search_log import search_buffer
+    notification_buffer.clear()
+    search_buffer.clear()
+
+
 class EventBasicTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
@@ -300,6 +310,49 @@ class ProfileTests(APITestCase):
         self.assertEqual(self.user.profile.bio, "New Bio")
         self.assertEqual(self.user.username, "new_name")
 
+    def writes(self, func, table):
+        """Number of INSERT/UPDATE statements func issues against table."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return sum(
+            1 for q in ctx.captured_queries
+            if q['sql'].startswith(('INSERT', 'UPDATE')) and f'"{table}"' in q['sql']
+        )
+
+    def test_login_does_not_write_profile(self):
+        """Test token issue and last_login saves leave the profile untouched."""
+        def login():
+            response = self.client.post(reverse('token_obtain_pair'),
+                                        {'username': 'original_name', 'password': 'old_password'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+
+        self.assertEqual(self.writes(login, 'api_profile'), 0)
+
+    def test_profile_update_write_counts(self):
+        """Test each profile update writes only what changed."""
+        url = reverse('profile')
+        put = lambda data: self.client.put(url, data, format='json')
+
+        self.assertEqual(self.writes(lambda: put({"bio": "Hello"}), 'api_profile'), 1)
+        self.assertEqual(self.writes(lambda: put({"bio": "Hello"}), 'api_profile'), 0)
+        self.assertEqual(self.writes(lambda: put({"bio": "Hello"}), 'auth_user'), 0)
+
+        password_change = lambda: put({"user": {"password": "new_password"}})
+        self.assertEqual(self.writes(password_change, 'api_profile'), 0)
+        self.assertEqual(self.writes(password_change, 'auth_user'), 1)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("new_password"))
+
+    def test_registration_creates_profile(self):
+        """Test registering creates the user and its profile together."""
+        response = self.client.post(reverse('register'), {'username': 'newcomer', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Profile.objects.filter(user__username='newcomer').exists())
+
 class AdditionalViewsTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='user', password='password')
@@ -377,8 +430,8 @@ class AdditionalViewsTests(APITestCase):
         
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['text'], "Nice event!")
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['text'], "Nice event!")
 
 class coverage_boost_tests(APITestCase):
     def setUp(self):
@@ -730,6 +783,10 @@ class UserSearchTests(APITestCase):
         self.user1 = User.objects.create_user(username='alice', password='password')
         self.user2 = User.objects.create_user(username='bob', password='password')
         self.user3 = User.objects.create_user(username='charlie', password='password')
+
+    def tearDown(self):
+        from .search_log import search_buffer
+        search_buffer.clear()  # searches are logged in the background
     
     def test_search_users(self):
         """Test searching for users."""
@@ -759,6 +816,123 @@ class UserSearchTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
 
+    def test_search_ranks_friends_first(self):
+        """Test that friends are listed before other matches."""
+        from .models import Friendship
+
+        bobby = User.objects.create_user(username='bobby', password='password')
+        Friendship.objects.create(user1=self.user1, user2=bobby)
+
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(reverse('user-search'), {'q': 'bob'})
+
+        self.assertEqual([u['username'] for u in response.data], ['bobby', 'bob'])
+
+    def test_short_query_matches_prefix_only(self):
+        """Test that one or two characters only match the start of a username."""
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(reverse('user-search'), {'q': 'ch'})
+        self.assertEqual([u['username'] for u in response.data], ['charlie'])
+
+        response = self.client.get(reverse('user-search'), {'q': 'li'})
+        self.assertEqual(len(response.data), 0)
+
+    def test_search_follows_username_changes(self):
+        """Test that renamed users are found by their new name only."""
+        self.user2.username = 'robert'
+        self.user2.save()
+
+        self.client.force_authenticate(user=self.user1)
+        self.assertEqual(len(self.client.get(reverse('user-search'), {'q': 'bob'}).data), 0)
+        response = self.client.get(reverse('user-search'), {'q': 'bert'})
+        self.assertEqual(response.data[0]['username'], 'robert')
+
+    def test_search_limit_and_offset(self):
+        """Test paging through search results."""
+        for i in range(5):
+            User.objects.create_user(username=f'carol{i}', password='password')
+
+        self.client.force_authenticate(user=self.user1)
+        url = reverse('user-search')
+        first = self.client.get(url, {'q': 'carol', 'limit': 3})
+        second = self.client.get(url, {'q': 'carol', 'limit': 3, 'offset': 3})
+
+        self.assertEqual([u['username'] for u in first.data], ['carol0', 'carol1', 'carol2'])
+        self.assertEqual([u['username'] for u in second.data], ['carol3', 'carol4'])
+
+class SearchHistoryTests(APITestCase):
+    def setUp(self):
+        from .search_log import search_buffer
+        self.buffer = search_buffer
+        self.buffer.clear()
+        self.user1 = User.objects.create_user(username='alice', password='password')
+        self.user2 = User.objects.create_user(username='bob', password='password')
+        self.client.force_authenticate(user=self.user1)
+
+    def tearDown(self):
+        self.buffer.clear()
+
+    def test_searches_are_buffered_until_flush(self):
+        """Test that searching does not write history on the request path."""
+        from .models import UserSearch
+
+        self.client.get(reverse('user-search'), {'q': 'bob'})
+        self.assertEqual(UserSearch.objects.count(), 0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(UserSearch.objects.filter(user=self.user1, query='bob').exists())
+
+    def test_keystrokes_collapse_into_one_search(self):
+        """Test that search-as-you-type only records the final query."""
+        from .models import UserSearch
+
+        for query in ['b', 'bo', 'bob']:
+            self.client.get(reverse('user-search'), {'q': query})
+        self.buffer.flush()
+
+        self.assertEqual(list(UserSearch.objects.values_list('query', flat=True)), ['bob'])
+
+    def test_recent_and_popular_searches(self):
+        """Test the recent and popular search endpoints."""
+        self.client.get(reverse('user-search'), {'q': 'bob'})
+        self.client.get(reverse('user-search'), {'q': 'charlie'})
+        self.client.get(reverse('user-search'), {'q': 'bob'})
+        self.client.force_authenticate(user=self.user2)
+        self.client.get(reverse('user-search'), {'q': 'Bob'})
+        self.buffer.flush()
+
+        self.client.force_authenticate(user=self.user1)
+        recent = self.client.get(reverse('recent-searches'))
+        self.assertEqual([s['query'] for s in recent.data], ['bob', 'charlie'])
+
+        from .models import PopularSearch
+        self.assertEqual(PopularSearch.objects.get(query='bob').count, 3)
+        with override_settings(POPULAR_SEARCH_MIN_COUNT=1):
+            popular = self.client.get(reverse('popular-searches'))
+        # 'bob' is a username, so it is never shown to others
+        self.assertEqual([(s['query'], s['count']) for s in popular.data], [('charlie', 1)])
+        with override_settings(POPULAR_SEARCH_MIN_COUNT=2):
+            self.assertEqual(self.client.get(reverse('popular-searches')).data, [])
+
+    def test_counter_created_by_another_flush_keeps_both_counts(self):
+        """Test that a counter inserted concurrently for a new query is added to, not overwritten."""
+        from unittest import mock
+        from .models import PopularSearch
+        from .search_log import write_searches
+
+        manager = PopularSearch.objects
+        real_bulk_create = manager.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Another process flushes the same new query first
+            PopularSearch.objects.create(query='chess club', count=2)
+            return real_bulk_create(objs, **kwargs)
+
+        now = timezone.now()
+        with mock.patch.object(manager, 'bulk_create', side_effect=racing_bulk_create):
+            write_searches([(self.user1.pk, 'chess club', now), (self.user2.pk, 'chess club', now)])
+        self.assertEqual(PopularSearch.objects.get(query='chess club').count, 4)
+
 class MessagingTests(APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username='sender', password='password')
@@ -901,6 +1075,99 @@ class EventFilteringTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    def test_search_details_and_location(self):
+        """Test that search also matches event details and location names."""
+        url = reverse('event-list')
+        self.assertEqual(self.client.get(url, {'search': 'math'}).data[0]['name'], 'Study Group')
+        self.assertEqual(self.client.get(url, {'search': 'gym'}).data[0]['name'], 'Basketball Game')
+
+    def test_search_ranks_name_matches_first(self):
+        """Test that a name match outranks a match in the details."""
+        start = timezone.now() + timedelta(hours=1)
+        Event.objects.create(
+            name="Pickup Game", details="Bring your basketball shoes", host=self.user,
+            location=self.location1, start_time=start - timedelta(minutes=30),
+            end_time=start + timedelta(hours=1),
+        )
+        response = self.client.get(reverse('event-list'), {'search': 'basketball'})
+
+        self.assertEqual([e['name'] for e in response.data], ['Basketball Game', 'Pickup Game'])
+
+    def test_search_combined_with_filters(self):
+        """Test that search respects the category filter."""
+        url = reverse('event-list')
+        response = self.client.get(url, {'search': 'game', 'category': 'academic'})
+        self.assertEqual(len(response.data), 0)
+
+    def test_search_index_follows_updates_and_deletes(self):
+        """Test that edited and deleted events are reflected in search."""
+        event = Event.objects.get(name="Study Group")
+        event.details = "Organic chemistry"
+        event.save()
+        self.location2.name = "Recreation Center"
+        self.location2.save()
+
+        url = reverse('event-list')
+        self.assertEqual(len(self.client.get(url, {'search': 'math'}).data), 0)
+        self.assertEqual(len(self.client.get(url, {'search': 'chem'}).data), 1)
+        self.assertEqual(len(self.client.get(url, {'search': 'recreation'}).data), 1)
+
+        event.delete()
+        self.assertEqual(len(self.client.get(url, {'search': 'chem'}).data), 0)
+
+    def test_location_saves_reindex_only_on_rename(self):
+        """Test that coordinate-only location saves leave the event index alone."""
+        from unittest import mock
+        from . import search
+        with mock.patch.object(search, 'reindex_location_events') as reindex:
+            location = Location.objects.get(pk=self.location1.pk)
+            location.latitude = 11
+            location.save()
+            location.name = "Library"  # normalized to the stored name
+            location.save(update_fields=['name'])
+            location.name = "Atkins Library"
+            location.save(update_fields=['latitude'])
+            self.assertFalse(reindex.called)
+            location.save()
+            reindex.assert_called_once_with(location)
+
+class FallbackSearchMixin:
+    """Runs the inherited search tests against the tables used where FTS5 is unavailable (e.g. Postgres)."""
+
+    def setUp(self):
+        from unittest import mock
+        patcher = mock.patch('api.search.has_fts_table', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+class UserSearchFallbackTests(FallbackSearchMixin, UserSearchTests):
+    def test_fallback_index_is_used_and_rebuilt(self):
+        from . import search
+        from .models import UserSearchTrigram
+        self.assertEqual(
+            set(UserSearchTrigram.objects.filter(user=self.user2).values_list('trigram', flat=True)),
+            search.trigrams('bob'),
+        )
+        UserSearchTrigram.objects.all().delete()
+        search.rebuild_user_index(batch_size=2)
+        self.assertEqual([u.username for u in search.search_users('char')], ['charlie'])
+
+
+class EventSearchFallbackTests(FallbackSearchMixin, EventFilteringTests):
+    def test_fallback_index_is_used_and_rebuilt(self):
+        from . import search
+        from .models import EventSearchTerm
+        event = Event.objects.get(name="Study Group")
+        weights = dict(EventSearchTerm.objects.filter(event=event).values_list('term', 'weight'))
+        self.assertEqual(weights['study'], search.EVENT_FIELD_WEIGHTS['name'])
+        self.assertEqual(weights['library'], search.EVENT_FIELD_WEIGHTS['location'])
+        EventSearchTerm.objects.all().delete()
+        search.rebuild_event_index(batch_size=1)
+        self.assertEqual([e.name for e in search.search_events(Event.objects.all(), 'stu gro')], ['Study Group'])
+
+
 class UserProfileViewTests(APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username='user1', password='password')
@@ -938,3 +1205,1450 @@ class UserProfileViewTests(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['is_friend'])
+
+class LocationGeoTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='mapper', password='password')
+        self.client.force_authenticate(user=self.user)
+        # Roughly 100 m apart along a street, plus one location across town
+        self.union = Location.objects.create(name="Student Union", latitude=35.3080, longitude=-80.7335)
+        self.library = Location.objects.create(name="Library", latitude=35.3089, longitude=-80.7335)
+        self.downtown = Location.objects.create(name="Downtown", latitude=35.2271, longitude=-80.8431)
+
+        start = timezone.now() + timedelta(hours=1)
+        for location in (self.union, self.library, self.downtown):
+            Event.objects.create(
+                name=f"Meetup at {location.name}", details="Hangout", host=self.user,
+                location=location, start_time=start, end_time=start + timedelta(hours=1),
+            )
+
+    def test_geohash_encoding(self):
+        """Test the geohash encoder against a known value."""
+        from .geo import encode
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.union.geohash, encode(35.3080, -80.7335))
+
+    def test_locations_in_bbox(self):
+        """Test filtering locations to the visible map area."""
+        response = self.client.get(reverse('location-list'), {'bbox': '-80.74,35.30,-80.72,35.31'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({l['name'] for l in response.data}, {'Student Union', 'Library'})
+
+    def test_cover_stays_within_its_cell_budget(self):
+        """Test a box too big for any geohash cover falls back to the exact check alone."""
+        from .geo import MAX_COVER_CELLS, cover
+        self.assertLessEqual(len(cover(35.30, -80.74, 35.31, -80.72)), MAX_COVER_CELLS)
+        self.assertEqual(cover(-90, -180, 90, 180), [])
+
+        response = self.client.get(reverse('location-list'), {'bbox': '-180,-90,180,90'})
+        self.assertEqual({l['name'] for l in response.data}, {'Student Union', 'Library', 'Downtown'})
+
+    def test_locations_near_point_ordered_by_distance(self):
+        """Test radius search returns the nearest location first."""
+        response = self.client.get(
+            reverse('location-list'), {'near': '35.3090,-80.7335', 'radius': 500}
+        )
+
+        self.assertEqual([l['name'] for l in response.data], ['Library', 'Student Union'])
+        self.assertLess(response.data[0]['distance'], 20)
+        self.assertAlmostEqual(response.data[1]['distance'], 111, delta=5)
+
+    def test_events_near_point(self):
+        """Test radius search on the event feed."""
+        response = self.client.get(
+            reverse('event-list'), {'near': '35.2271,-80.8431', 'radius': 1000}
+        )
+
+        self.assertEqual([e['name'] for e in response.data], ['Meetup at Downtown'])
+
+    def _campus_tile(self):
+        from .geo import tile_for
+        x, y = tile_for(self.union.latitude, self.union.longitude, 12)
+        return reverse('event-clusters', args=[12, x, y])
+
+    def test_event_clusters_for_tile(self):
+        """Test clustered event counts with a category breakdown."""
+        response = self.client.get(self._campus_tile())
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        clusters = response.data['clusters']
+        self.assertEqual(sum(c['count'] for c in clusters), 2)
+        self.assertEqual(sum(c['categories'].get('other', 0) for c in clusters), 2)
+
+    def test_event_clusters_refresh_after_changes(self):
+        """Test cached tiles are invalidated when events change."""
+        url = self._campus_tile()
+        self.client.get(url)
+
+        start = timezone.now() + timedelta(hours=2)
+        Event.objects.create(
+            name="Pickup Game", details="Soccer", host=self.user, location=self.union,
+            start_time=start, end_time=start + timedelta(hours=1), category='sporting',
+            is_public=False,
+        )
+        clusters = self.client.get(url).data['clusters']
+        self.assertEqual(sum(c['count'] for c in clusters), 3)
+
+        self.client.logout()
+        clusters = self.client.get(url).data['clusters']
+        self.assertEqual(sum(c['count'] for c in clusters), 2)
+
+    def test_create_location_reuses_nearby_duplicate(self):
+        """Test posting the same place a few metres off returns the existing location."""
+        url = reverse('create-location')
+        response = self.client.post(
+            url, {'name': 'student  union', 'latitude': 35.30801, 'longitude': -80.73351}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.union.id)
+
+        response = self.client.post(url, {'name': 'Food Truck', 'latitude': 35.30801, 'longitude': -80.73351})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_concurrent_near_duplicate_keeps_oldest(self):
+        """Test a create that lost the race resolves to the older location."""
+        from unittest import mock
+        from . import locations
+
+        real_find = locations.find_duplicate
+        calls = []
+
+        def lookup(*args, **kwargs):
+            # The first lookup runs before the rival row was committed
+            calls.append(kwargs)
+            return real_find(*args, **kwargs) if len(calls) > 1 else None
+
+        with mock.patch.object(locations, 'find_duplicate', side_effect=lookup):
+            location, created = locations.get_or_create_location('Student Union', 35.30802, -80.7335)
+
+        self.assertFalse(created)
+        self.assertEqual(location.id, self.union.id)
+        self.assertEqual(Location.objects.filter(name__iexact='student union').count(), 1)
+
+    def test_create_location_rejects_bad_coordinates(self):
+        """Test non-numeric coordinates are rejected."""
+        response = self.client.post(
+            reverse('create-location'), {'name': 'Nowhere', 'latitude': 'north', 'longitude': 0}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_merge_duplicate_locations_command(self):
+        """Test merging near-duplicate locations repoints their events."""
+        from django.core.management import call_command
+        from io import StringIO
+
+        copy = Location.objects.create(name="STUDENT UNION", latitude=35.30805, longitude=-80.73352)
+        event = Event.objects.get(location=self.union)
+        Event.objects.filter(pk=event.pk).update(location=copy)
+
+        call_command('merge_duplicate_locations', stdout=StringIO())
+
+        self.assertFalse(Location.objects.filter(pk=copy.pk).exists())
+        event.refresh_from_db()
+        self.assertEqual(event.location_id, self.union.id)
+        self.assertEqual(Location.objects.count(), 3)
+
+    def test_merge_groups_legacy_names_with_extra_whitespace(self):
+        """Test names differing only in whitespace merge even when another name sorts between them."""
+        from django.core.management import call_command
+        from io import StringIO
+
+        legacy = Location.objects.create(name="Student Union copy", latitude=35.30805, longitude=-80.73352)
+        between = Location.objects.create(name="Student Zone", latitude=35.2, longitude=-80.9)
+        # Saved before names were normalized: "student  union" < "student  zone" < "student union"
+        Location.objects.filter(pk=legacy.pk).update(name="Student  Union")
+        Location.objects.filter(pk=between.pk).update(name="Student  Zone")
+
+        call_command('merge_duplicate_locations', stdout=StringIO())
+
+        self.assertFalse(Location.objects.filter(pk=legacy.pk).exists())
+        self.assertTrue(Location.objects.filter(pk=between.pk).exists())
+
+    def test_merge_keeps_series_at_duplicate_locations(self):
+        """Test merging repoints recurring series instead of deleting them with the duplicate."""
+        from django.core.management import call_command
+        from django.db.models import ProtectedError
+        from io import StringIO
+        from .models import EventSeries
+
+        copy = Location.objects.create(name="Student union", latitude=35.30806, longitude=-80.73351)
+        start = timezone.now() + timedelta(days=1)
+        series = EventSeries.objects.create(
+            name="Weekly meetup", details="x", host=User.objects.create_user(username='organizer', password='pw'),
+            location=copy, start_time=start, end_time=start + timedelta(hours=1),
+        )
+        with self.assertRaises(ProtectedError):
+            Location.objects.filter(pk=copy.pk).delete()
+
+        out = StringIO()
+        call_command('merge_duplicate_locations', stdout=out)
+        self.assertIn("1 recurring series", out.getvalue())
+        series.refresh_from_db()
+        self.assertEqual(series.location_id, self.union.id)
+        self.assertFalse(Location.objects.filter(pk=copy.pk).exists())
+
+    def test_invalid_area_parameters(self):
+        """Test malformed bbox and radius values are rejected."""
+        url = reverse('location-list')
+        self.assertEqual(self.client.get(url, {'bbox': '1,2,3'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(url, {'near': '35.3,-80.7', 'radius': 10 ** 9}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework_simplejwt.tokens import AccessToken
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.other_auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.other)}'}
+
+    def route(self, method, status_code=200, **headers):
+        """Run the middleware around a fake view; return the alias reads would use."""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .db_routers import ReadReplicaRouter
+        from .middleware import ReplicaRoutingMiddleware
+
+        used = []
+
+        def view(request):
+            used.append(ReadReplicaRouter().db_for_read(Event) or 'default')
+            return HttpResponse(status=status_code)
+
+        request = getattr(RequestFactory(), method)('/api/events/', **headers)
+        ReplicaRoutingMiddleware(view)(request)
+        return used[0]
+
+    def test_safe_reads_use_replica(self):
+        """Test GET reads go to the replica and writes stay on the primary."""
+        with self.settings(REPLICA_DATABASE='replica'):
+            self.assertEqual(self.route('get', **self.auth), 'replica')
+            self.assertEqual(self.route('post', **self.auth), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test a user reads their own writes from the primary."""
+        with self.settings(REPLICA_DATABASE='replica'):
+            self.route('post', status_code=201, **self.auth)
+
+            self.assertEqual(self.route('get', **self.auth), 'default')
+            self.assertEqual(self.route('get', **self.other_auth), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        """Test rejected writes do not pin the user to the primary."""
+        with self.settings(REPLICA_DATABASE='replica'):
+            self.route('post', status_code=400, **self.auth)
+            self.assertEqual(self.route('get', **self.auth), 'replica')
+
+    def test_no_replica_configured(self):
+        """Test everything uses the default database without a replica."""
+        with self.settings(REPLICA_DATABASE=None):
+            self.assertEqual(self.route('get', **self.auth), 'default')
+
+
+    def test_check_warns_about_per_process_pin_cache(self):
+        """Test a replica without a shared cache is flagged by manage.py check."""
+        from .db_routers import check_pin_cache
+        with self.settings(REPLICA_DATABASE='replica'):
+            self.assertEqual([w.id for w in check_pin_cache(None)], ['api.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with self.settings(REPLICA_DATABASE='replica', CACHES=shared):
+            self.assertEqual(check_pin_cache(None), [])
+        with self.settings(REPLICA_DATABASE=None):
+            self.assertEqual(check_pin_cache(None), [])
+
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='claims', password='password')
+
+    def obtain(self, password='password'):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'claims', 'password': password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def authenticate(self, access):
+        from rest_framework.test import APIRequestFactory
+        from .authentication import StatelessJWTAuthentication
+        request = APIRequestFactory().get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        return StatelessJWTAuthentication().authenticate(request)[0]
+
+    def test_authenticates_without_query(self):
+        """Test a valid token yields request.user without loading the row."""
+        access = self.obtain()['access']
+        with self.assertNumQueries(0):
+            user = self.authenticate(access)
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'claims', True))
+
+        # Other fields load together on first use
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(user.date_joined)
+            self.assertFalse(user.is_staff)
+
+    def test_endpoint_with_token(self):
+        """Test views work with the token-built user."""
+        access = self.obtain()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'claims')
+
+    def test_password_change_revokes_tokens(self):
+        """Test tokens issued before a password change are rejected."""
+        from rest_framework.exceptions import AuthenticationFailed
+        tokens = self.obtain()
+        self.user.set_password('new-password')
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens['access'])
+        response = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.assertEqual(self.authenticate(self.obtain('new-password')['access']).pk, self.user.pk)
+
+    def test_deactivation_revokes_tokens(self):
+        """Test tokens stop working once the account is deactivated."""
+        from rest_framework.exceptions import AuthenticationFailed
+        access = self.obtain()['access']
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+
+    def test_cache_miss_loads_identity(self):
+        """Test an empty cache falls back to one query, then is warm again."""
+        from django.core.cache import cache
+        access = self.obtain()['access']
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.authenticate(access)
+        with self.assertNumQueries(0):
+            self.authenticate(access)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisionUsersTests(TestCase):
+    def provision(self, content, suffix, **options):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('provision_users', handle.name, stdout=out, **options)
+        return out.getvalue()
+
+    def test_provision_from_csv(self):
+        """Test users, profiles and search entries are created; bad and existing rows skipped."""
+        from . import search
+        User.objects.create_user(username='taken', password='password')
+        output = self.provision(
+            "username,password,email,pronouns\n"
+            "alice,secret,alice@example.edu,she/her\n"
+            "bob,,bob@example.edu,\n"
+            "bad name!,secret,,\n"
+            "taken,secret,,\n",
+            '.csv', workers=0, batch_size=2,
+        )
+        self.assertIn('Created 2 users', output)
+        self.assertIn('skipped 1 existing and 1 invalid', output)
+
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('secret'))
+        self.assertEqual(alice.email, 'alice@example.edu')
+        self.assertEqual(alice.profile.pronouns, 'she/her')
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertIn('alice', [u.username for u in search.search_users('alic')])
+
+    def test_provision_jsonl_with_pool(self):
+        """Test JSON-lines input hashed in worker processes."""
+        lines = "".join(f'{{"username": "student{n}", "password": "pw{n}"}}\n' for n in range(5))
+        output = self.provision(lines, '.jsonl', workers=1, batch_size=2)
+        self.assertIn('Created 5 users', output)
+        self.assertTrue(User.objects.get(username='student3').check_password('pw3'))
+        self.assertEqual(Profile.objects.filter(user__username__startswith='student').count(), 5)
+
+
+class PasswordHasherTests(APITestCase):
+    HASHERS = ['api.hashers.PBKDF2PasswordHasher', 'api.hashers.ScryptPasswordHasher']
+
+    def login(self):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'hashed', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['access']
+
+    def test_login_upgrades_iterations(self):
+        """Test a hash made with an old iteration count is re-hashed on login."""
+        with self.settings(PASSWORD_HASHERS=self.HASHERS, PASSWORD_PBKDF2_ITERATIONS=1000):
+            user = User.objects.create_user(username='hashed', password='password')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(PASSWORD_HASHERS=self.HASHERS, PASSWORD_PBKDF2_ITERATIONS=2000):
+            access = self.login()
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+            self.assertTrue(user.check_password('password'))
+
+        # The token issued by the upgrading login matches the new hash
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_200_OK)
+
+    def test_default_iterations_follow_django(self):
+        """Test that without PASSWORD_PBKDF2_ITERATIONS Django's default hashes are left alone."""
+        from django.contrib.auth import hashers
+        from .hashers import PBKDF2PasswordHasher
+        default = hashers.PBKDF2PasswordHasher.iterations
+        with self.settings(PASSWORD_HASHERS=self.HASHERS, PASSWORD_PBKDF2_ITERATIONS=None):
+            self.assertEqual(PBKDF2PasswordHasher().iterations, default)
+            django_hasher = hashers.PBKDF2PasswordHasher()
+            encoded = django_hasher.encode('password', django_hasher.salt())
+            self.assertFalse(PBKDF2PasswordHasher().must_update(encoded))
+
+    def test_login_upgrades_algorithm(self):
+        """Test switching the preferred hasher moves users over as they log in."""
+        with self.settings(PASSWORD_HASHERS=self.HASHERS, PASSWORD_PBKDF2_ITERATIONS=1000):
+            user = User.objects.create_user(username='hashed', password='password')
+
+        with self.settings(PASSWORD_HASHERS=self.HASHERS[::-1], PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10):
+            self.login()
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('scrypt$1024$'))
+            self.login()
+
+
+@override_settings(EVENT_SERIES_MATERIALIZE_DAYS=0)  # only on-demand occurrences unless a test says otherwise
+class EventSeriesTests(APITestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='tutor', password='password')
+        self.location = Location.objects.create(name='Library', latitude=40.0, longitude=-75.0)
+        self.client.force_authenticate(user=self.host)
+        # A Monday 10:00 at least a week ahead
+        day = timezone.now() + timedelta(days=7)
+        day -= timedelta(days=day.weekday())
+        self.monday = day.replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def create_series(self, **fields):
+        data = {
+            'name': 'Calc tutoring', 'details': 'Weekly help', 'category': 'tutoring',
+            'location_id': self.location.id, 'frequency': 'weekly', 'weekdays': '0,2',
+            'start_time': self.monday.isoformat(),
+            'end_time': (self.monday + timedelta(hours=1)).isoformat(),
+        }
+        data.update(fields)
+        response = self.client.post(reverse('event-series'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data['id']
+
+    def occurrences(self, series_id, **params):
+        response = self.client.get(reverse('event-series-occurrences', args=[series_id]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        from django.utils.dateparse import parse_datetime
+        return [dict(o, start_time=parse_datetime(o['start_time']), end_time=parse_datetime(o['end_time']))
+                for o in response.data]
+
+    def test_weekly_occurrences_are_computed_not_stored(self):
+        """Test a weekly series expands into occurrences without creating events."""
+        series_id = self.create_series(count=5)
+        data = self.occurrences(series_id, start=self.monday.isoformat(),
+                                end=(self.monday + timedelta(days=60)).isoformat())
+
+        offsets = [0, 2, 7, 9, 14]
+        self.assertEqual([o['start_time'] for o in data],
+                         [self.monday + timedelta(days=d) for d in offsets])
+        self.assertEqual(data[1]['end_time'], self.monday + timedelta(days=2, hours=1))
+        self.assertFalse(Event.objects.exists())
+
+    def test_window_inside_series(self):
+        """Test a window far into an open-ended series and the until bound."""
+        series_id = self.create_series(weekdays='', frequency='daily', interval=3,
+                                       until=(self.monday + timedelta(days=400)).isoformat())
+        start = self.monday + timedelta(days=300, hours=12)
+        data = self.occurrences(series_id, start=start.isoformat(),
+                                end=(start + timedelta(days=200)).isoformat())
+        self.assertEqual(data[0]['start_time'], self.monday + timedelta(days=303))
+        self.assertEqual(data[-1]['start_time'], self.monday + timedelta(days=399))
+        self.assertEqual(len(data), 33)
+
+    def test_materialize_occurrence(self):
+        """Test materializing an occurrence creates its event once."""
+        series_id = self.create_series()
+        url = reverse('event-series-occurrences', args=[series_id])
+        wednesday = (self.monday + timedelta(days=9)).isoformat()
+
+        response = self.client.post(url, {'start_time': wednesday}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        event_id = response.data['id']
+        self.assertEqual(response.data['host_details']['username'], 'tutor')
+
+        response = self.client.post(url, {'start_time': wednesday}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], event_id)
+
+        data = self.occurrences(series_id, start=self.monday.isoformat())
+        self.assertEqual([o['event_id'] for o in data[:4]], [None, None, None, event_id])
+
+        tuesday = (self.monday + timedelta(days=1)).isoformat()
+        response = self.client.post(url, {'start_time': tuesday}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_first_start_outside_weekdays_is_an_occurrence(self):
+        """Test a first start on a weekday outside the rule counts as the first occurrence."""
+        tuesday = self.monday + timedelta(days=1)
+        series_id = self.create_series(count=4, start_time=tuesday.isoformat(),
+                                       end_time=(tuesday + timedelta(hours=1)).isoformat())
+        data = self.occurrences(series_id, start=self.monday.isoformat(),
+                                end=(self.monday + timedelta(days=60)).isoformat())
+        self.assertEqual([o['start_time'] for o in data],
+                         [self.monday + timedelta(days=d) for d in (1, 2, 7, 9)])
+        # A window after the first start still numbers the rest correctly
+        data = self.occurrences(series_id, start=(self.monday + timedelta(days=3)).isoformat())
+        self.assertEqual([o['start_time'] for o in data], [self.monday + timedelta(days=d) for d in (7, 9)])
+
+        response = self.client.post(reverse('event-series-occurrences', args=[series_id]),
+                                    {'start_time': tuesday.isoformat()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_upcoming_occurrences_become_listed_events(self):
+        """Test occurrences in the materialize window are events in the list, search and calendar feed."""
+        from . import ical, search
+        from .models import EventSeries
+        with self.settings(EVENT_SERIES_MATERIALIZE_DAYS=17):
+            series_id = self.create_series()
+        # Mondays and Wednesdays from self.monday up to 17 days from now
+        expected = [start for start, _ in EventSeries.objects.get(pk=series_id).occurrences(
+            timezone.now(), timezone.now() + timedelta(days=17))]
+        self.assertGreaterEqual(len(expected), 2)
+        events = Event.objects.filter(series_id=series_id).order_by('start_time')
+        self.assertEqual([e.start_time for e in events], expected)
+
+        response = self.client.get(reverse('event-list'))
+        self.assertEqual(len([e for e in response.data if e['name'] == 'Calc tutoring']), len(expected))
+        self.assertEqual(search.search_events(Event.objects.all(), 'calc tutoring').count(), len(expected))
+        self.assertEqual(ical.feed_events(self.host.pk).count(), len(expected))
+
+        data = self.occurrences(series_id, start=self.monday.isoformat())
+        self.assertEqual([o['event_id'] for o in data[:len(expected)]], [e.id for e in events])
+
+    def test_materialize_series_command(self):
+        """Test the daily command stores upcoming occurrences once."""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import EventSeries
+        series_id = self.create_series(weekdays='', frequency='daily')
+        self.assertFalse(Event.objects.exists())
+        # One of them was already materialized on demand
+        self.client.post(reverse('event-series-occurrences', args=[series_id]),
+                         {'start_time': self.monday.isoformat()}, format='json')
+
+        out = StringIO()
+        call_command('materialize_series', days=10, stdout=out)
+        expected = len(list(EventSeries.objects.get(pk=series_id).occurrences(
+            timezone.now(), timezone.now() + timedelta(days=10))))
+        self.assertIn(f"Created {expected - 1} events", out.getvalue())
+        self.assertEqual(Event.objects.filter(series_id=series_id).count(), expected)
+
+        call_command('materialize_series', days=10, stdout=out)
+        self.assertIn("Created 0 events", out.getvalue())
+
+    def test_invalid_series(self):
+        """Test bad weekday lists and weekdays on daily series are rejected."""
+        for fields in ({'weekdays': '1,9'}, {'frequency': 'daily'}, {'interval': 0}):
+            data = {
+                'name': 'Bad', 'details': 'x', 'location_id': self.location.id,
+                'start_time': self.monday.isoformat(), 'weekdays': '0',
+                'end_time': (self.monday + timedelta(hours=1)).isoformat(), **fields,
+            }
+            response = self.client.post(reverse('event-series'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, fields)
+
+    def event_data(self, n, **fields):
+        start = self.monday + timedelta(days=n)
+        return {
+            'name': f'Advising {n}', 'details': 'Drop in', 'category': 'advising',
+            'location_id': self.location.id, 'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(), **fields,
+        }
+
+    def test_bulk_create(self):
+        """Test a schedule is created in one request and is searchable."""
+        from . import search
+        data = [self.event_data(n) for n in range(10)]
+        response = self.client.post(reverse('event-bulk-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(Event.objects.filter(host=self.host).count(), 10)
+        self.assertEqual(search.search_events(Event.objects.all(), 'advising').count(), 10)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        """Test one invalid event rejects the whole batch."""
+        data = [self.event_data(0), self.event_data(1, end_time=self.monday.isoformat())]
+        response = self.client.post(reverse('event-bulk-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertFalse(Event.objects.exists())
+
+
+class CalendarFeedTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='password')
+        self.host = User.objects.create_user(username='host', password='password')
+        self.location = Location.objects.create(name='Quad', latitude=40.0, longitude=-75.0)
+        start = timezone.now() + timedelta(days=2)
+        self.hosted = Event.objects.create(name='My study group', details='Bring notes, snacks; pens',
+                                           host=self.user, location=self.location,
+                                           start_time=start, end_time=start + timedelta(hours=1))
+        self.joined = Event.objects.create(name='Open mic', details='Musique café ' * 20, host=self.host,
+                                           location=self.location, start_time=start,
+                                           end_time=start + timedelta(hours=2))
+        self.joined.participant_list.add(self.user)
+        self.other = Event.objects.create(name='Not mine', details='x', host=self.host,
+                                          location=self.location, start_time=start,
+                                          end_time=start + timedelta(hours=1))
+        self.client.force_authenticate(user=self.user)
+        self.url = self.client.get(reverse('calendar-feed')).data['url'].replace('http://testserver', '')
+        self.client.force_authenticate(user=None)
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else ''
+        return response, body
+
+    def test_feed_contents(self):
+        """Test the feed lists hosted and joined events only, as valid iCalendar."""
+        response, body = self.fetch()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/calendar'))
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn('SUMMARY:My study group\r\n', body)
+        self.assertIn('DESCRIPTION:Bring notes\\, snacks\\; pens\r\n', body)
+        self.assertIn('SUMMARY:Open mic\r\n', body)
+        self.assertNotIn('Not mine', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Test polls with a current ETag or date get 304 without rendering."""
+        response, _ = self.fetch()
+        with self.assertNumQueries(2):
+            again, _ = self.fetch(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        again, _ = self.fetch(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_changes_invalidate_feed(self):
+        """Test edits, joins and leaves all produce a new ETag."""
+        etags = {self.fetch()[0]['ETag']}
+        changes = [
+            lambda: self.hosted.save(),
+            lambda: self.other.participant_list.add(self.user),
+            lambda: self.user.joined_events.remove(self.joined),
+            lambda: self.other.delete(),
+            lambda: self.rename_location('Main quad'),
+        ]
+        for change in changes:
+            change()
+            response, body = self.fetch(HTTP_IF_NONE_MATCH=', '.join(etags))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etags.add(response['ETag'])
+        self.assertIn('LOCATION:Main quad\r\n', body)
+
+        # Saving the location without changing what the feed shows keeps the ETag
+        self.rename_location('Main quad')
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def rename_location(self, name):
+        location = Location.objects.get(pk=self.location.pk)
+        location.name = name
+        location.save()
+
+    def test_body_is_read_from_the_database_routed_during_the_request(self):
+        """Test the streamed body uses the alias resolved in the view, not after routing ends."""
+        from unittest import mock
+        from . import ical
+        with mock.patch('api.views.router.db_for_read', return_value='default'), \
+                mock.patch.object(ical, 'render', wraps=ical.render) as render:
+            self.fetch()
+        render.assert_called_once_with(self.user.pk, 'default')
+
+    def test_rotating_token_revokes_url(self):
+        """Test a new token makes the old URL stop working."""
+        self.client.force_authenticate(user=self.user)
+        new_url = self.client.post(reverse('calendar-feed')).data['url']
+        self.client.force_authenticate(user=None)
+        self.assertNotEqual(new_url, self.url)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='analyst', password='password', is_staff=True)
+        self.user = User.objects.create_user(username='member', password='password')
+        location = Location.objects.create(name='Hall, East', latitude=40.0, longitude=-75.0)
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(name='Chess', details='Bring boards', host=self.admin,
+                                          location=location, start_time=start,
+                                          end_time=start + timedelta(hours=1))
+        self.event.participant_list.add(self.user)
+        from .models import Comment
+        Comment.objects.create(event=self.event, user=self.user, text='Line one\nline "two"')
+
+    def download(self, name):
+        response = self.client.get(reverse('export', args=name.split('.', 1)))
+        body = b''.join(response.streaming_content) if response.status_code == 200 else b''
+        return response, body
+
+    def test_admin_only(self):
+        """Test non-staff users cannot export."""
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.download('events.jsonl')[0].status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_jsonl_and_csv(self):
+        """Test each format round-trips the rows."""
+        import csv
+        import io
+        import json
+        self.client.force_authenticate(user=self.admin)
+
+        response, body = self.download('events.jsonl')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = json.loads(body.decode().splitlines()[0])
+        self.assertEqual((row['id'], row['details'], row['host_username'], row['location_name']),
+                         (self.event.id, 'Bring boards', 'analyst', 'Hall, East'))
+
+        _, body = self.download('participants.csv')
+        self.assertEqual(list(csv.reader(io.StringIO(body.decode()))),
+                         [['event_id', 'user_id', 'user_username'],
+                          [str(self.event.id), str(self.user.id), 'member']])
+
+        _, body = self.download('comments.csv')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0]['text'], 'Line one\nline "two"')
+
+    def test_gzip_and_unknown(self):
+        """Test gzipped output and unknown datasets or formats."""
+        import gzip
+        self.client.force_authenticate(user=self.admin)
+        response, body = self.download('join_requests.csv.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(body).decode().strip(),
+                         'id,event_id,user_id,status,created_at,updated_at')
+        self.assertEqual(self.download('users.csv')[0].status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.download('events.xml')[0].status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_command_streams_in_blocks(self):
+        """Test the command writes a file, splitting large exports into blocks."""
+        import os
+        import tempfile
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from . import export
+        path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+        self.addCleanup(os.remove, path)
+        with mock.patch.object(export, 'OUTPUT_BLOCK_BYTES', 10):
+            blocks = list(export.stream('comments', 'jsonl'))
+            call_command('export_data', 'events', output=path, chunk_size=1, stderr=StringIO())
+        self.assertEqual(len(blocks), 1)
+        with open(path) as handle:
+            self.assertIn('"name": "Chess"', handle.read())
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        from . import metrics
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.admin = User.objects.create_user(username='ops', password='password', is_staff=True)
+        location = Location.objects.create(name='Gym', latitude=40.0, longitude=-75.0)
+        start = timezone.now() + timedelta(days=1)
+        for n in range(3):
+            Event.objects.create(name=f'Game {n}', details='x', host=self.admin, location=location,
+                                 start_time=start, end_time=start + timedelta(hours=1))
+
+    def test_debug_headers(self):
+        """Test measured requests report their query count and timings."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with self.settings(METRICS_HEADERS=True):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('event-list'))
+        self.assertEqual(int(response['X-Query-Count']), len(ctx.captured_queries))
+        timing = dict(part.strip().split(';dur=') for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'sql', 'serializer', 'total'})
+        self.assertGreater(float(timing['serializer']), 0)
+        self.assertGreaterEqual(float(timing['total']), float(timing['sql']))
+
+    def test_percentile_report(self):
+        """Test the admin report aggregates samples per route."""
+        with self.settings(METRICS_HEADERS=False, METRICS_SAMPLE_RATE=1.0):
+            for _ in range(5):
+                self.client.get(reverse('event-list'))
+            self.client.force_authenticate(user=self.admin)
+            response = self.client.get(reverse('metrics'))
+
+        routes = {row['route']: row for row in response.data['routes']}
+        row = routes['event-list']
+        self.assertEqual((row['requests'], row['samples']), (5, 5))
+        self.assertLessEqual(row['total_ms']['p50'], row['total_ms']['p99'])
+        self.assertGreater(row['queries']['p50'], 0)
+
+    def test_sampling_off(self):
+        """Test nothing is recorded when sampling and headers are off."""
+        from . import metrics
+        with self.settings(METRICS_HEADERS=False, METRICS_SAMPLE_RATE=0.0):
+            response = self.client.get(reverse('event-list'))
+        self.assertNotIn('X-Query-Count', response)
+        self.assertEqual(metrics.report(), [])
+
+    def test_metrics_admin_only(self):
+        """Test regular users cannot read or reset metrics."""
+        user = User.objects.create_user(username='someone', password='password')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.delete(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_seed_and_benchmark_endpoints(self):
+        """Test the seeded dataset and that every benchmarked endpoint responds."""
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Comment, Friendship, Message, Notification
+
+        call_command('seed_benchmark', scale=0.01, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='bench_').count(), 50)
+        self.assertEqual(Event.objects.count(), 20)
+        for model in (Friendship, Comment, Message, Notification, Profile):
+            self.assertTrue(model.objects.exists(), model.__name__)
+
+        path = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(os.remove, path)
+        from unittest import mock
+        from .authentication import StatelessJWTAuthentication
+        authenticate = StatelessJWTAuthentication.authenticate
+        with mock.patch.object(StatelessJWTAuthentication, 'authenticate', autospec=True,
+                               side_effect=authenticate) as spy:
+            call_command('benchmark_endpoints', repeat=1, output=path, stdout=StringIO())
+        # Requests go through the real token authentication, not force_authenticate
+        self.assertTrue(spy.called)
+        with open(path) as handle:
+            results = json.load(handle)
+        self.assertEqual(results['meta']['rows']['users'], 50)
+        for name, result in results['endpoints'].items():
+            self.assertEqual(result['status'], 200, name)
+            self.assertGreaterEqual(result['median_ms'], result['min_ms'])
+
+
+def _query_shapes(queries):
+    """Count captured SQL statements with literals replaced, so repeated lookups group together."""
+    from collections import Counter
+    from .slow_queries import normalize
+    return Counter(normalize(query['sql']) for query in queries)
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Every list endpoint runs a fixed number of queries, whatever the amount of
+    data. Each endpoint is measured with a small and a larger dataset; the
+    counts must match and stay within the budget. A failure lists the
+    statements that were repeated per row (an N+1).
+    """
+    BUDGETS = {
+        'events': 2,
+        'events_search': 2,
+        'event_detail': 2,
+        'hosted_events': 2,
+        'joined_events': 2,
+        'join_requests': 3,
+        'event_comments': 3,
+        'friends': 3,
+        'friend_requests_received': 1,
+        'conversations': 5,
+        'message_thread': 1,
+        'notifications': 3,
+        'user_search': 4,
+    }
+
+    def setUp(self):
+        from .models import Comment
+        from .search_log import search_buffer
+        search_buffer.clear()  # user searches are logged in the background
+        self.addCleanup(search_buffer.clear)
+        self.user = User.objects.create_user(username='budget_owner', password='pw')
+        self.client.force_authenticate(user=self.user)
+        self.location = Location.objects.create(name="Student Union", latitude=35.3, longitude=-80.7)
+        self.event = self.new_event(self.user, "Study group kickoff")
+        self.friend = User.objects.create_user(username='budget_friend_0', password='pw')
+        self.grown = 0
+        Comment.objects.create(event=self.event, user=self.friend, text="First")
+
+    def new_event(self, host, name, is_public=True):
+        start = timezone.now() + timedelta(days=1)
+        return Event.objects.create(
+            name=name, details="Bring notes", host=host, location=self.location,
+            is_public=is_public, start_time=start, end_time=start + timedelta(hours=2),
+            max_capacity=50,
+        )
+
+    def grow(self, count):
+        """Add ``count`` more rows to every list the endpoints return."""
+        from .models import Comment, CommentReaction, FriendRequest, Friendship, Message, Notification
+        for _ in range(count):
+            self.grown += 1
+            other = User.objects.create_user(username=f'budget_friend_{self.grown}', password='pw')
+            hosted = self.new_event(self.user, f"Study session {self.grown}", is_public=False)
+            hosted.participant_list.add(other, self.friend)
+            JoinRequest.objects.create(event=hosted, user=other)
+            joined = self.new_event(other, f"Study hall {self.grown}")
+            joined.participant_list.add(self.user, other)
+            comment = Comment.objects.create(event=self.event, user=other, text=f"Comment {self.grown}")
+            reply = Comment.objects.create(event=self.event, user=self.user, text="Reply", parent=comment)
+            Comment.objects.create(event=self.event, user=other, text="Reply to reply", parent=reply)
+            CommentReaction.objects.create(comment=reply, user=self.user, kind='like')
+            Friendship.objects.create(user1=self.user, user2=other)
+            FriendRequest.objects.create(from_user=other, to_user=self.user)
+            Message.objects.create(sender=self.user, recipient=self.friend, content="Hi")
+            Message.objects.create(sender=self.friend, recipient=self.user, content="Hello")
+            Message.objects.create(sender=other, recipient=self.user, content="Hey")
+            Notification.objects.create(
+                user=self.user, notification_type='event_update', message="Updated", event=joined,
+            )
+
+    def urls(self):
+        return {
+            'events': reverse('event-list'),
+            'events_search': reverse('event-list') + '?search=study',
+            'event_detail': reverse('event-detail', args=[self.event.pk]),
+            'hosted_events': reverse('hosted-events'),
+            'joined_events': reverse('joined-events'),
+            'join_requests': reverse('list-join-requests'),
+            'event_comments': reverse('event-comments', args=[self.event.pk]),
+            'friends': reverse('friends-list'),
+            'friend_requests_received': reverse('received-friend-requests'),
+            'conversations': reverse('conversation-list'),
+            'message_thread': reverse('message-thread', args=[self.friend.pk]),
+            'notifications': reverse('notification-list'),
+            'user_search': reverse('user-search') + '?q=budget',
+        }
+
+    def measure(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        captured = {}
+        for name, url in self.urls().items():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+            captured[name] = ctx.captured_queries
+        return captured
+
+    def test_list_endpoints_stay_within_query_budget(self):
+        self.assertEqual(set(self.BUDGETS), set(self.urls()))
+        self.measure()  # warm per-process caches
+        self.grow(2)
+        small = self.measure()
+        self.grow(6)
+        large = self.measure()
+
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                before, after = _query_shapes(small[name]), _query_shapes(large[name])
+                diff = "\n".join(
+                    f"  {before[sql]} -> {after[sql]}: {sql}"
+                    for sql in sorted(set(before) | set(after)) if before[sql] != after[sql]
+                )
+                self.assertEqual(
+                    len(small[name]), len(large[name]),
+                    f"{name} runs more queries with more data:\n{diff}",
+                )
+                self.assertLessEqual(
+                    len(large[name]), budget,
+                    f"{name} runs {len(large[name])} queries (budget {budget}):\n"
+                    + "\n".join(f"  {count}x {sql}" for sql, count in after.most_common()),
+                )
+
+
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.user = User.objects.create_user(username='slowuser', password='pw')
+        self.client.force_authenticate(user=self.user)
+        location = Location.objects.create(name="Library", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        Event.objects.create(
+            name="Study group", details="Bring notes", host=self.user, location=location,
+            start_time=start, end_time=start + timedelta(hours=1), max_capacity=10,
+        )
+        self.path = os.path.join(tempfile.mkdtemp(), 'slow.jsonl')
+        self.addCleanup(lambda: os.path.exists(self.path) and os.remove(self.path))
+
+    def test_normalize_groups_statements_by_shape(self):
+        from .slow_queries import fingerprint, normalize
+        first = normalize('SELECT * FROM "api_event" WHERE "id" IN (1, 2, 3) AND "name" = \'a\' LIMIT 21')
+        second = normalize('SELECT * FROM "api_event" WHERE "id" IN (%s, %s) AND "name" = %s LIMIT 21')
+        self.assertEqual(first, 'SELECT * FROM "api_event" WHERE "id" IN (...) AND "name" = ? LIMIT ?')
+        self.assertEqual(fingerprint(first), fingerprint(second))
+
+    def test_slow_statements_are_logged_with_call_site_and_plan(self):
+        from . import slow_queries
+        with override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=self.path):
+            response = self.client.get(reverse('event-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        records = list(slow_queries.read(self.path))
+        events = [r for r in records if r['sql'].startswith('SELECT') and '"api_event"' in r['sql'].split(' FROM ')[1]]
+        self.assertTrue(events)
+        record = events[0]
+        self.assertEqual(record['view'], 'EventListCreate')
+        self.assertEqual(record['serializer'], 'EventSerializer')
+        self.assertEqual(len(record['fingerprint']), 12)
+        self.assertNotIn('%s', record['sql'])
+        self.assertTrue(record['explain'])
+        self.assertFalse(record['explain'][0].startswith('EXPLAIN failed'))
+
+    def test_fast_statements_are_not_logged(self):
+        from . import slow_queries
+        with override_settings(SLOW_QUERY_MS=60_000, SLOW_QUERY_LOG=self.path):
+            self.client.get(reverse('event-list'))
+        self.assertEqual(list(slow_queries.read(self.path)), [])
+
+    def test_summary_command_ranks_fingerprints(self):
+        from io import StringIO
+        from django.core.management import call_command
+        with override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=self.path):
+            for _ in range(3):
+                self.client.get(reverse('event-list'))
+        out = StringIO()
+        call_command('slow_queries', path=self.path, sort='count', explain=True, stdout=out)
+        output = out.getvalue()
+        self.assertIn('1. [', output)
+        self.assertIn('3x', output)
+        self.assertIn('EventListCreate / EventSerializer', output)
+
+
+class CommentPaginationTests(APITestCase):
+    def setUp(self):
+        from .models import Comment
+        self.user = User.objects.create_user(username='commenter', password='pw')
+        self.client.force_authenticate(user=self.user)
+        location = Location.objects.create(name="Quad", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            name="Open mic", details="Bring a song", host=self.user, location=location,
+            start_time=start, end_time=start + timedelta(hours=2), max_capacity=30,
+        )
+        self.comments = [
+            Comment.objects.create(event=self.event, user=self.user, text=f"Comment {n}") for n in range(7)
+        ]
+        self.url = reverse('event-comments', args=[self.event.pk])
+
+    def texts(self, response):
+        return [comment['text'] for comment in response.data['results']]
+
+    def test_pages_go_from_newest_to_oldest(self):
+        response = self.client.get(self.url, {'page_size': 3})
+        self.assertEqual(self.texts(response), ["Comment 6", "Comment 5", "Comment 4"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.texts(response), ["Comment 3", "Comment 2", "Comment 1"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.texts(response), ["Comment 0"])
+        self.assertIsNone(response.data['next'])
+
+    def test_after_id_returns_only_newer_comments_oldest_first(self):
+        from .models import Comment
+        newest = self.comments[-1]
+        response = self.client.get(self.url, {'after_id': newest.pk})
+        self.assertEqual(response.data['results'], [])
+
+        for n in range(7, 11):
+            Comment.objects.create(event=self.event, user=self.user, text=f"Comment {n}")
+        response = self.client.get(self.url, {'after_id': newest.pk, 'page_size': 3})
+        self.assertEqual(self.texts(response), ["Comment 7", "Comment 8", "Comment 9"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.texts(response), ["Comment 10"])
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_after_id(self):
+        response = self.client.get(self.url, {'after_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_page_reads_do_not_depend_on_thread_length(self):
+        # Top-level comments, their replies, and the user's own reactions
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'page_size': 3})
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'after_id': self.comments[2].pk, 'page_size': 3})
+
+
+class EventCommentSummaryTests(APITestCase):
+    def setUp(self):
+        from .models import Comment
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.guest = User.objects.create_user(username='guest', password='pw')
+        self.client.force_authenticate(user=self.host)
+        location = Location.objects.create(name="Gym", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        self.busy, self.quiet = [
+            Event.objects.create(
+                name=name, details="Details", host=self.host, location=location, is_public=False,
+                start_time=start, end_time=start + timedelta(hours=1), max_capacity=10,
+            )
+            for name in ("Busy", "Quiet")
+        ]
+        Comment.objects.create(event=self.busy, user=self.host, text="First!")
+        Comment.objects.create(event=self.busy, user=self.guest, text="See you there " + "x" * 300)
+
+    def test_feed_includes_comment_count_and_latest_comment(self):
+        from django.utils.dateparse import parse_datetime
+        response = self.client.get(reverse('event-list'))
+        events = {event['name']: event for event in response.data}
+        self.assertEqual(events['Busy']['comment_count'], 2)
+        preview = events['Busy']['latest_comment']
+        self.assertEqual(preview['username'], 'guest')
+        self.assertTrue(preview['text'].startswith("See you there"))
+        self.assertEqual(len(preview['text']), 120)
+        self.assertIsNotNone(parse_datetime(preview['created_at']))
+        self.assertEqual(events['Quiet']['comment_count'], 0)
+        self.assertIsNone(events['Quiet']['latest_comment'])
+
+    def test_single_event_and_nested_events_match_the_feed(self):
+        from .models import Notification
+        detail = self.client.get(reverse('event-detail', args=[self.busy.pk])).data
+        JoinRequest.objects.create(event=self.busy, user=self.guest)
+        Notification.objects.create(user=self.host, notification_type='event_update', message="Hi", event=self.busy)
+        nested = self.client.get(reverse('list-join-requests')).data[0]['event_details']
+        notified = self.client.get(reverse('notification-list')).data[0]['event_details']
+        for event in (nested, notified):
+            self.assertEqual(event['comment_count'], 2)
+            self.assertEqual(event['latest_comment'], detail['latest_comment'])
+
+        from .serializers import EventSerializer
+        unannotated = EventSerializer(Event.objects.get(pk=self.busy.pk)).data
+        self.assertEqual(unannotated['comment_count'], 2)
+        self.assertEqual(unannotated['latest_comment'], detail['latest_comment'])
+
+
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='poster', password='pw')
+        self.other = User.objects.create_user(username='replier', password='pw')
+        self.client.force_authenticate(user=self.user)
+        location = Location.objects.create(name="Commons", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            name="Book club", details="Chapter 3", host=self.user, location=location,
+            start_time=start, end_time=start + timedelta(hours=1), max_capacity=10,
+        )
+        self.url = reverse('event-comments', args=[self.event.pk])
+
+    def post(self, text, parent=None):
+        data = {'text': text}
+        if parent:
+            data['parent'] = parent
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data['id']
+
+    def react(self, comment_id, kind, method='post'):
+        url = reverse('comment-reaction', args=[self.event.pk, comment_id, kind])
+        return getattr(self.client, method)(url)
+
+    def test_thread_is_returned_depth_first_under_its_top_level_comment(self):
+        root = self.post("Who read it?")
+        first = self.post("Me", parent=root)
+        second = self.post("Not yet", parent=root)
+        nested = self.post("You should!", parent=second)
+        deeper = self.post("Agreed", parent=first)
+        other_root = self.post("Next book?")
+
+        results = self.client.get(self.url).data['results']
+        self.assertEqual([c['id'] for c in results], [other_root, root])
+        replies = results[1]['replies']
+        self.assertEqual([c['id'] for c in replies], [first, deeper, second, nested])
+        self.assertEqual([c['depth'] for c in replies], [1, 2, 1, 2])
+        self.assertEqual(replies[1]['parent'], first)
+        self.assertEqual(results[0]['replies'], [])
+
+        # Polling sees replies as well as new top-level comments
+        delta = self.client.get(self.url, {'after_id': nested}).data['results']
+        self.assertEqual([c['id'] for c in delta], [deeper, other_root])
+
+    def test_replies_stay_on_their_event_and_depth_is_limited(self):
+        from .models import Comment
+        elsewhere = Event.objects.create(
+            name="Other", details="Elsewhere", host=self.user, location=self.event.location,
+            start_time=self.event.start_time, end_time=self.event.end_time,
+        )
+        foreign = Comment.objects.create(event=elsewhere, user=self.user, text="Hi")
+        response = self.client.post(self.url, {'text': "Reply", 'parent': foreign.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        parent = self.post("Level 0")
+        with override_settings(COMMENT_MAX_DEPTH=3):
+            parent = self.post("Level 1", parent=parent)
+            parent = self.post("Level 2", parent=parent)
+            response = self.client.post(self.url, {'text': "Level 3", 'parent': parent})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_a_comment_removes_its_replies(self):
+        from .models import Comment
+        root = self.post("Root")
+        self.post("Reply", parent=self.post("Child", parent=root))
+        Comment.objects.get(pk=root).delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_reaction_counters(self):
+        comment = self.post("React to me")
+        self.assertEqual(self.react(comment, 'like').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.react(comment, 'like').status_code, status.HTTP_200_OK)  # already there
+        self.react(comment, 'love')
+        self.client.force_authenticate(user=self.other)
+        response = self.react(comment, 'like')
+        self.assertEqual(response.data['reaction_counts'], {'like': 2, 'love': 1})
+
+        response = self.react(comment, 'like', method='delete')
+        self.assertEqual(response.data['reaction_counts'], {'like': 1, 'love': 1})
+        self.react(comment, 'like', method='delete')  # nothing left to remove
+        self.client.force_authenticate(user=self.user)
+        self.react(comment, 'love', method='delete')
+
+        listed = self.client.get(self.url).data['results'][0]
+        self.assertEqual(listed['reaction_counts'], {'like': 1})
+        self.assertEqual(listed['my_reactions'], ['like'])
+        self.assertEqual(self.react(comment, 'angry').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.react(9999, 'like').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reaction_on_a_reply_reads_the_comment_once(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        reply = self.post("Reply", parent=self.post("Root"))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.react(reply, 'wow').status_code, status.HTTP_201_CREATED)
+        comment_reads = [q['sql'] for q in ctx.captured_queries
+                         if q['sql'].startswith('SELECT') and 'FROM "api_comment"' in q['sql']]
+        self.assertEqual(len(comment_reads), 1, comment_reads)
+
+    def test_reply_is_not_saved_without_its_path(self):
+        from unittest import mock
+        from django.db import DatabaseError
+        from django.db.models import QuerySet
+        from .models import Comment
+        root = Comment.objects.get(pk=self.post("Root"))
+        reply = Comment(event=self.event, user=self.other, text="Reply", parent=root)
+        with mock.patch.object(QuerySet, 'update', side_effect=DatabaseError("path update failed")):
+            with self.assertRaises(DatabaseError):
+                reply.save()
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), [root.pk])
+
+
+class NotificationOutboxTests(APITestCase):
+    def setUp(self):
+        from unittest import mock
+        from .outbox import notification_buffer
+        self.buffer = notification_buffer
+        self.buffer.clear()
+        self.addCleanup(self.buffer.clear)
+        # Keep intents buffered across requests however slowly the suite runs
+        patcher = mock.patch.object(self.buffer, 'max_age', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.location = Location.objects.create(name="Field", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            name="Pickup soccer", details="Bring cleats", host=self.host, location=self.location,
+            is_public=False, start_time=start, end_time=start + timedelta(hours=1), max_capacity=20,
+        )
+
+    def notifications(self, user):
+        from .models import Notification
+        return list(Notification.objects.filter(user=user).values_list('notification_type', 'message'))
+
+    def test_views_only_queue_notifications(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        guest = User.objects.create_user(username='alice', password='pw')
+        self.client.force_authenticate(user=guest)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('request-join-event', args=[self.event.pk]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'api_notification' in q['sql']])
+
+        self.buffer.flush()
+        self.assertEqual(self.notifications(self.host), [('join_request', "alice requested to join 'Pickup soccer'")])
+
+    def test_join_requests_are_coalesced_per_event(self):
+        for name in ('alice', 'bob', 'carol', 'dave'):
+            guest = User.objects.create_user(username=name, password='pw')
+            self.client.force_authenticate(user=guest)
+            self.client.post(reverse('request-join-event', args=[self.event.pk]))
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(
+            self.notifications(self.host),
+            [('join_request', "alice, bob and 2 others requested to join 'Pickup soccer'")],
+        )
+
+    def test_coalescing_and_skipped_recipients(self):
+        from .outbox import notify
+        quiet = User.objects.create_user(username='quiet', password='pw')
+        Profile.objects.filter(user=quiet).update(notifications_enabled=False)
+        gone = User.objects.create_user(username='gone', password='pw')
+        notify(self.host.pk, 'friend_requested', actor='bob')
+        notify(self.host.pk, 'friend_requested', actor='bob')  # a repeat counts once
+        notify(self.host.pk, 'friend_requested', actor='carol')
+        notify(quiet.pk, 'friend_requested', actor='bob')
+        notify(gone.pk, 'join_approved', self.event.pk)
+        gone.delete()
+        self.buffer.flush()
+
+        self.assertEqual(self.notifications(self.host), [('friend_request', "bob and carol sent you a friend request")])
+        self.assertEqual(self.notifications(quiet), [])
+        with self.assertRaises(ValueError):
+            notify(self.host.pk, 'no_such_kind')
+
+    def test_approve_deny_and_friend_flows_notify(self):
+        guest = User.objects.create_user(username='guest', password='pw')
+        join_request = JoinRequest.objects.create(event=self.event, user=guest)
+        self.client.force_authenticate(user=self.host)
+        self.client.post(reverse('approve-join-request', args=[join_request.pk]))
+        self.client.post(reverse('send-friend-request', args=[guest.pk]))
+        self.buffer.flush()
+        self.assertEqual(sorted(self.notifications(guest)), [
+            ('friend_request', "host sent you a friend request"),
+            ('join_request', "Your request to join 'Pickup soccer' was approved"),
+        ])
+
+    def test_event_update_fans_out_to_participants_after_the_response(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        guests = [User.objects.create_user(username=f'guest{n}', password='pw') for n in range(30)]
+        self.event.participant_list.add(self.host, *guests)
+        Profile.objects.filter(user=guests[0]).update(notifications_enabled=False)
+        self.client.force_authenticate(user=self.host)
+        url = reverse('edit-event', args=[self.event.pk])
+
+        response = self.client.patch(url, {'details': 'Bring water'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.buffer), 0)  # details are not announced
+
+        start = self.event.start_time + timedelta(hours=2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(url, {'start_time': start.isoformat(), 'end_time': (start + timedelta(hours=1)).isoformat()}, format='json')
+        self.assertFalse([q for q in ctx.captured_queries if 'api_notification' in q['sql']])
+        other = Location.objects.create(name="Gym", latitude=35.31, longitude=-80.71)
+        self.client.patch(url, {'location_id': other.pk, 'start_time': start.isoformat()}, format='json')
+        self.assertEqual(len(self.buffer), 3)  # one per changed field, whatever the attendance
+
+        self.buffer.flush()
+        message = "'Pickup soccer' was updated: start time, end time, location"
+        self.assertEqual(self.notifications(guests[1]), [('event_update', message)])
+        self.assertEqual(self.notifications(guests[29]), [('event_update', message)])
+        self.assertEqual(self.notifications(guests[0]), [])
+        self.assertEqual(self.notifications(self.host), [])
+
+    def test_event_update_by_other_user_is_rejected_without_notifying(self):
+        guest = User.objects.create_user(username='guest', password='pw')
+        self.client.force_authenticate(user=guest)
+        response = self.client.patch(reverse('edit-event', args=[self.event.pk]), {'name': 'Mine'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(self.buffer), 0)
+
+
+    def test_flusher_thread_writes_due_buffers_without_requests(self):
+        import threading
+        from unittest import mock
+        from . import buffers
+        flushed = threading.Event()
+        # Only this buffer: the flusher's own connection must not write to the test database
+        with mock.patch.object(buffers, '_buffers', []):
+            buffer = buffers.BatchBuffer('test', lambda items: flushed.set(), max_size=10, max_age=0)
+            buffers.start_flusher(0.01)
+            self.addCleanup(buffers.stop_flusher)
+            buffer.add('intent')
+            self.assertTrue(flushed.wait(5))
+            buffers.stop_flusher()
+        self.assertEqual(len(buffer), 0)
+
+    @override_settings(BUFFER_FLUSH_INTERVAL=0)
+    def test_flusher_can_be_disabled(self):
+        from . import buffers
+        buffers.start_flusher()
+        self.assertIsNone(buffers._flusher)
+
+
+class NotificationRetentionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pw')
+        location = Location.objects.create(name="Library", latitude=35.3, longitude=-80.7)
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            name="Study group", details="Chapter 4", host=self.user, location=location,
+            start_time=start, end_time=start + timedelta(hours=2), max_capacity=10,
+        )
+
+    def notification(self, message, days_old=0, is_read=False, event=None):
+        from .models import Notification
+        notification = Notification.objects.create(
+            user=self.user, notification_type='event_update', message=message, event=event, is_read=is_read,
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days_old))
+        return notification
+
+    def remaining(self):
+        from .models import Notification
+        return set(Notification.objects.values_list('message', flat=True))
+
+    def test_prune_deletes_expired_and_compacts_duplicates(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.notification("old read", days_old=40, is_read=True)
+        self.notification("old unread", days_old=40)
+        self.notification("ancient unread", days_old=400)
+        self.notification("recent read", days_old=1, is_read=True)
+        for _ in range(3):
+            self.notification("same", event=self.event)
+            self.notification("same")  # no event: a separate group
+        newest = self.notification("same", event=self.event)
+
+        out = StringIO()
+        call_command('prune_notifications', dry_run=True, stdout=out)
+        self.assertIn("Would delete 2 expired and 5 duplicate", out.getvalue())
+
+        out = StringIO()
+        call_command('prune_notifications', batch_size=2, stdout=out)
+        self.assertIn("Deleted 2 expired and 5 duplicate", out.getvalue())
+        self.assertEqual(self.remaining(), {"old unread", "recent read", "same"})
+        from .models import Notification
+        self.assertEqual(Notification.objects.filter(message="same", event=self.event).get().pk, newest.pk)
+        self.assertEqual(Notification.objects.filter(message="same", event__isnull=True).count(), 1)
+
+    def test_duplicates_are_found_in_one_window_pass(self):
+        from api.management.commands.prune_notifications import duplicates
+        for _ in range(3):
+            self.notification("same", event=self.event)
+        sql = str(duplicates().query).upper()
+        self.assertIn(' OVER ', sql)
+        self.assertNotIn('EXISTS', sql)  # no per-row probe for a newer notification
+        self.assertEqual(duplicates().count(), 2)
+
+    @override_settings(NOTIFICATION_LIST_LIMIT=3)
+    def test_list_returns_only_the_newest_notifications(self):
+        for n in range(5):
+            self.notification(f"n{n}", days_old=5 - n, event=self.event)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('notification-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['message'] for item in response.data], ["n4", "n3", "n2"])
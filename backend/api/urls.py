@@ -14,7 +14,17 @@ urlpatterns = [
     path("events/hosted/", views.HostedEventsView.as_view(), name="hosted-events"),
     path("events/joined/", views.JoinedEventsView.as_view(), name="joined-events"),
     path("events/edit/<int:pk>/", views.EventUpdate.as_view(), name="edit-event"),
+    path("events/bulk/", views.EventBulkCreate.as_view(), name="event-bulk-create"),
+    path("events/series/", views.EventSeriesListCreate.as_view(), name="event-series"),
+    path("events/series/<int:pk>/occurrences/", views.EventSeriesOccurrences.as_view(), name="event-series-occurrences"),
+    path("calendar/", views.CalendarFeedView.as_view(), name="calendar-feed"),
+    path("calendar/<str:token>.ics", views.calendar_feed_ics, name="calendar-feed-ics"),
+    path("events/clusters/<int:zoom>/<int:x>/<int:y>/", views.EventClusterTileView.as_view(), name="event-clusters"),
     
+    # --- Admin: analytics export and request metrics ---
+    path("export/<slug:dataset>.<str:extension>", views.ExportView.as_view(), name="export"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+
     # --- Join Request Endpoints ---
     path("join-requests/", views.ListJoinRequestsView.as_view(), name="list-join-requests"),
     path("join-requests/<int:pk>/approve/", views.ApproveJoinRequestView.as_view(), name="approve-join-request"),
@@ -22,6 +32,7 @@ urlpatterns = [
     
     # --- Comment Endpoints ---
     path("events/<int:event_id>/comments/", views.EventCommentListCreate.as_view(), name="event-comments"),
+    path("events/<int:event_id>/comments/<int:pk>/reactions/<slug:kind>/", views.CommentReactionView.as_view(), name="comment-reaction"),
 
     # --- User Endpoints ---
     path("user/<int:user_id>/", get_user_by_id, name="get_user_by_id"),
@@ -47,6 +58,8 @@ urlpatterns = [
     path("friends/", views.FriendsListView.as_view(), name="friends-list"),
     path("friends/remove/<int:friend_id>/", views.RemoveFriendView.as_view(), name="remove-friend"),
     path("users/search/", views.UserSearchView.as_view(), name="user-search"),
+    path("users/search/recent/", views.RecentSearchesView.as_view(), name="recent-searches"),
+    path("users/search/popular/", views.PopularSearchesView.as_view(), name="popular-searches"),
 
     # --- Messaging Endpoints ---
     path("messages/send/", views.SendMessageView.as_view(), name="send-message"),
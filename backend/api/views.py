@@ -1,12 +1,24 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.urls import reverse
+from django.views.decorators.http import condition
+from django.db import router, transaction
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce, Left
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import generics, status, permissions
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.views import APIView
-from rest_framework.exceptions import PermissionDenied 
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
 
 from .serializers import (
     UserSerializer,
@@ -14,9 +26,42 @@ from .serializers import (
     LocationSerializer,
     ProfileSerializer,
     JoinRequestSerializer,
-    CommentSerializer, FriendRequestSerializer, UserSearchSerializer, MessageSerializer
+    CommentSerializer, FriendRequestSerializer, UserSearchSerializer, MessageSerializer,
+    SearchHistorySerializer, PopularSearchSerializer, EventSeriesSerializer, OccurrenceSerializer
+)
+from .models import (
+    Event, Location, Profile, JoinRequest, Comment, CommentReaction, FriendRequest, Friendship, Message,
+    UserSearch, EventSeries, CalendarFeed, new_calendar_token
 )
-from .models import Event, Location, Profile, JoinRequest, Comment, FriendRequest, Friendship, Message
+from . import clusters, export, geo, ical, metrics, recurrence, search
+from .outbox import notify, notify_participants
+from .search_log import popular_searches, record_search
+from .locations import get_or_create_location
+
+
+def with_event_details(queryset, related=None):
+    """
+    Load what EventSerializer reads (host, location, participants and the
+    comment count and preview) up front, so a list of events, or of rows whose
+    ``related`` foreign key is an event, costs the same number of queries
+    however long it is.
+    """
+    if related:
+        return queryset.prefetch_related(Prefetch(related, queryset=with_event_details(Event.objects.all())))
+
+    # Correlated subqueries, answered from the (event, created_at, id) index
+    comments = Comment.objects.filter(event=OuterRef("pk"))
+    latest = comments.order_by("-created_at", "-id")
+    return queryset.annotate(
+        comment_count=Coalesce(Subquery(comments.order_by().values("event").annotate(n=Count("pk")).values("n")), 0),
+        latest_comment_text=Subquery(
+            latest.annotate(snippet=Left("text", settings.COMMENT_PREVIEW_LENGTH)).values("snippet")[:1]
+        ),
+        latest_comment_username=Subquery(latest.values("user__username")[:1]),
+        latest_comment_at=Subquery(latest.values("created_at")[:1]),
+    ).select_related("host", "location").prefetch_related(
+        Prefetch("participant_list", queryset=User.objects.only("id", "username"))
+    )
 
 
 # -------------------------------
@@ -34,19 +79,19 @@ class EventListCreate(generics.ListCreateAPIView):
         user = self.request.user
         if user.is_authenticated:
             # Authenticated: see all events
-            queryset = Event.objects.all()
+            queryset = with_event_details(Event.objects.all())
         else:
-            queryset = Event.objects.filter(is_public=True)
+            queryset = with_event_details(Event.objects.filter(is_public=True))
         
         # Filter by category
         category = self.request.query_params.get('category', None)
         if category:
             queryset = queryset.filter(category=category)
         
-        # Search by name (case-insensitive partial match)
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(name__icontains=search)
+        # Full-text search over name, details, category and location name
+        query = self.request.query_params.get('search', None)
+        if query:
+            queryset = search.search_events(queryset, query)
         
         # Filter by date (events starting on a specific date)
         date = self.request.query_params.get('date', None)
@@ -58,6 +103,11 @@ class EventListCreate(generics.ListCreateAPIView):
         if location:
             queryset = queryset.filter(location__id=location)
 
+        # Map area filters: ?bbox=west,south,east,north and ?near=lat,lng&radius=metres
+        queryset, by_distance = geo.filter_by_area(
+            queryset, self.request.query_params, prefix='location__'
+        )
+
         # Filter by date range
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
@@ -65,13 +115,164 @@ class EventListCreate(generics.ListCreateAPIView):
             queryset = queryset.filter(start_time__gte=start_date)
         if end_date:
             queryset = queryset.filter(start_time__lte=end_date)
-            
+
+        if query:
+            # Best matches first when searching
+            return queryset.order_by('search_rank', 'start_time')
+        if by_distance:
+            return queryset.order_by('distance', 'start_time')
         return queryset.order_by('start_time')
 
     def perform_create(self, serializer):
         serializer.save(host=self.request.user)
 
 
+# -------------------------------
+# Event Map Clusters
+# -------------------------------
+class EventClusterTileView(APIView):
+    """
+    Clustered counts of upcoming events inside one map tile (z/x/y),
+    with a per-category breakdown. Anonymous users only see public events.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, zoom, x, y):
+        if zoom > geo.MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+            return Response({"detail": "Tile out of range."}, status=status.HTTP_404_NOT_FOUND)
+        public_only = not request.user.is_authenticated
+        return Response({
+            "zoom": zoom,
+            "x": x,
+            "y": y,
+            "clusters": clusters.tile_clusters(zoom, x, y, public_only),
+        })
+
+
+# -------------------------------
+# Bulk Event Create
+# -------------------------------
+class EventBulkCreate(APIView):
+    """
+    Create a list of events in one transaction: either all are created or,
+    if any is invalid, none are and the per-event errors are returned.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            raise ValidationError({"detail": "Expected a non-empty list of events."})
+        if len(request.data) > settings.EVENT_BULK_CREATE_MAX:
+            raise ValidationError({"detail": f"At most {settings.EVENT_BULK_CREATE_MAX} events per request."})
+
+        serializer = EventSerializer(data=request.data, many=True, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+
+        # The serializer has already checked what Event.save()'s full_clean() would,
+        # and bulk_create skips the post_save signals, so index and invalidate here
+        with transaction.atomic():
+            events = Event.objects.bulk_create(
+                Event(host=request.user, **attrs) for attrs in serializer.validated_data
+            )
+            search.index_events(events)
+        clusters.invalidate()
+
+        events = with_event_details(Event.objects.filter(pk__in=[event.pk for event in events])).order_by("pk")
+        return Response(EventSerializer(events, many=True).data, status=status.HTTP_201_CREATED)
+
+
+# -------------------------------
+# Recurring Event Series
+# -------------------------------
+def _series_queryset(user):
+    if user.is_authenticated:
+        return EventSeries.objects.all()
+    return EventSeries.objects.filter(is_public=True)
+
+
+def _occurrence_window(params):
+    """The [start, end) window from ?start= and ?end= (ISO dates or datetimes)."""
+    def parse(name, default):
+        value = params.get(name)
+        if not value:
+            return default
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({name: "Expected an ISO date or datetime."})
+            parsed = datetime.combine(day, time.min)
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+    start = parse("start", timezone.now())
+    end = parse("end", start + timedelta(days=settings.EVENT_SERIES_DEFAULT_WINDOW_DAYS))
+    if end <= start:
+        raise ValidationError({"end": "Must be after start."})
+    if end - start > timedelta(days=settings.EVENT_SERIES_MAX_WINDOW_DAYS):
+        raise ValidationError({"end": f"Window is limited to {settings.EVENT_SERIES_MAX_WINDOW_DAYS} days."})
+    return start, end
+
+
+class EventSeriesListCreate(generics.ListCreateAPIView):
+    serializer_class = EventSeriesSerializer
+
+    def get_permissions(self):
+        if self.request.method == "GET":
+            return [AllowAny()]
+        return [IsAuthenticated()]
+
+    def get_queryset(self):
+        return _series_queryset(self.request.user).select_related("host", "location")
+
+    def perform_create(self, serializer):
+        # The upcoming occurrences become events at once; materialize_series adds later ones daily
+        recurrence.materialize_upcoming([serializer.save(host=self.request.user)])
+
+
+class EventSeriesOccurrences(APIView):
+    """
+    GET: the occurrences of a series within ?start=&end= (default: the next
+    EVENT_SERIES_DEFAULT_WINDOW_DAYS days).
+    POST {"start_time": ...}: materialize one occurrence as an Event (e.g. to
+    join it) and return that event.
+    """
+
+    def get_permissions(self):
+        if self.request.method == "GET":
+            return [AllowAny()]
+        return [IsAuthenticated()]
+
+    def get(self, request, pk):
+        series = get_object_or_404(_series_queryset(request.user), pk=pk)
+        start, end = _occurrence_window(request.query_params)
+        occurrences = list(series.occurrences(start, end))
+        materialized = dict(
+            series.events.filter(start_time__gte=start, start_time__lt=end)
+            .values_list("start_time", "id")
+        )
+        data = [
+            {"series": series.id, "start_time": s, "end_time": e, "event_id": materialized.get(s)}
+            for s, e in occurrences
+        ]
+        return Response(OccurrenceSerializer(data, many=True).data)
+
+    def post(self, request, pk):
+        series = get_object_or_404(_series_queryset(request.user), pk=pk)
+        start_time = parse_datetime(str(request.data.get("start_time", "")))
+        if start_time is None:
+            raise ValidationError({"start_time": "Expected an ISO datetime."})
+        if not timezone.is_aware(start_time):
+            start_time = timezone.make_aware(start_time)
+        try:
+            event, created = recurrence.materialize(series, start_time)
+        except ValueError as exc:
+            raise ValidationError({"start_time": str(exc)})
+        return Response(
+            EventSerializer(event).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
 # -------------------------------
 # Event Detail (view only)
 # -------------------------------
@@ -84,7 +285,7 @@ class EventDetail(generics.RetrieveAPIView):
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        return Event.objects.all()
+        return with_event_details(Event.objects.all())
 
 
 # -------------------------------
@@ -95,11 +296,28 @@ class EventUpdate(generics.UpdateAPIView):
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    # Fields participants are told about when they change, with their labels
+    NOTIFY_FIELDS = {
+        "name": "name",
+        "location": "location",
+        "start_time": "start time",
+        "end_time": "end time",
+    }
+
+    def snapshot(self, event):
+        return {name: getattr(event, Event._meta.get_field(name).attname) for name in self.NOTIFY_FIELDS}
+
     def perform_update(self, serializer):
-        event = self.get_object()
-        if event.host != self.request.user:
+        event = serializer.instance
+        if event.host_id != self.request.user.id:
             raise PermissionDenied("You are not allowed to edit this event.")
+        before = self.snapshot(event)
         serializer.save()
+        after = self.snapshot(serializer.instance)
+        changes = [label for name, label in self.NOTIFY_FIELDS.items() if before[name] != after[name]]
+        if changes:
+            # One queued intent, fanned out to the participants after the response
+            notify_participants(event.pk, "event_updated", changes)
 
 
 # -------------------------------
@@ -179,10 +397,12 @@ class RequestJoinEventView(APIView):
             elif existing_request.status == 'denied':
                 existing_request.status = 'pending'
                 existing_request.save()
+                notify(event.host_id, "join_requested", event.pk, actor=user.username)
                 serializer = JoinRequestSerializer(existing_request)
                 return Response(serializer.data, status=status.HTTP_200_OK)
 
         join_request = JoinRequest.objects.create(event=event, user=user)
+        notify(event.host_id, "join_requested", event.pk, actor=user.username)
         serializer = JoinRequestSerializer(join_request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -196,10 +416,10 @@ class ListJoinRequestsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return JoinRequest.objects.filter(
+        return with_event_details(JoinRequest.objects.filter(
             event__host=self.request.user,
             status='pending'
-        ).select_related('event', 'user')
+        ).select_related('user'), related='event')
 
 
 # -------------------------------
@@ -227,6 +447,7 @@ class ApproveJoinRequestView(APIView):
         join_request.status = 'approved'
         join_request.save()
         join_request.event.participant_list.add(join_request.user)
+        notify(join_request.user_id, "join_approved", join_request.event_id)
 
         serializer = JoinRequestSerializer(join_request)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -252,6 +473,7 @@ class DenyJoinRequestView(APIView):
 
         join_request.status = 'denied'
         join_request.save()
+        notify(join_request.user_id, "join_denied", join_request.event_id)
 
         serializer = JoinRequestSerializer(join_request)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -284,7 +506,7 @@ class HostedEventsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Event.objects.filter(host=self.request.user).order_by("-start_time")
+        return with_event_details(Event.objects.filter(host=self.request.user)).order_by("-start_time")
 
 
 class JoinedEventsView(generics.ListAPIView):
@@ -292,7 +514,104 @@ class JoinedEventsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Event.objects.filter(participant_list=self.request.user).order_by("-start_time")
+        return with_event_details(Event.objects.filter(participant_list=self.request.user)).order_by("-start_time")
+
+
+# -------------------------------
+# Calendar Feed (.ics)
+# -------------------------------
+class CalendarFeedView(APIView):
+    """
+    GET: the URL of the current user's calendar feed (created on first use).
+    POST: replace the feed's token, revoking the old URL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        feed, _ = CalendarFeed.objects.get_or_create(user_id=request.user.id)
+        return Response(self.describe(request, feed))
+
+    def post(self, request):
+        feed, created = CalendarFeed.objects.get_or_create(user_id=request.user.id)
+        if not created:
+            feed.token = new_calendar_token()
+            feed.save(update_fields=["token"])
+        return Response(self.describe(request, feed))
+
+    def describe(self, request, feed):
+        return {"url": request.build_absolute_uri(reverse("calendar-feed-ics", args=[feed.token]))}
+
+
+def _calendar_state(request, token):
+    """(feed, last_modified, etag), computed once per request for the condition() callbacks."""
+    if not hasattr(request, "_calendar_state"):
+        feed = CalendarFeed.objects.filter(token=token).first()
+        request._calendar_state = (feed, *ical.feed_state(feed)) if feed else (None, None, None)
+    return request._calendar_state
+
+
+@condition(
+    etag_func=lambda request, token: _calendar_state(request, token)[2],
+    last_modified_func=lambda request, token: _calendar_state(request, token)[1],
+)
+def calendar_feed_ics(request, token):
+    """The iCalendar feed itself; the token in the URL is the only credential."""
+    feed = _calendar_state(request, token)[0]
+    if feed is None:
+        raise Http404("No such calendar feed.")
+    # Resolve the database now: the body is read after this view (and its routing) returns
+    using = router.db_for_read(Event)
+    response = StreamingHttpResponse(ical.render(feed.user_id, using), content_type="text/calendar; charset=utf-8")
+    response["Content-Disposition"] = 'inline; filename="unimeet.ics"'
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# -------------------------------
+# Analytics Export (admin only)
+# -------------------------------
+class ExportView(APIView):
+    """
+    Stream a whole dataset for analytics, e.g. /api/export/comments.csv.gz
+    (see api/export.py for datasets and columns).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, dataset, extension):
+        fmt, _, compressed = extension.partition(".")
+        if dataset not in export.DATASETS or fmt not in export.FORMATS or compressed not in ("", "gz"):
+            raise Http404("Unknown export.")
+        # Resolve the database now: the body is read after this view (and its routing) returns
+        using = router.db_for_read(Event)
+        response = StreamingHttpResponse(
+            export.stream(dataset, fmt, compress=bool(compressed), using=using),
+            content_type="application/gzip" if compressed else
+            ("text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson; charset=utf-8"),
+        )
+        response["Content-Disposition"] = f'attachment; filename="{dataset}.{extension}"'
+        return response
+
+
+# -------------------------------
+# Request Metrics (admin only)
+# -------------------------------
+class MetricsView(APIView):
+    """
+    GET: p50/p95/p99 latency, SQL time, serializer time and query count per
+    route, from the requests this process sampled (see api/metrics.py).
+    DELETE: clear the samples.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "sample_rate": 1.0 if settings.METRICS_HEADERS else settings.METRICS_SAMPLE_RATE,
+            "routes": metrics.report(),
+        })
+
+    def delete(self, request):
+        metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 # -------------------------------
@@ -308,13 +627,18 @@ def create_location(request):
         return Response({"error": "name, latitude, and longitude are required."},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    location = Location.objects.filter(name=name, latitude=latitude, longitude=longitude).first()
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return Response({"error": "latitude and longitude must be numbers."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return Response({"error": "latitude or longitude out of range."},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    if not location:
-        location = Location.objects.create(name=name, latitude=latitude, longitude=longitude)
-        status_code = status.HTTP_201_CREATED
-    else:
-        status_code = status.HTTP_200_OK
+    # Same name within a few metres of an existing location reuses it
+    location, created = get_or_create_location(name, latitude, longitude)
+    status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
 
     serializer = LocationSerializer(location)
     return Response(serializer.data, status=status_code)
@@ -323,7 +647,10 @@ def create_location(request):
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def location_list(request):
-    locations = Location.objects.all()
+    """All locations, or those in ?bbox= / within ?near=&radius= (nearest first)."""
+    locations, by_distance = geo.filter_by_area(Location.objects.all(), request.query_params)
+    if by_distance:
+        locations = locations.order_by('distance')
     serializer = LocationSerializer(locations, many=True)
     return Response(serializer.data)
 
@@ -421,20 +748,125 @@ def get_user_profile(request, user_id):
 # -------------------------------
 # Comments (Event-specific)
 # -------------------------------
+class CommentCursorPagination(CursorPagination):
+    """Newest comments first; ``next`` pages back through older ones."""
+    ordering = ('-created_at', '-id')
+    page_size = settings.COMMENT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.COMMENT_MAX_PAGE_SIZE
+
+
 class EventCommentListCreate(generics.ListCreateAPIView):
-    """List and create comments for a specific event."""
+    """
+    List and create comments for a specific event.
+
+    Without parameters this returns the newest page of top-level comments,
+    newest first, each with its replies; follow ``next`` to load older ones.
+    For polling, ``?after_id=<id>`` returns only the comments and replies
+    posted after that one, oldest first, with ``next`` set when there are more
+    than a page. Either way a request reads one page from an index, and a
+    page with its threads takes three queries however long they are.
+    """
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CommentCursorPagination
 
     def get_queryset(self):
         event_id = self.kwargs.get('event_id')
         return Comment.objects.filter(event_id=event_id).select_related('user')
 
+    def list(self, request, *args, **kwargs):
+        after_id = request.query_params.get('after_id')
+        if after_id is None:
+            page = self.paginate_queryset(self.get_queryset().filter(parent__isnull=True))
+            self.load_threads(page)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        try:
+            after_id = int(after_id)
+        except ValueError:
+            raise ValidationError({"detail": "after_id must be an integer."})
+
+        page_size = self.paginator.get_page_size(request)
+        comments = list(
+            # By id, so the (event_id, id) FK index returns the rows already sorted
+            self.get_queryset().filter(id__gt=after_id).order_by('id')[:page_size + 1]
+        )
+        next_url = None
+        if len(comments) > page_size:
+            comments = comments[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'after_id', comments[-1].id)
+        self.load_own_reactions(comments)
+        return Response({
+            "next": next_url,
+            "previous": None,
+            "results": self.get_serializer(comments, many=True).data,
+        })
+
+    def load_threads(self, roots):
+        """Attach each top-level comment's replies, in tree order, as thread_replies."""
+        if not roots:
+            return
+        threads = {root.pk: [] for root in roots}
+        replies = list(
+            Comment.objects.filter(thread__in=roots).select_related('user').order_by('thread_id', 'path')
+        )
+        for reply in replies:
+            threads[reply.thread_id].append(reply)
+        for root in roots:
+            root.thread_replies = threads[root.pk]
+        self.load_own_reactions(roots + replies)
+
+    def load_own_reactions(self, comments):
+        prefetch_related_objects(comments, Prefetch(
+            'reactions', queryset=CommentReaction.objects.filter(user=self.request.user), to_attr='own_reactions',
+        ))
+
     def perform_create(self, serializer):
         event_id = self.kwargs.get('event_id')
         event = get_object_or_404(Event, pk=event_id)
+        parent = serializer.validated_data.get('parent')
+        if parent is not None and parent.event_id != event.pk:
+            raise ValidationError({"parent": "Replies must be on the same event."})
         serializer.save(user=self.request.user, event=event)
 
+
+class CommentReactionView(APIView):
+    """
+    POST adds the current user's reaction of a kind to a comment, DELETE
+    removes it. Both return the comment's updated reaction_counts, which are
+    adjusted under a row lock rather than counted on every read.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, event_id, pk, kind):
+        return self.change(request, event_id, pk, kind, add=True)
+
+    def delete(self, request, event_id, pk, kind):
+        return self.change(request, event_id, pk, kind, add=False)
+
+    def change(self, request, event_id, pk, kind, add):
+        if kind not in dict(CommentReaction.REACTION_CHOICES):
+            raise ValidationError({"kind": f"Unknown reaction '{kind}'."})
+        with transaction.atomic():
+            comment = get_object_or_404(
+                Comment.objects.select_for_update().only('id', 'event_id', 'reaction_counts'),
+                pk=pk, event_id=event_id,
+            )
+            if add:
+                _, changed = CommentReaction.objects.get_or_create(comment=comment, user=request.user, kind=kind)
+            else:
+                changed = CommentReaction.objects.filter(comment=comment, user=request.user, kind=kind).delete()[0] > 0
+            if changed:
+                counts = comment.reaction_counts
+                counts[kind] = counts.get(kind, 0) + (1 if add else -1)
+                if counts[kind] <= 0:
+                    del counts[kind]
+                # A queryset update: Comment.save() would load the deferred thread fields
+                Comment.objects.filter(pk=comment.pk).update(reaction_counts=counts)
+
+        code = status.HTTP_201_CREATED if add and changed else status.HTTP_200_OK
+        return Response({"reaction_counts": comment.reaction_counts}, status=code)
+
 # -------------------------------
 # Friend Requests
 # -------------------------------        
@@ -464,9 +896,11 @@ class FriendRequestView(generics.CreateAPIView):
             elif existing_request.status == 'denied':
                 existing_request.status = 'pending'
                 existing_request.save()
+                notify(to_user.id, "friend_requested", actor=self.request.user.username)
                 return
 
         serializer.save(from_user=self.request.user, to_user=to_user)
+        notify(to_user.id, "friend_requested", actor=self.request.user.username)
 
 
 class AcceptFriendRequestView(generics.UpdateAPIView):
@@ -496,6 +930,7 @@ class AcceptFriendRequestView(generics.UpdateAPIView):
         
         # Create friendship if it doesn't already exist
         Friendship.objects.get_or_create(user1=user1, user2=user2)
+        notify(friend_request.from_user_id, "friend_accepted", actor=request.user.username)
 
         return Response({"detail": "Friend request accepted."}, status=status.HTTP_200_OK)
     
@@ -576,6 +1011,7 @@ class SendFriendRequestView(APIView):
                 existing_request.from_user = request.user
                 existing_request.to_user = to_user
                 existing_request.save()
+                notify(to_user.id, "friend_requested", actor=request.user.username)
                 serializer = FriendRequestSerializer(existing_request)
                 return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -584,6 +1020,7 @@ class SendFriendRequestView(APIView):
             from_user=request.user,
             to_user=to_user
         )
+        notify(to_user.id, "friend_requested", actor=request.user.username)
         serializer = FriendRequestSerializer(friend_request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -593,7 +1030,9 @@ class ReceivedFriendRequestsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return FriendRequest.objects.filter(to_user=self.request.user, status='pending')
+        return FriendRequest.objects.filter(
+            to_user=self.request.user, status='pending'
+        ).select_related('from_user', 'to_user')
 
 
 class SentFriendRequestsView(generics.ListAPIView):
@@ -602,7 +1041,9 @@ class SentFriendRequestsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return FriendRequest.objects.filter(from_user=self.request.user, status='pending')
+        return FriendRequest.objects.filter(
+            from_user=self.request.user, status='pending'
+        ).select_related('from_user', 'to_user')
 
 
 class RemoveFriendView(APIView):
@@ -658,15 +1099,58 @@ class UserSearchSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email']
 
 class UserSearchView(generics.ListAPIView):
-    """Search users by username (case-insensitive partial match)."""
+    """
+    Search users by username through the search index.
+    One or two characters match the start of a username, longer queries match
+    anywhere. Friends come first; use ?limit= and ?offset= to page.
+    """
     serializer_class = UserSearchSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         query = self.request.query_params.get('q', '')
-        if query:
-            return User.objects.filter(username__icontains=query).exclude(id=self.request.user.id)
-        return User.objects.none()
+        if not query.strip():
+            return []
+
+        try:
+            limit = int(self.request.query_params.get('limit', settings.USER_SEARCH_PAGE_SIZE))
+            offset = int(self.request.query_params.get('offset', 0))
+        except ValueError:
+            raise ValidationError({"detail": "limit and offset must be integers."})
+        limit = min(max(limit, 1), settings.USER_SEARCH_MAX_PAGE_SIZE)
+        offset = max(offset, 0)
+
+        if offset == 0:
+            # Buffered; written after the response (see api/search_log.py)
+            record_search(self.request.user, query)
+        return search.search_users(query, user=self.request.user, limit=limit, offset=offset)
+
+
+class RecentSearchesView(generics.ListAPIView):
+    """The current user's most recent distinct searches."""
+    serializer_class = SearchHistorySerializer
+    permission_classes = [IsAuthenticated]
+    max_results = 10
+
+    def get_queryset(self):
+        recent = []
+        seen = set()
+        for entry in UserSearch.objects.filter(user=self.request.user)[:self.max_results * 5]:
+            if entry.query not in seen:
+                seen.add(entry.query)
+                recent.append(entry)
+            if len(recent) == self.max_results:
+                break
+        return recent
+
+
+class PopularSearchesView(generics.ListAPIView):
+    """The most searched queries across all users, without usernames or rare queries."""
+    serializer_class = PopularSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return popular_searches()
 
 
 # -------------------------------
@@ -694,23 +1178,27 @@ class ConversationListView(APIView):
         received_from = Message.objects.filter(recipient=user).values_list('sender_id', flat=True).distinct()
         
         conversation_user_ids = set(sent_to) | set(received_from)
-        users = User.objects.filter(id__in=conversation_user_ids)
-        
-        # Get last message and unread count for each conversation
+
+        # Last message of each conversation as a subquery, unread counts in one
+        # grouped query: a fixed number of queries however many conversations
+        last_message_id = Message.objects.filter(
+            Q(sender=user, recipient=OuterRef('pk')) | Q(sender=OuterRef('pk'), recipient=user)
+        ).order_by('-created_at', '-id').values('id')[:1]
+        users = User.objects.filter(id__in=conversation_user_ids).annotate(
+            last_message_id=Subquery(last_message_id)
+        )
+        unread_counts = dict(
+            Message.objects.filter(recipient=user, read=False)
+            .values_list('sender_id').annotate(count=Count('id')).order_by()
+        )
+        users = list(users)
+        last_messages = Message.objects.in_bulk([u.last_message_id for u in users if u.last_message_id])
+
         conversations = []
         for other_user in users:
-            # Get last message between users
-            last_message = Message.objects.filter(
-                Q(sender=user, recipient=other_user) | Q(sender=other_user, recipient=user)
-            ).order_by('-created_at').first()
-            
-            # Count unread messages from other user
-            unread_count = Message.objects.filter(
-                sender=other_user,
-                recipient=user,
-                read=False
-            ).count()
-            
+            last_message = last_messages.get(other_user.last_message_id)
+            unread_count = unread_counts.get(other_user.id, 0)
+
             conversations.append({
                 'user': {
                     'id': other_user.id,
@@ -743,7 +1231,7 @@ class MessageThreadView(generics.ListAPIView):
         messages = Message.objects.filter(
             Q(sender=user, recipient_id=other_user_id) |
             Q(sender_id=other_user_id, recipient=user)
-        ).order_by('created_at')
+        ).select_related('sender', 'recipient').order_by('created_at')
         
         return messages
 
@@ -776,12 +1264,13 @@ from .models import Notification
 from .serializers import NotificationSerializer
 
 class NotificationListView(generics.ListAPIView):
-    """List all notifications for the current user."""
+    """List the current user's newest notifications (at most NOTIFICATION_LIST_LIMIT)."""
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        notifications = Notification.objects.filter(user=self.request.user)[:settings.NOTIFICATION_LIST_LIMIT]
+        return with_event_details(notifications, related='event')
 
 
 class UnreadNotificationCountView(APIView):
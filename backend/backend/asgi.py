@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Write buffered notifications and searches even when no requests come in
+from api.buffers import start_flusher
+
+start_flusher()
@@ -35,7 +35,7 @@ ALLOWED_HOSTS = ["*"]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.StatelessJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -45,8 +45,14 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "api.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.serializers.ClaimsTokenRefreshSerializer",
 }
 
+# How long authentication trusts a cached user identity (see api/authentication.py);
+# bounds how late other processes see a revocation when the cache isn't shared.
+AUTH_USER_CACHE_SECONDS = 300
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -63,12 +69,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
      
+    "api.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,13 +103,102 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# Configured from the environment (or .env). DB_ENGINE=sqlite (default) or
+# DB_ENGINE=postgres; see README.md for the full list of variables.
+
+def env_bool(name, default=False):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").strip().lower()
+
+if DB_ENGINE in ("postgres", "postgresql"):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("DB_NAME", "unimeet"),
+            'USER': os.getenv("DB_USER", "unimeet"),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", "5432"),
+            # Reuse connections across requests instead of reconnecting each time
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+            },
+        }
+    }
+    if env_bool("DB_POOL"):
+        # Django's built-in pool needs psycopg 3 (pip install "psycopg[pool]")
+        # and replaces persistent connections.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            'timeout': int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+elif DB_ENGINE == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'OPTIONS': {
+                # WAL lets readers run alongside the single writer; writers wait
+                # up to busy_timeout for the lock instead of failing at once.
+                'init_command': (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    f"PRAGMA busy_timeout={int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))};"
+                    "PRAGMA temp_store=MEMORY;"
+                    "PRAGMA cache_size=-20000;"
+                    "PRAGMA mmap_size=134217728;"
+                ),
+                # Take the write lock when a transaction starts, so two
+                # transactions never deadlock upgrading read locks.
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")) / 1000,
+            },
+        }
+    }
+else:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE {DB_ENGINE!r}; use 'sqlite' or 'postgres'.")
+
+# Optional read replica for GET requests (see api/db_routers.py). With SQLite
+# set DB_REPLICA_NAME to a second database file; with PostgreSQL set
+# DB_REPLICA_HOST (and DB_REPLICA_PORT / DB_REPLICA_NAME if they differ).
+REPLICA_DATABASE = None
+if os.getenv("DB_REPLICA_NAME") or os.getenv("DB_REPLICA_HOST"):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': os.getenv("DB_REPLICA_NAME", DATABASES['default']['NAME']),
+        # Tests run against one database; the replica alias points at it
+        'TEST': {'MIRROR': 'default'},
+    }
+    if 'HOST' in DATABASES['default']:
+        DATABASES[REPLICA_DATABASE]['HOST'] = os.getenv("DB_REPLICA_HOST", DATABASES['default']['HOST'])
+        DATABASES[REPLICA_DATABASE]['PORT'] = os.getenv("DB_REPLICA_PORT", DATABASES['default']['PORT'])
+
+DATABASE_ROUTERS = ['api.db_routers.ReadReplicaRouter']
+
+# How long a user's reads stay on the primary after they write. The pin lives
+# in the default cache, so with several worker processes it needs a shared
+# cache (CACHE_REDIS_URL); otherwise another worker may serve the replica.
+REPLICA_PIN_SECONDS = 5
+
+# Caches are per process unless CACHE_REDIS_URL points at a Redis server
+# (needs `pip install redis`); then every worker sees the same entries.
+if os.getenv("CACHE_REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("CACHE_REDIS_URL"),
+        }
     }
-}
 
 
 # Password validation
@@ -122,6 +219,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (see api/hashers.py). PASSWORD_HASHER picks the algorithm for
+# new hashes (pbkdf2, scrypt or argon2); the others still verify old hashes, which
+# are re-hashed with the current algorithm and cost on the next login. Compare
+# settings with `python manage.py benchmark_password_hashers`.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "pbkdf2")
+# Unset uses Django's default (1,000,000 in Django 5.2). OWASP's minimum for
+# PBKDF2-SHA256 is 600,000; hashes with a different count are re-hashed on login.
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "0")) or None
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv("PASSWORD_SCRYPT_WORK_FACTOR", str(2 ** 14)))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "2"))
+PASSWORD_ARGON2_MEMORY_KIB = int(os.getenv("PASSWORD_ARGON2_MEMORY_KIB", "102400"))
+
+PASSWORD_HASHER_CLASSES = {
+    "pbkdf2": "api.hashers.PBKDF2PasswordHasher",
+    "scrypt": "api.hashers.ScryptPasswordHasher",
+    "argon2": "api.hashers.Argon2PasswordHasher",
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+] + [
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -147,3 +268,73 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
+
+# User search (see api/search.py)
+USER_SEARCH_PAGE_SIZE = 20
+USER_SEARCH_MAX_PAGE_SIZE = 50
+
+# Buffered writes (see api/buffers.py) are flushed after responses and by a
+# daemon thread the WSGI/ASGI app starts, which checks every N seconds (0 = off)
+BUFFER_FLUSH_INTERVAL = float(os.getenv("BUFFER_FLUSH_INTERVAL", "1"))
+
+# Search history is written in batches after responses (see api/search_log.py)
+SEARCH_LOG_BATCH_SIZE = 200
+SEARCH_LOG_FLUSH_INTERVAL = 10  # seconds
+# Popular searches are public: only queries searched at least this often are shown
+POPULAR_SEARCH_MIN_COUNT = 5
+
+# Notifications are queued by views and written in batches (see api/outbox.py),
+# so one shows up about NOTIFICATION_FLUSH_INTERVAL + BUFFER_FLUSH_INTERVAL
+# seconds after the request that caused it
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_FLUSH_INTERVAL = 2  # seconds
+# Retention (see the prune_notifications command): read notifications are kept
+# this many days, unread ones longer. The list endpoint returns the newest N.
+NOTIFICATION_READ_RETENTION_DAYS = 30
+NOTIFICATION_RETENTION_DAYS = 180
+NOTIFICATION_LIST_LIMIT = 200
+
+# Map clusters are cached per tile (see api/clusters.py). An edit invalidates
+# the tiles of the process that made it; with the default per-process cache,
+# other processes may serve the old tiles for up to this many seconds.
+EVENT_CLUSTER_CACHE_SECONDS = 60
+
+# Event comments are paged newest first (see EventCommentListCreate)
+COMMENT_PAGE_SIZE = 50
+COMMENT_MAX_PAGE_SIZE = 200
+# Levels of comments in a thread, counting the top-level comment
+COMMENT_MAX_DEPTH = 8
+# Characters of the latest comment shown with each event in the feed
+COMMENT_PREVIEW_LENGTH = 120
+
+# Events created per request by the bulk endpoint
+EVENT_BULK_CREATE_MAX = 500
+
+# Recurring series occurrences (see api/recurrence.py): default and largest query window
+EVENT_SERIES_DEFAULT_WINDOW_DAYS = 30
+EVENT_SERIES_MAX_WINDOW_DAYS = 366
+# Occurrences starting this many days ahead are stored as events, so they are
+# listed, searchable and in calendar feeds (run materialize_series daily)
+EVENT_SERIES_MATERIALIZE_DAYS = 30
+
+# Calendar feeds (see api/ical.py) leave out events that ended longer ago than this
+CALENDAR_FEED_PAST_DAYS = 90
+
+# Request metrics (see api/metrics.py): the fraction of requests measured,
+# whether to measure all of them and return the numbers as response headers,
+# and how many samples to keep per route for the percentiles at /api/metrics/
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0"))
+METRICS_HEADERS = env_bool("METRICS_HEADERS", DEBUG)
+METRICS_MAX_SAMPLES = 1000
+
+# Slow-query log (see api/slow_queries.py): statements slower than this are
+# written with their EXPLAIN plan to a rotating JSON lines file; an empty
+# SLOW_QUERY_LOG turns it off. Summarize with `manage.py slow_queries`.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", str(BASE_DIR / "slow_queries.jsonl"))
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Location deduplication (see api/locations.py)
+LOCATION_COORDINATE_DECIMALS = 6  # ~0.1 m
+LOCATION_DEDUPE_RADIUS_M = 25
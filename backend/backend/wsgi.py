@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Write buffered notifications and searches even when no requests come in
+from api.buffers import start_flusher
+
+start_flusher()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { MapContainer, TileLayer, Marker, Popup } from "react-leaflet";
 import "leaflet/dist/leaflet.css";
 import "../styles/EventView.css";
@@ -20,13 +20,38 @@ L.Icon.Default.mergeOptions({
   shadowUrl: markerShadow,
 });
 
+const REACTIONS = [
+  ["like", "👍"],
+  ["love", "❤️"],
+  ["laugh", "😂"],
+  ["wow", "😮"],
+  ["sad", "😢"],
+];
+
+// Replies of one thread, depth first, from their parent pointers
+const threadOrder = (rootId, replies) => {
+  const children = {};
+  replies.forEach(r => { (children[r.parent] = children[r.parent] || []).push(r); });
+  const ordered = [];
+  const visit = (id) => (children[id] || [])
+    .sort((a, b) => a.id - b.id)
+    .forEach(r => { ordered.push(r); visit(r.id); });
+  visit(rootId);
+  return ordered;
+};
+
+const allComments = (list) => list.flatMap(c => [c, ...(c.replies || [])]);
+
 const EventView = () => {
   const [events, setEvents] = useState([]);
   const [loading, setLoading] = useState(true);
   const [currentID, setCurrentID] = useState(null);
   const [expandedEventId, setExpandedEventId] = useState(null);
   const [comments, setComments] = useState({});
+  const [olderComments, setOlderComments] = useState({}); // next-page URL per event
+  const commentsRef = useRef({});
   const [newComment, setNewComment] = useState({});
+  const [replyTo, setReplyTo] = useState({}); // comment being replied to per event
   const [loadingComments, setLoadingComments] = useState({});
   const [searchQuery, setSearchQuery] = useState("");
   const [categoryFilter, setCategoryFilter] = useState("");
@@ -84,13 +109,45 @@ const EventView = () => {
     }
   };
 
+  useEffect(() => {
+    commentsRef.current = comments;
+  }, [comments]);
+
+  // Top-level comments are kept oldest first (pages arrive newest first),
+  // each with its replies; new replies are slotted into their thread
+  const addComments = (eventId, newer, older = []) => {
+    setComments(prev => {
+      const current = prev[eventId] || [];
+      const seen = new Set(allComments(current).map(c => c.id));
+      const fresh = (list) => list.filter(c => !seen.has(c.id));
+      const replies = fresh(newer).filter(c => c.parent);
+      const roots = [...fresh(older), ...current, ...fresh(newer).filter(c => !c.parent)];
+      return {
+        ...prev,
+        [eventId]: roots.map(root => {
+          const added = replies.filter(r => r.thread === root.id);
+          return added.length ? { ...root, replies: threadOrder(root.id, [...root.replies, ...added]) } : root;
+        }),
+      };
+    });
+  };
+
+  const updateComment = (eventId, commentId, changes) => {
+    const update = (c) => (c.id === commentId ? { ...c, ...changes } : c);
+    setComments(prev => ({
+      ...prev,
+      [eventId]: (prev[eventId] || []).map(root => ({ ...update(root), replies: root.replies.map(update) })),
+    }));
+  };
+
   const fetchComments = async (eventId) => {
     if (loadingComments[eventId]) return;
     
     setLoadingComments(prev => ({ ...prev, [eventId]: true }));
     try {
       const response = await api.get(`/api/events/${eventId}/comments/`);
-      setComments(prev => ({ ...prev, [eventId]: response.data }));
+      setComments(prev => ({ ...prev, [eventId]: [...response.data.results].reverse() }));
+      setOlderComments(prev => ({ ...prev, [eventId]: response.data.next }));
     } catch (err) {
       console.error("Error fetching comments:", err);
     } finally {
@@ -98,6 +155,36 @@ const EventView = () => {
     }
   };
 
+  // Polling: only ask for comments posted after the newest one we have
+  const fetchNewComments = async (eventId) => {
+    const current = commentsRef.current[eventId];
+    if (!current || current.length === 0) return fetchComments(eventId);
+
+    const newestId = Math.max(...allComments(current).map(c => c.id));
+    let url = `/api/events/${eventId}/comments/?after_id=${newestId}`;
+    try {
+      while (url) {
+        const response = await api.get(url);
+        addComments(eventId, response.data.results);
+        url = response.data.next;
+      }
+    } catch (err) {
+      console.error("Error fetching new comments:", err);
+    }
+  };
+
+  const loadOlderComments = async (eventId) => {
+    const url = olderComments[eventId];
+    if (!url) return;
+    try {
+      const response = await api.get(url);
+      addComments(eventId, [], [...response.data.results].reverse());
+      setOlderComments(prev => ({ ...prev, [eventId]: response.data.next }));
+    } catch (err) {
+      console.error("Error loading older comments:", err);
+    }
+  };
+
   const handlePostComment = async (eventId) => {
     const commentText = newComment[eventId]?.trim();
     if (!commentText) return;
@@ -105,23 +192,62 @@ const EventView = () => {
     try {
       const response = await api.post(`/api/events/${eventId}/comments/`, {
         text: commentText,
-        event: eventId
+        event: eventId,
+        parent: replyTo[eventId]?.id ?? null,
       });
       
       // Add new comment to the list
-      setComments(prev => ({
-        ...prev,
-        [eventId]: [...(prev[eventId] || []), response.data]
-      }));
+      addComments(eventId, [response.data]);
       
       // Clear input
       setNewComment(prev => ({ ...prev, [eventId]: "" }));
+      setReplyTo(prev => ({ ...prev, [eventId]: null }));
     } catch (err) {
       console.error("Error posting comment:", err);
       alert("Failed to post comment");
     }
   };
 
+  const toggleReaction = async (eventId, comment, kind) => {
+    const reacted = comment.my_reactions.includes(kind);
+    const url = `/api/events/${eventId}/comments/${comment.id}/reactions/${kind}/`;
+    try {
+      const response = reacted ? await api.delete(url) : await api.post(url);
+      updateComment(eventId, comment.id, {
+        reaction_counts: response.data.reaction_counts,
+        my_reactions: reacted ? comment.my_reactions.filter(k => k !== kind) : [...comment.my_reactions, kind],
+      });
+    } catch (err) {
+      console.error("Error updating reaction:", err);
+    }
+  };
+
+  const renderComment = (eventId, comment) => (
+    <div key={comment.id} className="comment-item" style={{ marginLeft: comment.depth * 20 }}>
+      <div className="comment-header">
+        <strong>{comment.user_details.username}</strong>
+        <span className="comment-time">
+          {new Date(comment.created_at).toLocaleString()}
+        </span>
+      </div>
+      <p className="comment-text">{comment.text}</p>
+      <div className="comment-actions">
+        {REACTIONS.map(([kind, emoji]) => (
+          <button
+            key={kind}
+            className={`reaction-btn ${comment.my_reactions.includes(kind) ? "active" : ""}`}
+            onClick={() => toggleReaction(eventId, comment, kind)}
+          >
+            {emoji} {comment.reaction_counts[kind] || ""}
+          </button>
+        ))}
+        <button className="reply-btn" onClick={() => setReplyTo(prev => ({ ...prev, [eventId]: comment }))}>
+          Reply
+        </button>
+      </div>
+    </div>
+  );
+
   const toggleExpand = (eventId, isHost, hasJoined) => {
     // Only allow expansion if user is host or participant
     if (!isHost && !hasJoined) {
@@ -132,18 +258,10 @@ const EventView = () => {
       setExpandedEventId(null);
     } else {
       setExpandedEventId(eventId);
-      // Fetch comments when expanding
+      // Fetch comments when expanding; the effect below polls for new ones
       if (!comments[eventId]) {
         fetchComments(eventId);
       }
-      // Set up polling for real-time updates
-      const interval = setInterval(() => {
-        if (expandedEventId === eventId) {
-          fetchComments(eventId);
-        }
-      }, 5000); // Poll every 5 seconds
-      
-      return () => clearInterval(interval);
     }
   };
 
@@ -164,7 +282,7 @@ const EventView = () => {
   useEffect(() => {
     if (expandedEventId) {
       const interval = setInterval(() => {
-        fetchComments(expandedEventId);
+        fetchNewComments(expandedEventId);
       }, 5000);
       
       return () => clearInterval(interval);
@@ -344,6 +462,12 @@ const EventView = () => {
                 <p>🕒 End: {new Date(event.end_time).toLocaleString()}</p>
                 <p>👤 Host: {event.host_details?.username || "Unknown"}</p>
                 <p>👥 Participants: {event.participant_list?.length || 0} / {event.max_capacity}</p>
+                <p>💬 Comments: {event.comment_count || 0}</p>
+                {event.latest_comment && (
+                  <p className="latest-comment">
+                    <b>{event.latest_comment.username}:</b> {event.latest_comment.text}
+                  </p>
+                )}
                 <p>{event.details}</p>
 
                 {event.location_details?.latitude && event.location_details?.longitude && (
@@ -410,19 +534,19 @@ const EventView = () => {
                   <div className="comments-section">
                     <h3>Comments</h3>
                     <div className="comments-list">
+                      {olderComments[event.id] && (
+                        <button className="load-older-comments" onClick={() => loadOlderComments(event.id)}>
+                          Load older comments
+                        </button>
+                      )}
                       {loadingComments[event.id] && eventComments.length === 0 ? (
                         <p className="loading-comments">Loading comments...</p>
                       ) : eventComments.length > 0 ? (
                         eventComments.map(comment => (
-                          <div key={comment.id} className="comment-item">
-                            <div className="comment-header">
-                              <strong>{comment.user_details.username}</strong>
-                              <span className="comment-time">
-                                {new Date(comment.created_at).toLocaleString()}
-                              </span>
-                            </div>
-                            <p className="comment-text">{comment.text}</p>
-                          </div>
+                          <React.Fragment key={comment.id}>
+                            {renderComment(event.id, comment)}
+                            {comment.replies.map(reply => renderComment(event.id, reply))}
+                          </React.Fragment>
                         ))
                       ) : (
                         <p className="no-comments">No comments yet. Be the first to comment!</p>
@@ -430,6 +554,12 @@ const EventView = () => {
                     </div>
 
                     <div className="comment-input-section">
+                      {replyTo[event.id] && (
+                        <p className="replying-to">
+                          Replying to <b>{replyTo[event.id].user_details.username}</b>
+                          <button onClick={() => setReplyTo(prev => ({ ...prev, [event.id]: null }))}>Cancel</button>
+                        </p>
+                      )}
                       <textarea
                         className="comment-input"
                         placeholder="Write a comment..."